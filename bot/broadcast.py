@@ -0,0 +1,210 @@
+"""
+Рассылка сообщений в Telegram с ограничением скорости
+Параллельные отправители, общий лимит на бота и пауза между сообщениями в один чат
+"""
+
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from datetime import timedelta
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional
+
+from telegram.error import BadRequest, Forbidden, RetryAfter, TelegramError
+
+logger = logging.getLogger(__name__)
+
+# Отправка одного элемента рассылки в чат
+SendFunc = Callable[[int, Any], Awaitable[None]]
+# Обработка чата, который заблокировал бота
+BlockedFunc = Callable[[int], Awaitable[None]]
+
+
+class TokenBucket:
+    """Общий лимит сообщений в секунду; RetryAfter приостанавливает всю отправку"""
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def pause(self, seconds: float):
+        """Пауза для всех отправителей (ответ 429 от Telegram)"""
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    async def acquire(self):
+        """Ожидание свободного токена (в порядке очереди)"""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    await asyncio.sleep(self.paused_until - now)
+                    continue
+
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class BroadcastStats:
+    """Итоги рассылки"""
+
+    def __init__(self):
+        self.sent = 0
+        self.failed = 0
+        self.blocked = 0
+        self.skipped = 0
+        self.rate_limited = 0
+        self.retried = 0
+        self.started_at = time.monotonic()
+        self.duration = 0.0
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "sent": self.sent,
+            "failed": self.failed,
+            "blocked": self.blocked,
+            "skipped": self.skipped,
+            "rate_limited": self.rate_limited,
+            "retried": self.retried,
+            "duration": round(self.duration, 1),
+        }
+
+
+class _ChatQueue:
+    """Очередь сообщений одного чата"""
+
+    def __init__(self, chat_id: int, items: List[Any]):
+        self.chat_id = chat_id
+        self.items = items
+        self.position = 0
+        self.attempt = 0
+
+
+def _seconds(value) -> float:
+    """retry_after может быть числом или timedelta (в зависимости от версии PTB)"""
+    if isinstance(value, timedelta):
+        return value.total_seconds()
+    return float(value)
+
+
+class Broadcaster:
+    """Рассылка набора элементов по списку чатов.
+
+    Сообщения разных чатов чередуются: чат возвращается в очередь не раньше,
+    чем через chat_interval секунд после предыдущего сообщения ему.
+    """
+
+    def __init__(self, send: SendFunc, rate: float = 28, workers: int = 8,
+                 chat_interval: float = 1.0, max_retries: int = 3,
+                 backoff: float = 1.0, on_blocked: Optional[BlockedFunc] = None):
+        self.send = send
+        self.bucket = TokenBucket(rate)
+        self.workers = workers
+        self.chat_interval = chat_interval
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.on_blocked = on_blocked
+
+    async def run(self, chat_ids: Iterable[int], items: List[Any]) -> BroadcastStats:
+        """Отправка всех items в каждый чат; возвращает итоги"""
+        stats = BroadcastStats()
+        # Очередь по времени готовности чата: (ready_at, порядковый номер, чат)
+        heap = []
+        counter = itertools.count()
+        now = time.monotonic()
+        for chat_id in chat_ids:
+            heapq.heappush(heap, (now, next(counter), _ChatQueue(chat_id, items)))
+
+        if not heap or not items:
+            return stats
+
+        # Количество чатов, у которых ещё есть неотправленные сообщения
+        pending = len(heap)
+        changed = asyncio.Condition()
+
+        async def worker():
+            nonlocal pending
+            while True:
+                async with changed:
+                    while not heap and pending:
+                        await changed.wait()
+                    if not pending:
+                        return
+                    ready_at, _, chat = heapq.heappop(heap)
+
+                delay = ready_at - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+
+                next_ready = await self._deliver(chat, stats)
+
+                async with changed:
+                    if next_ready is None:
+                        pending -= 1
+                    else:
+                        heapq.heappush(heap, (next_ready, next(counter), chat))
+                    changed.notify_all()
+
+        await asyncio.gather(*(worker() for _ in range(min(self.workers, pending))))
+
+        stats.duration = time.monotonic() - stats.started_at
+        logger.info(f"📨 Рассылка завершена: {stats.as_dict()}")
+        return stats
+
+    async def _deliver(self, chat: _ChatQueue, stats: BroadcastStats) -> Optional[float]:
+        """Отправка очередного сообщения чата.
+        Возвращает время, когда чат можно обработать снова, или None, если он закончен"""
+        await self.bucket.acquire()
+        try:
+            await self.send(chat.chat_id, chat.items[chat.position])
+        except RetryAfter as e:
+            # Лимит превышен - останавливаем всех и повторяем это же сообщение
+            retry_after = _seconds(e.retry_after)
+            stats.rate_limited += 1
+            self.bucket.pause(retry_after)
+            logger.warning(f"Telegram просит подождать {retry_after} с (чат {chat.chat_id})")
+            return time.monotonic() + retry_after
+        except Forbidden as e:
+            # Пользователь заблокировал бота - остальные сообщения ему не отправляем
+            stats.blocked += 1
+            stats.skipped += len(chat.items) - chat.position - 1
+            logger.info(f"Чат {chat.chat_id} недоступен: {e}")
+            if self.on_blocked is not None:
+                try:
+                    await self.on_blocked(chat.chat_id)
+                except Exception as blocked_error:
+                    logger.error(f"Ошибка отметки заблокированного чата {chat.chat_id}: {blocked_error}")
+            return None
+        except BadRequest as e:
+            # Ошибка в самом сообщении - повтор не поможет
+            stats.failed += 1
+            logger.error(f"Сообщение в чат {chat.chat_id} отклонено: {e}")
+        except TelegramError as e:
+            # Сетевые ошибки и таймауты - повтор с экспоненциальной задержкой
+            if chat.attempt < self.max_retries:
+                delay = self.backoff * 2 ** chat.attempt
+                chat.attempt += 1
+                stats.retried += 1
+                logger.warning(f"Повтор отправки в чат {chat.chat_id} через {delay} с: {e}")
+                return time.monotonic() + delay
+            stats.failed += 1
+            logger.error(f"Не удалось отправить сообщение в чат {chat.chat_id}: {e}")
+        except Exception as e:
+            stats.failed += 1
+            logger.error(f"Ошибка отправки сообщения в чат {chat.chat_id}: {e}")
+        else:
+            stats.sent += 1
+
+        chat.position += 1
+        chat.attempt = 0
+        if chat.position >= len(chat.items):
+            return None
+        return time.monotonic() + self.chat_interval
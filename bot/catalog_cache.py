@@ -0,0 +1,51 @@
+"""
+Кэш отрисованных экранов каталога в Telegram боте
+Хранит готовый текст и клавиатуру списка категорий и первой страницы категории.
+Записи живут ttl секунд и сбрасываются по уведомлению catalog_changed из БД
+"""
+
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class CatalogCache:
+    """Экраны каталога: ключ -> (текст, клавиатура)"""
+
+    def __init__(self, ttl: float = 300.0):
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data: Dict[Hashable, tuple] = {}
+        # Номер поколения растёт при каждом сбросе: экран, собранный
+        # до сброса, не должен попасть в кэш после него
+        self._generation = 0
+
+    async def get_or_build(self, key: Hashable, builder: Callable[[], Awaitable[Any]]) -> Any:
+        """Экран из кэша или построение через builder при промахе"""
+        item = self._data.get(key)
+        if item is not None and item[0] > time.monotonic():
+            self.hits += 1
+            return item[1]
+
+        self.misses += 1
+        generation = self._generation
+        value = await builder()
+        if generation == self._generation:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+        return value
+
+    def invalidate(self, kind: Optional[str] = None):
+        """Сброс всех экранов или только экранов одного вида (первый элемент ключа)"""
+        self._generation += 1
+        if kind is None:
+            self._data.clear()
+        else:
+            for key in [key for key in self._data if key[0] == kind]:
+                del self._data[key]
+        logger.debug(f"Кэш каталога сброшен: {kind or 'всё'}")
+
+    def stats(self) -> Dict[str, Any]:
+        return {"size": len(self._data), "ttl": self.ttl, "hits": self.hits, "misses": self.misses}
@@ -0,0 +1,138 @@
+"""
+Кэш file_id фотографий товаров в Telegram
+После первой загрузки по URL Telegram возвращает file_id - повторные отправки
+используют его и не заставляют Telegram заново скачивать изображение
+"""
+
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from telegram import Message
+from telegram.error import BadRequest
+
+logger = logging.getLogger(__name__)
+
+# Отправка фото: принимает photo=<URL или file_id> и остальные параметры сообщения
+SendPhotoFunc = Callable[..., Awaitable[Message]]
+
+# Фрагменты текста BadRequest, означающие, что Telegram не принял сам file_id
+# ("Wrong file identifier/HTTP URL specified", "wrong remote file identifier ...").
+# Остальные ошибки (подпись, parse_mode) к file_id не относятся
+FILE_ID_ERRORS = ("file identifier", "file_id", "file reference")
+
+
+def is_file_id_error(error: BadRequest) -> bool:
+    """Отклонён ли именно file_id"""
+    message = str(error.message).lower()
+    return any(fragment in message for fragment in FILE_ID_ERRORS)
+
+
+class PhotoCache:
+    """file_id по (товар, URL изображения): память процесса + таблица telegram_photo_cache.
+    Смена image_url у товара даёт промах - фото загружается заново и запись заменяется"""
+
+    def __init__(self, maxsize: int = 5000):
+        self.db_pool = None
+        self.maxsize = maxsize
+        self._memory: "OrderedDict[int, Tuple[str, str]]" = OrderedDict()
+        # Блокировки загрузки по товарам: (блокировка, число ожидающих);
+        # запись удаляется, когда загрузку больше никто не ждёт
+        self._locks: Dict[int, Tuple[asyncio.Lock, int]] = {}
+        self.hits = 0
+        self.uploads = 0
+
+    async def init_db(self, db_pool):
+        """Подключение к пулу бота и создание таблицы"""
+        self.db_pool = db_pool
+        async with self.db_pool.acquire() as conn:
+            await conn.execute("""
+                CREATE TABLE IF NOT EXISTS telegram_photo_cache (
+                    product_id INTEGER PRIMARY KEY REFERENCES products(id) ON DELETE CASCADE,
+                    image_url VARCHAR(500) NOT NULL,
+                    file_id VARCHAR(255) NOT NULL,
+                    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+                )
+            """)
+
+    def _remember(self, product_id: int, image_url: str, file_id: str):
+        self._memory[product_id] = (image_url, file_id)
+        self._memory.move_to_end(product_id)
+        while len(self._memory) > self.maxsize:
+            self._memory.popitem(last=False)
+
+    async def get(self, product_id: int, image_url: str) -> Optional[str]:
+        """file_id для текущего URL изображения товара"""
+        cached = self._memory.get(product_id)
+        if cached is not None and cached[0] == image_url:
+            self._memory.move_to_end(product_id)
+            return cached[1]
+
+        async with self.db_pool.acquire() as conn:
+            file_id = await conn.fetchval("""
+                SELECT file_id FROM telegram_photo_cache
+                WHERE product_id = $1 AND image_url = $2
+            """, product_id, image_url)
+        if file_id:
+            self._remember(product_id, image_url, file_id)
+        return file_id
+
+    async def store(self, product_id: int, image_url: str, file_id: str):
+        """Сохранение file_id (заменяет запись для прежнего URL)"""
+        self._remember(product_id, image_url, file_id)
+        async with self.db_pool.acquire() as conn:
+            await conn.execute("""
+                INSERT INTO telegram_photo_cache (product_id, image_url, file_id)
+                VALUES ($1, $2, $3)
+                ON CONFLICT (product_id) DO UPDATE SET
+                    image_url = EXCLUDED.image_url,
+                    file_id = EXCLUDED.file_id,
+                    created_at = NOW()
+            """, product_id, image_url, file_id)
+
+    async def invalidate(self, product_id: int):
+        """Удаление записи (file_id больше не принимается Telegram)"""
+        self._memory.pop(product_id, None)
+        async with self.db_pool.acquire() as conn:
+            await conn.execute("DELETE FROM telegram_photo_cache WHERE product_id = $1", product_id)
+
+    async def send_photo(self, send: SendPhotoFunc, product_id: int, image_url: str, **kwargs: Any) -> Message:
+        """Отправка фото товара через send с повторным использованием file_id"""
+        file_id = await self.get(product_id, image_url)
+        if file_id:
+            try:
+                message = await send(photo=file_id, **kwargs)
+                self.hits += 1
+                return message
+            except BadRequest as e:
+                if not is_file_id_error(e):
+                    raise
+                logger.warning(f"file_id фото товара {product_id} отклонён, загружаем заново: {e}")
+                await self.invalidate(product_id)
+
+        # Загрузка по URL - одна на товар: параллельные отправки (рассылка)
+        # ждут её и используют полученный file_id
+        lock, waiters = self._locks.get(product_id, (None, 0))
+        if lock is None:
+            lock = asyncio.Lock()
+        self._locks[product_id] = (lock, waiters + 1)
+        try:
+            async with lock:
+                file_id = await self.get(product_id, image_url)
+                if file_id:
+                    self.hits += 1
+                    return await send(photo=file_id, **kwargs)
+
+                message = await send(photo=image_url, **kwargs)
+                self.uploads += 1
+                if message and message.photo:
+                    # Последний размер - исходное (самое крупное) изображение
+                    await self.store(product_id, image_url, message.photo[-1].file_id)
+                return message
+        finally:
+            lock, waiters = self._locks[product_id]
+            if waiters > 1:
+                self._locks[product_id] = (lock, waiters - 1)
+            else:
+                del self._locks[product_id]
@@ -0,0 +1,188 @@
+"""
+Хранилище сессий Telegram бота
+LRU-кэш в памяти процесса с коротким временем жизни перед постоянным хранилищем:
+PostgreSQL (несколько экземпляров бота) или SQLite (один узел)
+"""
+
+import asyncio
+import json
+import logging
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Маркер отсутствия записи в кэше (None кэшируется как «сессии нет»)
+_MISSING = object()
+
+
+class SessionBackend(ABC):
+    """Постоянное хранилище сессий.
+    Бэкенд без get/set/delete не создаётся (TypeError при создании экземпляра)"""
+
+    async def init(self):
+        pass
+
+    @abstractmethod
+    async def get(self, telegram_id: int) -> Optional[Dict[str, Any]]:
+        """Сессия пользователя или None"""
+
+    @abstractmethod
+    async def set(self, telegram_id: int, data: Dict[str, Any]):
+        """Сохранение сессии"""
+
+    @abstractmethod
+    async def delete(self, telegram_id: int):
+        """Удаление сессии"""
+
+    async def close(self):
+        pass
+
+
+class PostgresSessionBackend(SessionBackend):
+    """Сессии в таблице bot_sessions общей базы данных"""
+
+    def __init__(self, db_pool):
+        self.db_pool = db_pool
+
+    async def init(self):
+        async with self.db_pool.acquire() as conn:
+            await conn.execute("""
+                CREATE TABLE IF NOT EXISTS bot_sessions (
+                    telegram_id BIGINT PRIMARY KEY,
+                    data JSONB NOT NULL,
+                    updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+                )
+            """)
+
+    async def get(self, telegram_id: int) -> Optional[Dict[str, Any]]:
+        async with self.db_pool.acquire() as conn:
+            data = await conn.fetchval("SELECT data FROM bot_sessions WHERE telegram_id = $1", telegram_id)
+        return json.loads(data) if data is not None else None
+
+    async def set(self, telegram_id: int, data: Dict[str, Any]):
+        async with self.db_pool.acquire() as conn:
+            await conn.execute("""
+                INSERT INTO bot_sessions (telegram_id, data, updated_at) VALUES ($1, $2::jsonb, NOW())
+                ON CONFLICT (telegram_id) DO UPDATE SET data = EXCLUDED.data, updated_at = NOW()
+            """, telegram_id, json.dumps(data, ensure_ascii=False))
+
+    async def delete(self, telegram_id: int):
+        async with self.db_pool.acquire() as conn:
+            await conn.execute("DELETE FROM bot_sessions WHERE telegram_id = $1", telegram_id)
+
+
+class SQLiteSessionBackend(SessionBackend):
+    """Сессии в локальном файле SQLite (только для одного экземпляра бота)"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._connection: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    def _execute(self, query: str, params: tuple = ()):
+        with self._lock:
+            cursor = self._connection.execute(query, params)
+            row = cursor.fetchone()
+            self._connection.commit()
+            return row
+
+    async def init(self):
+        self._connection = sqlite3.connect(self.path, check_same_thread=False)
+        await asyncio.to_thread(self._execute, """
+            CREATE TABLE IF NOT EXISTS bot_sessions (
+                telegram_id INTEGER PRIMARY KEY,
+                data TEXT NOT NULL,
+                updated_at REAL NOT NULL
+            )
+        """)
+
+    async def get(self, telegram_id: int) -> Optional[Dict[str, Any]]:
+        row = await asyncio.to_thread(
+            self._execute, "SELECT data FROM bot_sessions WHERE telegram_id = ?", (telegram_id,)
+        )
+        return json.loads(row[0]) if row else None
+
+    async def set(self, telegram_id: int, data: Dict[str, Any]):
+        await asyncio.to_thread(self._execute, """
+            INSERT INTO bot_sessions (telegram_id, data, updated_at) VALUES (?, ?, ?)
+            ON CONFLICT (telegram_id) DO UPDATE SET data = excluded.data, updated_at = excluded.updated_at
+        """, (telegram_id, json.dumps(data, ensure_ascii=False), time.time()))
+
+    async def delete(self, telegram_id: int):
+        await asyncio.to_thread(self._execute, "DELETE FROM bot_sessions WHERE telegram_id = ?", (telegram_id,))
+
+    async def close(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+
+class SessionStore:
+    """Сессии пользователей: LRU с TTL в памяти перед постоянным хранилищем.
+    Короткий TTL ограничивает время, за которое изменения с другого экземпляра
+    бота (вход, выход) становятся видны этому"""
+
+    def __init__(self, backend: SessionBackend, maxsize: int = 10000, ttl: float = 30.0):
+        self.backend = backend
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._cache: "OrderedDict[int, tuple]" = OrderedDict()
+
+    def _remember(self, telegram_id: int, data: Optional[Dict[str, Any]]):
+        self._cache[telegram_id] = (time.monotonic() + self.ttl, data)
+        self._cache.move_to_end(telegram_id)
+        while len(self._cache) > self.maxsize:
+            self._cache.popitem(last=False)
+
+    async def init(self):
+        await self.backend.init()
+
+    async def get(self, telegram_id: int) -> Optional[Dict[str, Any]]:
+        """Сессия пользователя или None"""
+        item = self._cache.get(telegram_id, _MISSING)
+        if item is not _MISSING:
+            expires_at, data = item
+            if expires_at > time.monotonic():
+                self._cache.move_to_end(telegram_id)
+                return data
+            del self._cache[telegram_id]
+
+        data = await self.backend.get(telegram_id)
+        self._remember(telegram_id, data)
+        return data
+
+    async def set(self, telegram_id: int, data: Dict[str, Any]):
+        """Сохранение сессии"""
+        await self.backend.set(telegram_id, data)
+        self._remember(telegram_id, data)
+
+    async def delete(self, telegram_id: int):
+        """Удаление сессии (выход)"""
+        await self.backend.delete(telegram_id)
+        self._remember(telegram_id, None)
+
+    async def is_authenticated(self, telegram_id: int) -> bool:
+        session = await self.get(telegram_id)
+        return bool(session and session.get('authenticated', False))
+
+    async def close(self):
+        self._cache.clear()
+        await self.backend.close()
+
+
+def create_session_store(backend: str, db_pool=None, sqlite_path: str = "bot_sessions.db",
+                         maxsize: int = 10000, ttl: float = 30.0) -> SessionStore:
+    """Создание хранилища сессий по имени бэкенда: postgres или sqlite"""
+    if backend == "sqlite":
+        session_backend = SQLiteSessionBackend(sqlite_path)
+    elif backend == "postgres":
+        session_backend = PostgresSessionBackend(db_pool)
+    else:
+        raise ValueError(f"Неизвестное хранилище сессий: {backend}")
+    logger.info(f"🗂️ Хранилище сессий бота: {backend}")
+    return SessionStore(session_backend, maxsize=maxsize, ttl=ttl)
@@ -4,14 +4,14 @@ Telegram бот для магазина Rukami
 """
 
 import asyncio
+import json
 import logging
-from typing import Optional, Dict, Any
-import os
-from datetime import datetime
-import hashlib
+from collections import deque
+from typing import Optional, Deque, Set
 import re
 
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.error import Forbidden, RetryAfter, TelegramError
 from telegram.ext import (
     Application,
     CommandHandler,
@@ -22,10 +22,16 @@ from telegram.ext import (
     ConversationHandler
 )
 import asyncpg
-from dotenv import load_dotenv
 
-# Загружаем переменные окружения
-load_dotenv()
+from bot.broadcast import Broadcaster
+from bot.catalog_cache import CatalogCache
+from bot.photo_cache import PhotoCache
+from bot.session_store import create_session_store
+from bot.update_queue import BOT_UPDATES_CHANNEL, WORKER_APPLICATION_NAME, UpdateQueue
+from server.config import settings
+from server.database import db_connection, query_trace, repository
+from server.database.db_connection import CATALOG_CHANNEL, NEW_PRODUCTS_CHANNEL
+from server.passwords import hash_password, verify_and_update
 
 # Настройка логирования
 logging.basicConfig(
@@ -38,96 +44,126 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Ключ advisory-блокировки: рассылку ведёт только один экземпляр бота
+NOTIFICATIONS_LOCK_KEY = 7301
+# Ключ водяного знака рассылки в таблице bot_state
+LAST_NOTIFIED_PRODUCT_KEY = 'last_notified_product_id'
+
 # Состояния для ConversationHandler
 REGISTRATION_NAME, REGISTRATION_EMAIL, REGISTRATION_PHONE, REGISTRATION_PASSWORD = range(4)
 LOGIN_EMAIL, LOGIN_PASSWORD = range(4, 6)
 
 
+class TracedApplication(Application):
+    """Приложение PTB с трассировкой SQL на каждое обновление"""
+
+    async def process_update(self, update: object) -> None:
+        if isinstance(update, Update):
+            kind = "callback" if update.callback_query else "message" if update.message else "update"
+            label = f"bot {kind} {update.update_id}"
+        else:
+            label = f"bot {type(update).__name__}"
+        async with query_trace.traced(label):
+            await super().process_update(update)
+
+
 class RukamiBot:
     def __init__(self):
-        self.bot_token = os.getenv('BOT_TOKEN')
+        self.bot_token = settings.bot_token
         self.db_pool = None
+        # Пул создан ботом (при работе внутри сервера используется пул сервера)
+        self.owns_db_pool = False
         self.application = None
 
-        # Настройки БД из config.py
-        self.db_user = os.getenv('DB_USER', 'postgres')
-        self.db_password = os.getenv('DB_PASSWORD', 'postgres')
-        self.db_host = os.getenv('DB_HOST', 'localhost')
-        self.db_port = os.getenv('DB_PORT', '5432')
-        self.db_name = os.getenv('DB_NAME', 'rukami_db')
+        # file_id загруженных в Telegram фото товаров
+        self.photo_cache = PhotoCache()
 
-        # Временное хранилище данных пользователей
-        self.user_sessions: Dict[int, Dict[str, Any]] = {}
+        # Отрисованные экраны каталога (список категорий, первая страница категории)
+        self.catalog_cache = CatalogCache(ttl=settings.bot_catalog_cache_ttl)
 
-        self.notification_task = None
-        self.last_product_check = None
-
-    @property
-    def database_url(self) -> str:
-        """URL подключения к базе данных"""
-        return f"postgresql://{self.db_user}:{self.db_password}@{self.db_host}:{self.db_port}/{self.db_name}"
+        # Сессии пользователей: кэш в памяти перед постоянным хранилищем
+        # (postgres - для нескольких экземпляров бота, sqlite - для одного узла)
+        self.sessions = None
 
-    async def init_db(self):
-        """Инициализация подключения к БД"""
+        self.notification_task = None
+        self.listener_task = None
+        self.updates_task = None
+
+        # Режим вебхука: обновления с любого процесса сервера попадают в очередь
+        # bot_updates, разделённую по чатам; раздел обрабатывает один воркер,
+        # и шаги диалога (ConversationHandler, user_data) не расходятся по процессам
+        self.webhook_mode = False
+        self.update_queue: Optional[UpdateQueue] = None
+
+        # Последний товар, о котором уже разосланы уведомления (хранится в bot_state)
+        self.last_notified_product_id: Optional[int] = None
+        # id из уведомлений, которые ещё не обработаны
+        self.notified_product_ids: Set[int] = set()
+        # Недавно разосланные товары - защита от повторной отправки
+        self.recent_notified_ids: Deque[int] = deque(maxlen=1000)
+        self.products_wakeup = asyncio.Event()
+
+        # Параметры рассылки: общий лимит Telegram ~30 сообщений в секунду,
+        # в один чат - не чаще сообщения в секунду
+        self.broadcast_rate = settings.broadcast_rate
+        self.broadcast_workers = settings.broadcast_workers
+        self.broadcast_chat_interval = settings.broadcast_chat_interval
+        self.broadcast_group_threshold = settings.broadcast_group_threshold
+        self.last_broadcast_stats = None
+
+    async def init_db(self, db_pool=None):
+        """Инициализация подключения к БД.
+        Внутри сервера используется его пул; отдельный процесс бота создаёт пул
+        с той же политикой и теми же подготовленными запросами (схему создаёт сервер)"""
         try:
-            self.db_pool = await asyncpg.create_pool(
-                self.database_url,
-                min_size=1,
-                max_size=5,
-                command_timeout=60
-            )
+            if db_pool is not None:
+                self.db_pool = db_pool
+                self.owns_db_pool = False
+            else:
+                await db_connection.init_database(create_schema=False)
+                self.db_pool = db_connection.db_pool
+                self.owns_db_pool = True
             logger.info("✅ Подключение к БД установлено")
 
-            # Добавляем поле telegram_id в таблицу users если его нет
-            await self.add_telegram_id_field()
+            await self.create_bot_tables()
+
+            self.update_queue = UpdateQueue(self.db_pool, settings.bot_update_partitions)
+            await self.update_queue.create_table()
+
+            await self.photo_cache.init_db(self.db_pool)
+
+            self.sessions = create_session_store(
+                settings.bot_session_backend,
+                db_pool=self.db_pool,
+                sqlite_path=settings.bot_session_sqlite_path,
+                ttl=settings.bot_session_cache_ttl
+            )
+            await self.sessions.init()
 
         except Exception as e:
             logger.error(f"❌ Ошибка подключения к БД: {e}")
             raise
 
-    async def add_telegram_id_field(self):
-        """Добавление поля telegram_id и notifications_enabled в таблицу users"""
-        try:
-            async with self.db_pool.acquire() as conn:
-                # Проверяем, существует ли поле telegram_id
-                result = await conn.fetchval("""
-                    SELECT column_name FROM information_schema.columns 
-                    WHERE table_name = 'users' AND column_name = 'telegram_id'
-                """)
-
-                if not result:
-                    await conn.execute("""
-                        ALTER TABLE users 
-                        ADD COLUMN telegram_id BIGINT UNIQUE
-                    """)
-                    logger.info("✅ Поле telegram_id добавлено в таблицу users")
-
-                # Проверяем, существует ли поле notifications_enabled
-                result = await conn.fetchval("""
-                    SELECT column_name FROM information_schema.columns 
-                    WHERE table_name = 'users' AND column_name = 'notifications_enabled'
-                """)
-
-                if not result:
-                    await conn.execute("""
-                        ALTER TABLE users 
-                        ADD COLUMN notifications_enabled BOOLEAN DEFAULT true
-                    """)
-                    logger.info("✅ Поле notifications_enabled добавлено в таблицу users")
-
-        except Exception as e:
-            logger.error(f"❌ Ошибка при добавлении полей в таблицу users: {e}")
+    async def create_bot_tables(self):
+        """Создание служебных таблиц бота"""
+        async with self.db_pool.acquire() as conn:
+            # Состояние бота между перезапусками (водяной знак рассылки)
+            await conn.execute("""
+                CREATE TABLE IF NOT EXISTS bot_state (
+                    key VARCHAR(100) PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+                )
+            """)
 
     async def close_db(self):
         """Закрытие подключения к БД"""
-        if self.db_pool:
-            await self.db_pool.close()
+        if self.sessions:
+            await self.sessions.close()
+        if self.db_pool and self.owns_db_pool:
+            await db_connection.close_database_pool()
             logger.info("✅ Подключение к БД закрыто")
 
-    def hash_password(self, password: str) -> str:
-        """Хеширование пароля"""
-        return hashlib.sha256(password.encode()).hexdigest()
-
     def validate_email(self, email: str) -> bool:
         """Валидация email"""
         pattern = r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$'
@@ -140,93 +176,61 @@ class RukamiBot:
 
     async def get_user_by_telegram_id(self, telegram_id: int) -> Optional[dict]:
         """Получение пользователя по Telegram ID"""
-        async with self.db_pool.acquire() as conn:
-            return await conn.fetchrow(
-                "SELECT * FROM users WHERE telegram_id = $1",
-                telegram_id
-            )
+        return await repository.get_user_by_telegram_id(telegram_id)
 
     async def get_user_by_email(self, email: str) -> Optional[dict]:
         """Получение пользователя по email"""
-        async with self.db_pool.acquire() as conn:
-            return await conn.fetchrow(
-                "SELECT * FROM users WHERE email = $1",
-                email
-            )
+        return await repository.get_user_by_email(email)
 
-    async def create_user(self, name: str, email: str, phone: str, password: str, telegram_id: int) -> bool:
-        """Создание нового пользователя"""
+    async def create_user(self, name: str, email: str, phone: str, password: str, telegram_id: int) -> Optional[int]:
+        """Создание нового пользователя; возвращает id или None при ошибке"""
         try:
-            async with self.db_pool.acquire() as conn:
-                await conn.execute("""
-                    INSERT INTO users (name, email, phone, password_hash, telegram_id)
-                    VALUES ($1, $2, $3, $4, $5)
-                """, name, email, phone, self.hash_password(password), telegram_id)
-                return True
+            return await repository.create_user(name, email, await hash_password(password), phone=phone,
+                                                telegram_id=telegram_id)
         except Exception as e:
             logger.error(f"Ошибка создания пользователя: {e}")
-            return False
+            return None
 
     async def link_telegram_to_user(self, email: str, password: str, telegram_id: int) -> bool:
         """Привязка Telegram ID к существующему пользователю"""
         try:
-            async with self.db_pool.acquire() as conn:
-                user = await conn.fetchrow(
-                    "SELECT * FROM users WHERE email = $1 AND password_hash = $2",
-                    email, self.hash_password(password)
-                )
+            user = await repository.get_user_by_email(email)
 
-                if user:
-                    await conn.execute(
-                        "UPDATE users SET telegram_id = $1 WHERE id = $2",
-                        telegram_id, user['id']
-                    )
-                    return True
+            if not user:
+                return False
+
+            password_ok, new_hash = await verify_and_update(password, user['password_hash'])
+            if not password_ok:
                 return False
+            if new_hash:
+                await repository.update_password_hash(user['id'], new_hash)
+            await repository.link_telegram_account(user['id'], telegram_id)
+            return True
         except Exception as e:
             logger.error(f"Ошибка привязки Telegram: {e}")
             return False
 
     async def get_categories(self) -> list:
         """Получение всех активных категорий"""
-        async with self.db_pool.acquire() as conn:
-            return await conn.fetch(
-                "SELECT * FROM categories WHERE is_active = true ORDER BY sort_order, name"
-            )
+        return await repository.list_categories()
 
     async def get_products_by_category(self, category_id: int, limit: int = 10) -> list:
         """Получение товаров по категории"""
-        async with self.db_pool.acquire() as conn:
-            return await conn.fetch("""
-                SELECT p.*, c.name as category_name, u.name as seller_name 
-                FROM products p 
-                JOIN categories c ON p.category_id = c.id 
-                JOIN users u ON p.user_id = u.id 
-                WHERE p.category_id = $1 AND p.in_stock = true 
-                ORDER BY p.created_at DESC 
-                LIMIT $2
-            """, category_id, limit)
+        return await repository.list_category_products(category_id, limit)
 
     async def get_product_by_id(self, product_id: int) -> Optional[dict]:
         """Получение товара по ID"""
-        async with self.db_pool.acquire() as conn:
-            return await conn.fetchrow("""
-                SELECT p.*, c.name as category_name, u.name as seller_name, u.phone as seller_phone, u.email as seller_email
-                FROM products p 
-                JOIN categories c ON p.category_id = c.id 
-                JOIN users u ON p.user_id = u.id 
-                WHERE p.id = $1
-            """, product_id)
-
-    def is_user_authenticated(self, telegram_id: int) -> bool:
+        return await repository.get_product(product_id)
+
+    async def is_user_authenticated(self, telegram_id: int) -> bool:
         """Проверка авторизации пользователя"""
-        return telegram_id in self.user_sessions and self.user_sessions[telegram_id].get('authenticated', False)
+        return await self.sessions.is_authenticated(telegram_id)
 
     async def require_auth(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> bool:
         """Проверка авторизации с предложением войти"""
         telegram_id = update.effective_user.id
 
-        if not self.is_user_authenticated(telegram_id):
+        if not await self.is_user_authenticated(telegram_id):
             text = "🔒 Для использования этой функции необходимо авторизоваться."
             keyboard = [
                 [InlineKeyboardButton("🔑 Войти", callback_data="login")],
@@ -248,14 +252,18 @@ class RukamiBot:
         user = update.effective_user
         telegram_id = user.id
 
-        # Проверяем, есть ли пользователь в БД
-        db_user = await self.get_user_by_telegram_id(telegram_id)
-        if db_user:
-            self.user_sessions[telegram_id] = {
-                'authenticated': True,
-                'user_id': db_user['id'],
-                'user_name': db_user['name']
-            }
+        # Сессии нет - проверяем, привязан ли Telegram к пользователю в БД
+        if await self.sessions.get(telegram_id) is None:
+            db_user = await self.get_user_by_telegram_id(telegram_id)
+            if db_user:
+                await self.sessions.set(telegram_id, {
+                    'authenticated': True,
+                    'user_id': db_user['id'],
+                    'user_name': db_user['name']
+                })
+                # Пользователь снова написал боту - возвращаем его в рассылку
+                if db_user.get('bot_blocked_at'):
+                    await self.mark_telegram_user_blocked(telegram_id, blocked=False)
 
         welcome_text = f"""
 🌟 Добро пожаловать в Rukami, {user.first_name}!
@@ -276,7 +284,7 @@ Rukami - это маркетплейс уникальных товаров ру
             [InlineKeyboardButton("🛍️ Каталог товаров", callback_data="catalog")]
         ]
 
-        if self.is_user_authenticated(telegram_id):
+        if await self.is_user_authenticated(telegram_id):
             keyboard.extend([
                 [InlineKeyboardButton("❤️ Избранное", callback_data="favorites")],
                 [InlineKeyboardButton("🛒 Корзина", callback_data="cart")],
@@ -354,7 +362,7 @@ Rukami - это маркетплейс уникальных товаров ру
             return REGISTRATION_PASSWORD
 
         # Создаем пользователя
-        success = await self.create_user(
+        user_id = await self.create_user(
             context.user_data['registration_name'],
             context.user_data['registration_email'],
             context.user_data['registration_phone'],
@@ -362,12 +370,13 @@ Rukami - это маркетплейс уникальных товаров ру
             update.effective_user.id
         )
 
-        if success:
-            # Авторизуем пользователя
-            self.user_sessions[update.effective_user.id] = {
+        if user_id is not None:
+            # Авторизуем пользователя (сессия создаётся только для существующей записи)
+            await self.sessions.set(update.effective_user.id, {
                 'authenticated': True,
+                'user_id': user_id,
                 'user_name': context.user_data['registration_name']
-            }
+            })
 
             await update.message.reply_text(
                 "✅ Регистрация завершена!\n\nДобро пожаловать в Rukami! Используйте /start для начала работы."
@@ -413,11 +422,11 @@ Rukami - это маркетплейс уникальных товаров ру
 
         if success:
             user = await self.get_user_by_email(email)
-            self.user_sessions[update.effective_user.id] = {
+            await self.sessions.set(update.effective_user.id, {
                 'authenticated': True,
                 'user_id': user['id'],
                 'user_name': user['name']
-            }
+            })
 
             await update.message.reply_text(
                 f"✅ Авторизация успешна!\n\nДобро пожаловать, {user['name']}! Используйте /start для начала работы."
@@ -440,25 +449,13 @@ Rukami - это маркетплейс уникальных товаров ру
     async def catalog_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Показать каталог категорий"""
         try:
-            categories = await self.get_categories()
+            screen = await self.get_catalog_screen("◀️ Назад")
 
-            if not categories:
+            if not screen:
                 await update.message.reply_text("Пока что категории не добавлены.")
                 return
 
-            text = "🛍️ *Каталог товаров*\n\nВыберите категорию:"
-            keyboard = []
-
-            for category in categories:
-                callback_data = f"category_{category['id']}"
-                keyboard.append([InlineKeyboardButton(
-                    f"{category['name']}",
-                    callback_data=callback_data
-                )])
-
-            keyboard.append([InlineKeyboardButton("◀️ Назад", callback_data="main_menu")])
-            reply_markup = InlineKeyboardMarkup(keyboard)
-
+            text, reply_markup = screen
             await update.message.reply_text(
                 text,
                 parse_mode='Markdown',
@@ -546,7 +543,28 @@ Rukami - это маркетплейс уникальных товаров ру
     async def show_catalog(self, query):
         """Показать каталог категорий"""
         try:
+            screen = await self.get_catalog_screen("◀️ Главное меню")
+            if screen:
+                text, reply_markup = screen
+            else:
+                text = "🛍️ *Каталог товаров*\n\nВыберите категорию:"
+                reply_markup = InlineKeyboardMarkup(
+                    [[InlineKeyboardButton("◀️ Главное меню", callback_data="main_menu")]]
+                )
+
+            await self.safe_edit_message(query, text, reply_markup=reply_markup)
+
+        except Exception as e:
+            logger.error(f"Ошибка в show_catalog: {e}")
+            await self.safe_edit_message(query, "Произошла ошибка при загрузке каталога.")
+
+    async def get_catalog_screen(self, back_text: str):
+        """Текст и клавиатура списка категорий (None, если категорий нет)"""
+
+        async def build():
             categories = await self.get_categories()
+            if not categories:
+                return None
 
             text = "🛍️ *Каталог товаров*\n\nВыберите категорию:"
             keyboard = []
@@ -558,23 +576,20 @@ Rukami - это маркетплейс уникальных товаров ру
                     callback_data=callback_data
                 )])
 
-            keyboard.append([InlineKeyboardButton("◀️ Главное меню", callback_data="main_menu")])
-            reply_markup = InlineKeyboardMarkup(keyboard)
+            keyboard.append([InlineKeyboardButton(back_text, callback_data="main_menu")])
+            return text, InlineKeyboardMarkup(keyboard)
 
-            await self.safe_edit_message(query, text, reply_markup=reply_markup)
+        return await self.catalog_cache.get_or_build(("categories", back_text), build)
 
-        except Exception as e:
-            logger.error(f"Ошибка в show_catalog: {e}")
-            await self.safe_edit_message(query, "Произошла ошибка при загрузке каталога.")
+    async def get_category_screen(self, category_id: int):
+        """Текст и клавиатура первой страницы товаров категории"""
 
-    async def show_category_products(self, query, category_id: int):
-        """Показать товары категории"""
-        try:
+        async def build():
             products = await self.get_products_by_category(category_id)
 
             if not products:
                 text = "В этой категории пока нет товаров."
-                keyboard = [[InlineKeyboardButton("◀️ Назад к каталогу", callback_data="catalog")]]
+                keyboard = []
             else:
                 text = f"📦 *Товары в категории*\n\n"
                 keyboard = []
@@ -582,7 +597,7 @@ Rukami - это маркетплейс уникальных товаров ру
                 for product in products[:10]:  # Показываем максимум 10 товаров
                     text += f"• *{product['name']}*\n"
                     text += f"  💰 {product['price']} ₽\n"
-                    text += f"  👤 {product['seller_name']}\n\n"
+                    text += f"  👤 {product['author_name']}\n\n"
 
                     keyboard.append([InlineKeyboardButton(
                         f"👀 {product['name'][:30]}...",
@@ -590,8 +605,14 @@ Rukami - это маркетплейс уникальных товаров ру
                     )])
 
             keyboard.append([InlineKeyboardButton("◀️ Назад к каталогу", callback_data="catalog")])
-            reply_markup = InlineKeyboardMarkup(keyboard)
+            return text, InlineKeyboardMarkup(keyboard)
+
+        return await self.catalog_cache.get_or_build(("products", category_id), build)
 
+    async def show_category_products(self, query, category_id: int):
+        """Показать товары категории"""
+        try:
+            text, reply_markup = await self.get_category_screen(category_id)
             await self.safe_edit_message(query, text, reply_markup=reply_markup)
 
         except Exception as e:
@@ -611,10 +632,10 @@ Rukami - это маркетплейс уникальных товаров ру
             text += f"📝 {product['description']}\n\n"
             text += f"💰 *Цена:* {product['price']} ₽\n"
             text += f"📂 *Категория:* {product['category_name']}\n"
-            text += f"👤 *Продавец:* {product['seller_name']}\n"
+            text += f"👤 *Продавец:* {product['author_name']}\n"
 
-            if product['seller_phone']:
-                text += f"📞 *Контакт:* {product['seller_phone']}\n"
+            if product['author_phone']:
+                text += f"📞 *Контакт:* {product['author_phone']}\n"
 
             text += f"📅 *Добавлено:* {product['created_at'].strftime('%d.%m.%Y')}\n"
 
@@ -622,7 +643,7 @@ Rukami - это маркетплейс уникальных товаров ру
 
             # Кнопки в зависимости от авторизации
             telegram_id = query.from_user.id
-            if self.is_user_authenticated(telegram_id):
+            if await self.is_user_authenticated(telegram_id):
                 keyboard.extend([
                     [InlineKeyboardButton("🛒 Добавить в корзину", callback_data=f"add_to_cart_{product_id}")],
                     [InlineKeyboardButton("❤️ В избранное", callback_data=f"add_to_favorites_{product_id}")]
@@ -637,8 +658,10 @@ Rukami - это маркетплейс уникальных товаров ру
             if product['image_url']:
                 try:
                     # Отправляем изображение с подписью
-                    await query.message.reply_photo(
-                        photo=product['image_url'],
+                    await self.photo_cache.send_photo(
+                        query.message.reply_photo,
+                        product['id'],
+                        product['image_url'],
                         caption=text,
                         parse_mode='Markdown',
                         reply_markup=reply_markup
@@ -738,7 +761,7 @@ Rukami - это маркетплейс уникальных товаров ру
             [InlineKeyboardButton("🛍️ Каталог товаров", callback_data="catalog")]
         ]
 
-        if self.is_user_authenticated(telegram_id):
+        if await self.is_user_authenticated(telegram_id):
             keyboard.extend([
                 [InlineKeyboardButton("❤️ Избранное", callback_data="favorites")],
                 [InlineKeyboardButton("🛒 Корзина", callback_data="cart")],
@@ -762,158 +785,288 @@ Rukami - это маркетплейс уникальных товаров ру
     async def logout(self, query):
         """Выход из аккаунта"""
         telegram_id = query.from_user.id
-        if telegram_id in self.user_sessions:
-            del self.user_sessions[telegram_id]
+        await self.sessions.delete(telegram_id)
 
         await query.answer("👋 Вы вышли из аккаунта")
         await self.show_main_menu(query)
 
     async def get_all_telegram_users(self) -> list:
         """Получение всех пользователей с Telegram ID для рассылки (только с включенными уведомлениями)"""
+        return await repository.list_notification_recipients()
+
+    async def mark_telegram_user_blocked(self, telegram_id: int, blocked: bool = True):
+        """Отметка пользователя, заблокировавшего бота (или снятие отметки)"""
+        await repository.set_bot_blocked(telegram_id, blocked)
+        # Сессию сбрасываем, чтобы /start после разблокировки прошёл через БД
+        # и снял отметку
+        if blocked:
+            await self.sessions.delete(telegram_id)
+
+    async def get_new_products_after(self, product_id: int, late_ids: list, excluded_sellers: list = ()) -> list:
+        """Получение товаров после водяного знака и товаров из запоздавших уведомлений"""
+        return await repository.list_new_products(product_id, late_ids, excluded_sellers)
+
+    async def get_new_product_sellers(self, product_id: int, late_ids: list) -> list:
+        """Число тех же новых товаров по продавцам"""
+        return await repository.list_new_product_sellers(product_id, late_ids)
+
+    async def load_notification_watermark(self) -> int:
+        """Чтение водяного знака рассылки; при первом запуске - последний товар"""
         async with self.db_pool.acquire() as conn:
-            return await conn.fetch("""
-                SELECT telegram_id, name FROM users 
-                WHERE telegram_id IS NOT NULL 
-                AND (notifications_enabled IS NULL OR notifications_enabled = true)
-            """)
-
-    async def get_new_products_since(self, timestamp) -> list:
-        """Получение новых товаров с определенного времени"""
+            value = await conn.fetchval(
+                "SELECT value FROM bot_state WHERE key = $1", LAST_NOTIFIED_PRODUCT_KEY
+            )
+            if value is not None:
+                return int(value)
+
+            # Первый запуск: старые товары не рассылаем
+            last_id = await repository.get_last_product_id(connection=conn)
+            await self.save_notification_watermark(last_id, conn)
+            return last_id
+
+    async def save_notification_watermark(self, product_id: int, conn=None):
+        """Сохранение водяного знака рассылки"""
+        query = """
+            INSERT INTO bot_state (key, value, updated_at) VALUES ($1, $2, NOW())
+            ON CONFLICT (key) DO UPDATE SET value = EXCLUDED.value, updated_at = NOW()
+        """
+        if conn is not None:
+            await conn.execute(query, LAST_NOTIFIED_PRODUCT_KEY, str(product_id))
+            return
         async with self.db_pool.acquire() as conn:
-            query = """
-                SELECT p.*, c.name as category_name, u.name as seller_name 
-                FROM products p 
-                JOIN categories c ON p.category_id = c.id 
-                JOIN users u ON p.user_id = u.id 
-                WHERE p.created_at > $1 AND p.in_stock = true 
-                ORDER BY p.created_at DESC
-            """
-            return await conn.fetch(query, timestamp)
-
-    async def send_new_product_notification(self, product: dict, telegram_id: int):
-        """Отправка уведомления о новом товаре конкретному пользователю"""
-        try:
-            text = f"🆕 *Новый товар в Rukami!*\n\n"
-            text += f"🎨 *{product['name']}*\n\n"
-            text += f"📝 {product['description']}\n\n"
-            text += f"💰 *Цена:* {product['price']} ₽\n"
-            text += f"📂 *Категория:* {product['category_name']}\n"
-            text += f"👤 *Продавец:* {product['seller_name']}\n"
+            await conn.execute(query, LAST_NOTIFIED_PRODUCT_KEY, str(product_id))
+
+    async def send_new_product_notification(self, telegram_id: int, product: dict):
+        """Отправка уведомления о новом товаре конкретному пользователю.
+        Ошибки Telegram пробрасываются - их обрабатывает Broadcaster"""
+        text = f"🆕 *Новый товар в Rukami!*\n\n"
+        text += f"🎨 *{product['name']}*\n\n"
+        text += f"📝 {product['description']}\n\n"
+        text += f"💰 *Цена:* {product['price']} ₽\n"
+        text += f"📂 *Категория:* {product['category_name']}\n"
+        text += f"👤 *Продавец:* {product['author_name']}\n"
 
-            keyboard = [
-                [InlineKeyboardButton("👀 Посмотреть", callback_data=f"product_{product['id']}")],
-                [InlineKeyboardButton("🛍️ Каталог", callback_data="catalog")]
-            ]
-            reply_markup = InlineKeyboardMarkup(keyboard)
+        keyboard = [
+            [InlineKeyboardButton("👀 Посмотреть", callback_data=f"product_{product['id']}")],
+            [InlineKeyboardButton("🛍️ Каталог", callback_data="catalog")]
+        ]
+        reply_markup = InlineKeyboardMarkup(keyboard)
 
-            # Если есть изображение, отправляем с фото
-            if product['image_url']:
-                try:
-                    await self.application.bot.send_photo(
-                        chat_id=telegram_id,
-                        photo=product['image_url'],
-                        caption=text,
-                        parse_mode='Markdown',
-                        reply_markup=reply_markup
-                    )
-                except Exception as img_error:
-                    logger.error(f"Ошибка отправки изображения пользователю {telegram_id}: {img_error}")
-                    # Если изображение не отправилось, отправляем только текст
-                    await self.application.bot.send_message(
-                        chat_id=telegram_id,
-                        text=text + "\n\n⚠️ Изображение временно недоступно",
-                        parse_mode='Markdown',
-                        reply_markup=reply_markup
-                    )
-            else:
-                # Отправляем только текст
+        # Если есть изображение, отправляем с фото
+        if product['image_url']:
+            try:
+                await self.photo_cache.send_photo(
+                    self.application.bot.send_photo,
+                    product['id'],
+                    product['image_url'],
+                    chat_id=telegram_id,
+                    caption=text,
+                    parse_mode='Markdown',
+                    reply_markup=reply_markup
+                )
+            except (RetryAfter, Forbidden):
+                raise
+            except TelegramError as img_error:
+                logger.error(f"Ошибка отправки изображения пользователю {telegram_id}: {img_error}")
+                # Если изображение не отправилось, отправляем только текст
                 await self.application.bot.send_message(
                     chat_id=telegram_id,
-                    text=text,
+                    text=text + "\n\n⚠️ Изображение временно недоступно",
                     parse_mode='Markdown',
                     reply_markup=reply_markup
                 )
+        else:
+            # Отправляем только текст
+            await self.application.bot.send_message(
+                chat_id=telegram_id,
+                text=text,
+                parse_mode='Markdown',
+                reply_markup=reply_markup
+            )
 
-        except Exception as e:
-            logger.error(f"Ошибка отправки уведомления пользователю {telegram_id}: {e}")
+    async def send_new_products_summary(self, telegram_id: int, seller: dict):
+        """Одно уведомление о пачке новых товаров продавца (например, после импорта)"""
+        text = f"🆕 *Новые товары в Rukami!*\n\n"
+        text += f"👤 *Продавец:* {seller['author_name']}\n"
+        text += f"📦 Добавлено товаров: {seller['products_count']}\n"
+
+        keyboard = [
+            [InlineKeyboardButton("👀 Последний товар", callback_data=f"product_{seller['last_id']}")],
+            [InlineKeyboardButton("🛍️ Каталог", callback_data="catalog")]
+        ]
+        await self.application.bot.send_message(
+            chat_id=telegram_id,
+            text=text,
+            parse_mode='Markdown',
+            reply_markup=InlineKeyboardMarkup(keyboard)
+        )
+
+    async def send_broadcast_item(self, telegram_id: int, item):
+        """Отправка элемента рассылки: товара или сводки по продавцу"""
+        if item.get('products_count'):
+            await self.send_new_products_summary(telegram_id, item)
+        else:
+            await self.send_new_product_notification(telegram_id, item)
 
     async def broadcast_new_products(self, products: list):
-        """Рассылка уведомлений о новых товарах всем пользователям"""
+        """Рассылка уведомлений о новых товарах и сводок по продавцам всем пользователям"""
         if not products:
             return
 
         users = await self.get_all_telegram_users()
-        logger.info(f"Отправка уведомлений о {len(products)} новых товарах для {len(users)} пользователей")
-
-        for product in products:
-            for user in users:
-                try:
-                    await self.send_new_product_notification(product, user['telegram_id'])
-                    # Небольшая задержка, чтобы не спамить Telegram API
-                    await asyncio.sleep(0.1)
-                except Exception as e:
-                    logger.error(f"Ошибка отправки уведомления пользователю {user['telegram_id']}: {e}")
-
-    async def check_new_products(self):
-        """Периодическая проверка новых товаров"""
-        try:
-            current_time = datetime.now()
-
-            # Если это первая проверка, устанавливаем время на час назад
-            if self.last_product_check is None:
-                self.last_product_check = current_time.replace(hour=current_time.hour - 1)
-
-            # Получаем новые товары
-            new_products = await self.get_new_products_since(self.last_product_check)
+        logger.info(f"Отправка {len(products)} уведомлений о новых товарах для {len(users)} пользователей")
+
+        broadcaster = Broadcaster(
+            self.send_broadcast_item,
+            rate=self.broadcast_rate,
+            workers=self.broadcast_workers,
+            chat_interval=self.broadcast_chat_interval,
+            on_blocked=self.mark_telegram_user_blocked
+        )
+        stats = await broadcaster.run([user['telegram_id'] for user in users], list(products))
+        self.last_broadcast_stats = stats.as_dict()
+
+    async def deliver_new_products(self):
+        """Рассылка товаров, появившихся после водяного знака"""
+        if self.last_notified_product_id is None:
+            self.last_notified_product_id = await self.load_notification_watermark()
+        watermark = self.last_notified_product_id
+
+        # id меньше водяного знака приходят, если транзакция с меньшим id
+        # зафиксировалась позже следующей - такие товары запрашиваем явно
+        late_ids = [product_id for product_id in self.notified_product_ids
+                    if product_id <= watermark and product_id not in self.recent_notified_ids]
+        self.notified_product_ids.clear()
+
+        # О продавце с большим числом новых товаров (импорт каталога) -
+        # одна сводка, а не сообщение о каждом товаре каждому пользователю
+        sellers = await self.get_new_product_sellers(watermark, late_ids)
+        grouped = [seller for seller in sellers
+                   if seller['user_id'] is not None and seller['products_count'] > self.broadcast_group_threshold]
+
+        products = await self.get_new_products_after(watermark, late_ids, [seller['user_id'] for seller in grouped])
+        products = [product for product in products if product['id'] not in self.recent_notified_ids]
+        if not products and not grouped:
+            return
 
-            if new_products:
-                logger.info(f"Найдено {len(new_products)} новых товаров")
-                await self.broadcast_new_products(new_products)
+        logger.info(f"Найдено {len(products)} новых товаров и {len(grouped)} продавцов со сводкой")
+        await self.broadcast_new_products(products + grouped)
 
-            # Обновляем время последней проверки
-            self.last_product_check = current_time
+        self.recent_notified_ids.extend(product['id'] for product in products)
+        last_ids = [product['id'] for product in products] + [seller['last_id'] for seller in grouped]
+        self.last_notified_product_id = max(watermark, *last_ids)
+        await self.save_notification_watermark(self.last_notified_product_id)
 
-        except Exception as e:
-            logger.error(f"Ошибка при проверке новых товаров: {e}")
+    def on_new_product(self, connection, pid, channel, payload):
+        """Обработчик NOTIFY о новом товаре"""
+        try:
+            self.notified_product_ids.add(int(payload))
+        except ValueError:
+            logger.warning(f"Некорректное уведомление о товаре: {payload!r}")
+        self.products_wakeup.set()
+
+    def on_catalog_changed(self, connection, pid, channel, payload):
+        """Обработчик NOTIFY об изменении товаров или категорий"""
+        # Изменение товаров влияет только на списки товаров, категорий - на всё
+        self.catalog_cache.invalidate("products" if payload == "products" else None)
+
+    async def listen_new_products(self):
+        """Отдельное соединение, слушающее каналы новых товаров и изменений каталога;
+        переподключается при обрыве"""
+        delay = 1
+        while True:
+            conn = None
+            try:
+                # По application_name воркеры вебхука считают друг друга при делении разделов
+                server_settings = {'application_name': WORKER_APPLICATION_NAME} if self.webhook_mode else None
+                conn = await asyncpg.connect(settings.database_url, server_settings=server_settings)
+                lost = asyncio.Event()
+                conn.add_termination_listener(lambda _: lost.set())
+                await conn.add_listener(CATALOG_CHANNEL, self.on_catalog_changed)
+                logger.info(f"🔔 Подписка на канал {CATALOG_CHANNEL} установлена")
+                delay = 1
+
+                # Пока подписки не было, изменения каталога могли пройти незамеченными
+                self.catalog_cache.invalidate()
+
+                if self.webhook_mode:
+                    await conn.add_listener(BOT_UPDATES_CHANNEL, self.update_queue.on_notify)
+
+                leader = False
+                while not lost.is_set():
+                    # Рассылку ведёт экземпляр, удерживающий блокировку; она снимается
+                    # вместе с соединением, и её забирает другой экземпляр
+                    if not leader:
+                        leader = await conn.fetchval("SELECT pg_try_advisory_lock($1)", NOTIFICATIONS_LOCK_KEY)
+                        if leader:
+                            await conn.add_listener(NEW_PRODUCTS_CHANNEL, self.on_new_product)
+                            logger.info(f"🔔 Подписка на канал {NEW_PRODUCTS_CHANNEL} установлена")
+                            # Догоняем товары, пропущенные без подписки
+                            self.products_wakeup.set()
+
+                    # Разделы очереди обновлений - поровну между живыми воркерами
+                    if self.webhook_mode:
+                        await self.update_queue.rebalance(conn)
+
+                    # Проверяем соединение, чтобы заметить обрыв без закрытия сокета
+                    try:
+                        await asyncio.wait_for(lost.wait(), timeout=30)
+                    except asyncio.TimeoutError:
+                        await conn.fetchval("SELECT 1", timeout=10)
+                logger.warning("Соединение подписки на новые товары закрыто")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Ошибка подписки на новые товары: {e}")
+            finally:
+                # Вместе с соединением снимаются блокировки лидера и разделов
+                if self.update_queue is not None:
+                    self.update_queue.forget_partitions()
+                if conn is not None and not conn.is_closed():
+                    await conn.close(timeout=5)
+
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 60)
 
     async def start_product_monitoring(self):
         """Запуск мониторинга новых товаров"""
 
-        async def monitoring_loop():
+        async def delivery_loop():
             while True:
+                await self.products_wakeup.wait()
+                self.products_wakeup.clear()
+                # Короткая пауза, чтобы собрать пачку товаров в одну рассылку
+                await asyncio.sleep(2)
                 try:
-                    await self.check_new_products()
-                    # Проверяем каждые 5 минут
-                    await asyncio.sleep(60)
+                    async with query_trace.traced("bot deliver_new_products"):
+                        await self.deliver_new_products()
                 except Exception as e:
-                    logger.error(f"Ошибка в цикле мониторинга: {e}")
-                    # При ошибке ждем минуту и продолжаем
-                    await asyncio.sleep(60)
+                    logger.error(f"Ошибка при рассылке новых товаров: {e}")
 
-        self.notification_task = asyncio.create_task(monitoring_loop())
+        self.notification_task = asyncio.create_task(delivery_loop())
+        self.listener_task = asyncio.create_task(self.listen_new_products())
+        if self.webhook_mode:
+            self.updates_task = asyncio.create_task(self.update_queue.run(self.process_webhook_update))
         logger.info("🔔 Мониторинг новых товаров запущен")
 
     async def stop_product_monitoring(self):
         """Остановка мониторинга новых товаров"""
-        if self.notification_task:
-            self.notification_task.cancel()
+        tasks = [task for task in (self.listener_task, self.notification_task, self.updates_task) if task]
+        for task in tasks:
+            task.cancel()
+        for task in tasks:
             try:
-                await self.notification_task
+                await task
             except asyncio.CancelledError:
                 pass
+        if tasks:
             logger.info("🔕 Мониторинг новых товаров остановлен")
 
     async def toggle_notifications(self, query, enable: bool):
         """Включение/выключение уведомлений для пользователя"""
         telegram_id = query.from_user.id
 
-        # Добавить поле notifications_enabled в таблицу users
-        async with self.db_pool.acquire() as conn:
-            await conn.execute("""
-                UPDATE users 
-                SET notifications_enabled = $1 
-                WHERE telegram_id = $2
-            """, enable, telegram_id)
+        await repository.set_notifications_enabled(telegram_id, enable)
 
         status = "включены" if enable else "выключены"
         await query.answer(f"🔔 Уведомления {status}")
@@ -922,11 +1075,7 @@ Rukami - это маркетплейс уникальных товаров ру
         """Показать настройки уведомлений"""
         telegram_id = query.from_user.id
 
-        async with self.db_pool.acquire() as conn:
-            user = await conn.fetchrow(
-                "SELECT notifications_enabled FROM users WHERE telegram_id = $1",
-                telegram_id
-            )
+        user = await self.get_user_by_telegram_id(telegram_id)
 
         notifications_enabled = user['notifications_enabled'] if user else True
 
@@ -969,14 +1118,15 @@ Rukami - это маркетплейс уникальных товаров ру
 
         await update.message.reply_text(help_text, parse_mode='Markdown')
 
-    def run(self):
-        """Запуск бота"""
-        if not self.bot_token:
-            logger.error("❌ Не указан BOT_TOKEN")
-            return
+    def build_application(self, webhook: bool = False) -> Application:
+        """Создание приложения PTB и регистрация обработчиков"""
+        builder = Application.builder().token(self.bot_token).application_class(TracedApplication)
+        if webhook:
+            # Обновления приходят через вебхук сервера - getUpdates не нужен
+            builder = builder.updater(None)
 
         # Создаем приложение и сохраняем его как атрибут класса
-        self.application = Application.builder().token(self.bot_token).build()
+        self.application = builder.build()
 
         # Обработчики для регистрации
         registration_handler = ConversationHandler(
@@ -1011,6 +1161,50 @@ Rukami - это маркетплейс уникальных товаров ру
 
         # Основной обработчик callback'ов
         self.application.add_handler(CallbackQueryHandler(self.button_callback))
+        return self.application
+
+    async def start_webhook(self, db_pool, webhook_url: str, secret_token: str):
+        """Запуск бота в режиме вебхука внутри сервера: общий пул и цикл событий"""
+        self.build_application(webhook=True)
+        self.webhook_mode = True
+        await self.init_db(db_pool)
+        await self.application.initialize()
+        await self.application.start()
+        await self.application.bot.set_webhook(
+            url=webhook_url,
+            secret_token=secret_token,
+            allowed_updates=Update.ALL_TYPES
+        )
+        await self.start_product_monitoring()
+        logger.info(f"🤖 Telegram бот Rukami принимает обновления через вебхук {webhook_url}")
+
+    async def stop_webhook(self):
+        """Остановка бота, запущенного в режиме вебхука.
+        Вебхук не удаляется: другие процессы сервера продолжают его обслуживать"""
+        await self.stop_product_monitoring()
+        if self.application:
+            await self.application.stop()
+            await self.application.shutdown()
+        await self.close_db()
+
+    async def enqueue_webhook_update(self, data: dict):
+        """Постановка обновления с вебхука в общую очередь.
+        Telegram может доставить его любому процессу сервера, а обработает
+        воркер, владеющий разделом чата"""
+        await self.update_queue.enqueue(data)
+
+    async def process_webhook_update(self, data: dict):
+        """Обработка обновления, пришедшего на вебхук"""
+        update = Update.de_json(data, self.application.bot)
+        await self.application.process_update(update)
+
+    def run(self):
+        """Запуск бота в режиме polling (для локальной разработки)"""
+        if not self.bot_token:
+            logger.error("❌ Не указан BOT_TOKEN")
+            return
+
+        self.build_application()
 
         # Запускаем бота
         logger.info("🤖 Запуск Telegram бота Rukami...")
@@ -0,0 +1,206 @@
+"""
+Очередь обновлений вебхука Telegram в PostgreSQL
+Обновление может прийти в любой воркер сервера. Воркер сохраняет его в таблицу
+bot_updates с номером раздела по чату. Каждый раздел обрабатывает ровно один
+воркер - владелец advisory-блокировки раздела. Разделы делятся между живыми
+воркерами поровну, поэтому обработка масштабируется вместе с сервером, а
+обновления одного чата идут по порядку через один процесс, где живёт
+состояние его диалога (ConversationHandler, user_data).
+Строка удаляется только после обработки: при остановке или падении воркера
+необработанные обновления достаются новому владельцу раздела.
+"""
+
+import asyncio
+import json
+import logging
+import math
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Set
+
+logger = logging.getLogger(__name__)
+
+# Канал LISTEN/NOTIFY о новых обновлениях (полезная нагрузка - номер раздела)
+BOT_UPDATES_CHANNEL = 'bot_updates'
+# Класс двухключевых advisory-блокировок разделов: (класс, номер раздела)
+PARTITION_LOCK_CLASS = 7302
+# application_name соединений-подписчиков воркеров (по нему считаются живые воркеры)
+WORKER_APPLICATION_NAME = 'rukami-bot-webhook'
+# Сколько обновлений забирать из очереди за раз
+BATCH_SIZE = 100
+
+ProcessFunc = Callable[[Dict[str, Any]], Awaitable[None]]
+
+
+def update_chat_id(data: Dict[str, Any]) -> int:
+    """Чат (или пользователь) обновления - ключ упорядочивания.
+    Для обновлений без чата и пользователя - сам update_id"""
+    for key, value in data.items():
+        if key == 'update_id' or not isinstance(value, dict):
+            continue
+        chat = value.get('chat') or (value.get('message') or {}).get('chat')
+        if isinstance(chat, dict) and 'id' in chat:
+            return int(chat['id'])
+        user = value.get('from') or value.get('user')
+        if isinstance(user, dict) and 'id' in user:
+            return int(user['id'])
+    return int(data['update_id'])
+
+
+def partition_for(chat_id: int, partitions: int) -> int:
+    return abs(chat_id) % partitions
+
+
+def fair_share(partitions: int, workers: int) -> int:
+    """Сколько разделов держит один воркер (с округлением вверх - без сирот)"""
+    return math.ceil(partitions / max(1, workers))
+
+
+class UpdateQueue:
+    """Очередь обновлений вебхука с разделами по чатам"""
+
+    def __init__(self, db_pool, partitions: int = 32):
+        self.db_pool = db_pool
+        self.partitions = partitions
+        # Разделы, блокировки которых держит соединение-подписчик этого воркера
+        self.owned: Set[int] = set()
+        self.wakeup = asyncio.Event()
+
+    async def create_table(self):
+        async with self.db_pool.acquire() as conn:
+            # update_id - защита от повторной доставки того же обновления
+            await conn.execute("""
+                CREATE TABLE IF NOT EXISTS bot_updates (
+                    update_id BIGINT PRIMARY KEY,
+                    chat_id BIGINT NOT NULL,
+                    partition SMALLINT NOT NULL,
+                    data JSONB NOT NULL,
+                    received_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+                )
+            """)
+            # Таблица прежнего вида (без разделов): оставшиеся строки уходят в раздел 0
+            await conn.execute("""
+                ALTER TABLE bot_updates
+                    ADD COLUMN IF NOT EXISTS chat_id BIGINT NOT NULL DEFAULT 0,
+                    ADD COLUMN IF NOT EXISTS partition SMALLINT NOT NULL DEFAULT 0
+            """)
+            await conn.execute("""
+                CREATE INDEX IF NOT EXISTS idx_bot_updates_partition ON bot_updates (partition, update_id)
+            """)
+
+    async def enqueue(self, data: Dict[str, Any]):
+        """Сохранение обновления и уведомление владельца раздела"""
+        chat_id = update_chat_id(data)
+        partition = partition_for(chat_id, self.partitions)
+        async with self.db_pool.acquire() as conn:
+            async with conn.transaction():
+                await conn.execute("""
+                    INSERT INTO bot_updates (update_id, chat_id, partition, data) VALUES ($1, $2, $3, $4::jsonb)
+                    ON CONFLICT (update_id) DO NOTHING
+                """, int(data['update_id']), chat_id, partition, json.dumps(data, ensure_ascii=False))
+                # NOTIFY доставляется после фиксации транзакции
+                await conn.execute("SELECT pg_notify($1, $2)", BOT_UPDATES_CHANNEL, str(partition))
+
+    def on_notify(self, connection, pid, channel, payload):
+        """Обработчик NOTIFY о новом обновлении"""
+        self.wakeup.set()
+
+    def forget_partitions(self):
+        """Соединение-подписчик потеряно - его блокировки сняты сервером"""
+        if self.owned:
+            logger.warning(f"Разделы очереди обновлений освобождены: {sorted(self.owned)}")
+        self.owned.clear()
+
+    async def rebalance(self, conn):
+        """Захват или освобождение разделов до равной доли на живой воркер.
+
+        Выполняется на соединении-подписчике: блокировки сессионные и
+        снимаются вместе с ним. Освобождённые разделы забирают другие воркеры
+        при своей следующей перебалансировке
+        """
+        workers = await conn.fetchval("""
+            SELECT count(*) FROM pg_stat_activity
+            WHERE application_name = $1 AND datname = current_database()
+        """, WORKER_APPLICATION_NAME)
+        share = fair_share(self.partitions, workers)
+
+        for partition in sorted(self.owned, reverse=True)[:max(0, len(self.owned) - share)]:
+            await conn.fetchval("SELECT pg_advisory_unlock($1, $2)", PARTITION_LOCK_CLASS, partition)
+            self.owned.discard(partition)
+            logger.info(f"Раздел {partition} очереди обновлений передан другому воркеру")
+
+        if len(self.owned) < share:
+            for partition in range(self.partitions):
+                if len(self.owned) >= share:
+                    break
+                if partition in self.owned:
+                    continue
+                if await conn.fetchval("SELECT pg_try_advisory_lock($1, $2)", PARTITION_LOCK_CLASS, partition):
+                    self.owned.add(partition)
+                    logger.info(f"Раздел {partition} очереди обновлений взят в обработку")
+                    self.wakeup.set()
+
+    async def take(self, partitions: Iterable[int], limit: int = BATCH_SIZE) -> List[Any]:
+        """Необработанные обновления разделов по порядку update_id (без удаления)"""
+        async with self.db_pool.acquire() as conn:
+            return await conn.fetch("""
+                SELECT update_id, partition, data FROM bot_updates
+                WHERE partition = ANY($1::smallint[])
+                ORDER BY update_id
+                LIMIT $2
+            """, list(partitions), limit)
+
+    async def ack(self, update_id: int):
+        """Удаление обработанного обновления"""
+        async with self.db_pool.acquire() as conn:
+            await conn.execute("DELETE FROM bot_updates WHERE update_id = $1", update_id)
+
+    async def drain(self, process: ProcessFunc) -> int:
+        """Обработка очереди своих разделов; возвращает число обработанных обновлений.
+
+        Разделы обрабатываются параллельно, обновления внутри раздела - строго
+        по очереди. Ошибка обработчика не останавливает очередь: обновление
+        удаляется, как и при обработке PTB в режиме polling
+        """
+        handled = 0
+        while self.owned:
+            rows = await self.take(self.owned)
+            if not rows:
+                break
+            by_partition: Dict[int, List[Any]] = {}
+            for row in rows:
+                by_partition.setdefault(row['partition'], []).append(row)
+
+            async def run_partition(partition: int, partition_rows: List[Any]):
+                nonlocal handled
+                for row in partition_rows:
+                    # Раздел могли отдать другому воркеру - остальное обработает он
+                    if partition not in self.owned:
+                        return
+                    try:
+                        await process(json.loads(row['data']))
+                    except asyncio.CancelledError:
+                        raise
+                    except Exception as e:
+                        logger.error(f"Ошибка обработки обновления {row['update_id']}: {e}")
+                    await self.ack(row['update_id'])
+                    handled += 1
+
+            await asyncio.gather(*(run_partition(partition, partition_rows)
+                                   for partition, partition_rows in by_partition.items()))
+        return handled
+
+    async def run(self, process: ProcessFunc, poll_interval: float = 5.0):
+        """Цикл обработки очереди (до отмены задачи)"""
+        while True:
+            try:
+                # Периодическая проверка - на случай пропущенного NOTIFY
+                await asyncio.wait_for(self.wakeup.wait(), timeout=poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            self.wakeup.clear()
+            try:
+                await self.drain(process)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Ошибка обработки очереди обновлений: {e}")
+                await asyncio.sleep(1)
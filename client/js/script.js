@@ -7,6 +7,7 @@ let currentCategory = null;
 let currentSearch = '';
 let totalProducts = 0;
 let allProducts = []; // Кэш всех товаров
+let nextCursor = null; // Курсор следующей страницы из ответа API
 
 // Инициализация приложения
 document.addEventListener('DOMContentLoaded', async function() {
@@ -30,7 +31,11 @@ async function loadProductsFromDatabase() {
         productsContainer.innerHTML = '<div style="text-align: center; padding: 20px;">Загрузка товаров...</div>';
         
         // Делаем запрос к API
-        const response = await fetch(`/api/products?limit=${productsPerPage}&offset=${(currentPage - 1) * productsPerPage}`);
+        // Первая страница запрашивается без курсора, следующие - по next_cursor
+        const pageParam = currentPage > 1 && nextCursor
+            ? `cursor=${encodeURIComponent(nextCursor)}`
+            : `offset=${(currentPage - 1) * productsPerPage}`;
+        const response = await fetch(`/api/products?limit=${productsPerPage}&${pageParam}`);
         
         if (!response.ok) {
             throw new Error(`HTTP error! status: ${response.status}`);
@@ -38,6 +43,7 @@ async function loadProductsFromDatabase() {
         
         const data = await response.json();
         totalProducts = data.total;
+        nextCursor = data.next_cursor;
         allProducts = currentPage === 1 ? data.products : [...allProducts, ...data.products];
         
         renderProducts(data.products);
@@ -6,6 +6,7 @@ const productsPerPage = 6;
 let currentCategory = null;
 let currentSearch = '';
 let totalProducts = 0;
+let nextCursor = null;
 
 // DOM elements
 const categoriesGrid = document.getElementById('categoriesGrid');
@@ -88,10 +89,11 @@ async function fetchCategories() {
 }
 
 // Получение товаров
-async function fetchProducts(page = 1, category = null, search = '') {
+// Если передан курсор, следующая страница запрашивается по нему, а не по offset
+async function fetchProducts(page = 1, category = null, search = '', cursor = null) {
     const params = new URLSearchParams({
         limit: productsPerPage,
-        offset: (page - 1) * productsPerPage,
+        ...(cursor ? { cursor: cursor } : { offset: (page - 1) * productsPerPage }),
         ...(category && { category_slug: category }),
         ...(search && { search: search })
     });
@@ -155,6 +157,7 @@ async function renderProducts() {
 
         const data = await fetchProducts(currentPage, currentCategory, currentSearch);
         totalProducts = data.total;
+        nextCursor = data.next_cursor;
         const products = data.products;
         // Добавить эти строки после получения данных от API
         console.log('Products data:', products);
@@ -311,7 +314,8 @@ async function performSearch() {
 async function loadMoreProducts() {
     try {
         currentPage++;
-        const data = await fetchProducts(currentPage, currentCategory, currentSearch);
+        const data = await fetchProducts(currentPage, currentCategory, currentSearch, nextCursor);
+        nextCursor = data.next_cursor;
         const newProducts = data.products;
 
         if (newProducts.length === 0) {
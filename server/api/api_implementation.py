@@ -1,27 +1,55 @@
 """Расширенный API с авторизацией и управлением товарами для сайта Rukami"""
 from fastapi import APIRouter, HTTPException, Query, Depends, status, Request, Response
-from fastapi.security import HTTPBearer
+from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from typing import List, Optional
 import logging
-import hashlib
+import base64
+import binascii
+import time
 import jwt
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 
 from pydantic import BaseModel, EmailStr, Field
 
-from server.database.db_connection import fetch_all, fetch_one, execute_query
+from server.cache import TTLCache, get_cache_stats
+from server.config import settings
+from server.database.db_connection import (
+    fetch_all, fetch_one, execute_query, estimate_rows, register_query, get_query_stats,
+    get_connection, get_transaction
+)
+from server.database import db_connection, query_trace
+from server.database.repository import (
+    CATEGORIES_QUERY, CATEGORY_QUERY, CATEGORY_BY_SLUG_QUERY, PRODUCT_QUERY, PRODUCTS_PAGE_QUERY,
+    get_user_by_email, create_user, update_password_hash, revoke_user_tokens
+)
+from server.responses import FastJSONResponse, json_response
+from server.product_import import (
+    FORMATS as IMPORT_FORMATS, ImportLimitExceeded, detect_format, import_products as run_product_import
+)
+from server.passwords import (
+    PasswordHasherBusy, hash_password, verify_password, verify_and_update, get_password_hash_stats
+)
 
 logger = logging.getLogger(__name__)
 
 # Создаем роутер
-router = APIRouter(prefix="/api", tags=["API"])
+router = APIRouter(prefix="/api", tags=["API"], default_response_class=FastJSONResponse)
 
 # Настройки для JWT
-SECRET_KEY = "your-secret-key-here"  # В продакшене должен быть в переменных окружения
 ALGORITHM = "HS256"
-ACCESS_TOKEN_EXPIRE_MINUTES = 30
+ACCESS_TOKEN_EXPIRE_MINUTES = settings.access_token_expire_minutes
+ACCESS_TOKEN_COOKIE = "access_token"
 
-security = HTTPBearer()
+security = HTTPBearer(auto_error=False)
+
+# Кэш категорий (списка, отдельных категорий и отображения slug -> id)
+catalog_cache = TTLCache("catalog", maxsize=settings.category_cache_size, ttl=settings.category_cache_ttl)
+
+# Кэш количества товаров по фильтру: (category_id, search) -> (total, оценка ли)
+count_cache = TTLCache("product_counts", maxsize=1024, ttl=settings.count_cache_ttl)
+
+# Кэш пользователей, проверенных по БД при обновлении токена: id -> данные
+verified_user_cache = TTLCache("verified_users", maxsize=10000, ttl=settings.verified_user_cache_ttl)
 
 # === МОДЕЛИ ДАННЫХ ===
 
@@ -73,76 +101,183 @@ class ReviewCreate(BaseModel):
 
 # === УТИЛИТЫ ===
 
-def hash_password(password: str) -> str:
-    """Хеширование пароля"""
-    return hashlib.sha256(password.encode()).hexdigest()
-
-def verify_password(password: str, hashed: str) -> bool:
-    """Проверка пароля"""
-    return hash_password(password) == hashed
+def invalidate_catalog_cache():
+    """Сброс кэша категорий и количества товаров после изменений каталога"""
+    catalog_cache.clear()
+    count_cache.clear()
+
+async def get_catalog_transaction():
+    """Зависимость FastAPI: транзакция запроса, изменяющего каталог.
+
+    Кэши каталога сбрасываются только после COMMIT: при сбросе внутри
+    транзакции параллельный GET успевал загрузить в кэш старые данные и
+    держал их весь TTL. При откате (любое исключение) кэши не трогаются.
+    Подключается со scope="function", чтобы COMMIT и сброс кэшей
+    произошли до отправки ответа
+    """
+    async with db_connection.db_pool.acquire() as connection:
+        async with connection.transaction():
+            yield connection
+        invalidate_catalog_cache()
+
+async def get_category_id_by_slug(slug: str) -> Optional[int]:
+    """Получение ID категории по slug через кэш"""
+    async def load():
+        categories = await fetch_all("SELECT id, slug FROM categories")
+        return {category['slug']: category['id'] for category in categories}
+
+    slug_map = await catalog_cache.get_or_load("slug_map", load)
+    return slug_map.get(slug)
+
+async def get_category_ids() -> set:
+    """Множество id всех категорий через кэш"""
+    async def load():
+        categories = await fetch_all("SELECT id FROM categories")
+        return {category['id'] for category in categories}
+
+    return await catalog_cache.get_or_load("category_ids", load)
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     """Создание JWT токена"""
-    logger.info(f"Generating token for user: {data['sub']}")
+    logger.debug(f"Generating token for user: {data['sub']}")
     to_encode = data.copy()
+    now = datetime.now(timezone.utc)
     if expires_delta:
-        expire = datetime.utcnow() + expires_delta
+        expire = now + expires_delta
     else:
-        expire = datetime.utcnow() + timedelta(minutes=15)
-    to_encode.update({"exp": expire})
-    encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+        expire = now + timedelta(minutes=15)
+    to_encode.update({"exp": expire, "iat": now})
+    encoded_jwt = jwt.encode(to_encode, settings.secret_key, algorithm=ALGORITHM)
     return encoded_jwt
 
-
-async def get_current_user(request: Request):
-    """Получение текущего пользователя из cookie"""
+def user_claims(user) -> dict:
+    """Данные пользователя, которые переносятся в токене.
+    Контактные данные в токен не попадают: он живёт долго и хранится у клиента"""
+    return {
+        "sub": str(user['id']),
+        "name": user['name'],
+        "ver": user['token_version'],
+    }
+
+def public_user(user) -> dict:
+    """Данные пользователя для ответа API (без служебных полей)"""
+    return {key: value for key, value in dict(user).items() if key != 'token_version'}
+
+def set_auth_cookie(response: Response, user) -> str:
+    """Выпуск токена для пользователя и установка его в cookie"""
+    token = create_access_token(user_claims(user), timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
+    response.set_cookie(
+        key=ACCESS_TOKEN_COOKIE,
+        value=token,
+        httponly=True,  # Защита от XSS
+        max_age=ACCESS_TOKEN_EXPIRE_MINUTES * 60,
+        samesite="lax"
+    )
+    return token
+
+def encode_cursor(created_at: datetime, item_id: int) -> str:
+    """Кодирование курсора пагинации из пары (created_at, id)"""
+    raw = f"{created_at.isoformat()}|{item_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor: str):
+    """Декодирование курсора пагинации в пару (created_at, id)"""
     try:
-        user_id = request.cookies.get("user_id")
-        logger.info(f"Cookie user_id: {user_id}")
+        padded = cursor + "=" * (-len(cursor) % 4)
+        created_at, item_id = base64.urlsafe_b64decode(padded.encode()).decode().split("|")
+        created_at = datetime.fromisoformat(created_at)
+        # encode_cursor получает created_at из колонок TIMESTAMPTZ - время всегда с поясом
+        if created_at.tzinfo is None:
+            raise ValueError("Курсор без часового пояса")
+        return created_at, int(item_id)
+    except (ValueError, binascii.Error, UnicodeDecodeError):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Некорректный курсор пагинации"
+        )
 
-        if not user_id:
-            logger.warning("Cookie user_id отсутствует")
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Пользователь не авторизован"
-            )
 
-        try:
-            user_id = int(user_id)
-            logger.info(f"Поиск пользователя с ID: {user_id}")
+async def load_verified_user(user_id: int) -> Optional[dict]:
+    """Актуальные данные пользователя из БД (с кратковременным кэшем)"""
+    async def load():
+        user = await fetch_one("""
+            SELECT id, name, email, phone, address, created_at, token_version FROM users WHERE id = $1
+        """, user_id)
+        return dict(user) if user else None
 
-            user = await fetch_one("SELECT id, name, email, phone, address, created_at FROM users WHERE id = $1",
-                                   user_id)
+    return await verified_user_cache.get_or_load(user_id, load)
 
-            if not user:
-                logger.warning(f"Пользователь с ID {user_id} не найден в базе данных")
-                raise HTTPException(
-                    status_code=status.HTTP_401_UNAUTHORIZED,
-                    detail="Пользователь не найден"
-                )
 
-            logger.info(f"Пользователь найден: {user['name']} ({user['email']})")
-            return dict(user)
+async def get_current_user(
+        request: Request,
+        response: Response,
+        credentials: Optional[HTTPAuthorizationCredentials] = Depends(security)
+):
+    """Получение текущего пользователя по подписанному токену
+
+    Токен берётся из cookie или заголовка Authorization: Bearer и содержит
+    только id, имя и версию токенов пользователя. Остальные данные берутся
+    из кэша проверенных пользователей (verified_user_cache); токен с
+    устаревшей версией (после выхода или смены пароля) не принимается.
+    Токен в cookie старше settings.token_refresh_minutes выпускается заново.
+    """
+    token = request.cookies.get(ACCESS_TOKEN_COOKIE)
+    if credentials:
+        token = credentials.credentials
+
+    if not token:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Пользователь не авторизован"
+        )
 
-        except ValueError as ve:
-            logger.error(f"Ошибка преобразования user_id в int: {ve}")
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Неверный формат ID пользователя"
-            )
+    try:
+        claims = jwt.decode(token, settings.secret_key, algorithms=[ALGORITHM])
+        user_id = int(claims['sub'])
+    except jwt.ExpiredSignatureError:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Срок действия сессии истёк"
+        )
+    except (jwt.InvalidTokenError, KeyError, ValueError) as e:
+        logger.warning(f"Недействительный токен: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Недействительный токен"
+        )
 
-    except HTTPException:
-        raise
+    try:
+        user = await load_verified_user(user_id)
     except Exception as e:
-        logger.error(f"Неожиданная ошибка в get_current_user: {e}")
-        logger.error(f"Тип ошибки: {type(e)}")
+        logger.error(f"Ошибка проверки пользователя {user_id}: {e}")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Внутренняя ошибка сервера"
         )
 
+    if not user:
+        logger.warning(f"Пользователь с ID {user_id} из токена не найден в базе данных")
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Пользователь не найден"
+        )
+
+    # Токены старой версии отозваны выходом или сменой пароля
+    if claims.get('ver') != user['token_version']:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Сессия завершена, войдите снова"
+        )
+
+    # Обновляем токен из cookie; клиенты с Bearer получают новый токен при входе
+    if not credentials and time.time() - claims.get('iat', 0) >= settings.token_refresh_minutes * 60:
+        set_auth_cookie(response, user)
+    return public_user(user)
+
 @router.put("/profile")
-async def update_profile(profile_data: UserProfileUpdate, current_user: dict = Depends(get_current_user)):
+async def update_profile(profile_data: UserProfileUpdate, response: Response,
+                         current_user: dict = Depends(get_current_user),
+                         connection=Depends(get_transaction, scope="function")):
     """Обновление профиля пользователя"""
     try:
         # Формируем запрос обновления только для переданных полей
@@ -168,17 +303,21 @@ async def update_profile(profile_data: UserProfileUpdate, current_user: dict = D
             WHERE id = ${param_counter}
         """
 
-        await execute_query(query, *update_values)
+        await execute_query(query, *update_values, connection=connection)
 
         # Возвращаем обновленную информацию о пользователе
         updated_user = await fetch_one("""
-            SELECT id, name, email, phone, address, created_at, updated_at
+            SELECT id, name, email, phone, address, created_at, updated_at, token_version
             FROM users WHERE id = $1
-        """, current_user['id'])
+        """, current_user['id'], connection=connection)
+
+        # Имя хранится в токене - выпускаем новый
+        verified_user_cache.pop(current_user['id'])
+        set_auth_cookie(response, updated_user)
 
         return {
             "message": "Профиль обновлен успешно",
-            "user": dict(updated_user)
+            "user": public_user(updated_user)
         }
 
     except HTTPException:
@@ -188,28 +327,30 @@ async def update_profile(profile_data: UserProfileUpdate, current_user: dict = D
         raise HTTPException(status_code=500, detail="Ошибка обновления профиля")
 
 
+USER_PRODUCTS_QUERY = register_query("profile.products", """
+    SELECT p.id, p.name, p.description, p.price, p.image_url,
+           p.in_stock, p.created_at, p.updated_at,
+           c.id as category_id, c.name as category_name, c.slug as category_slug,
+           u.name as author_name
+    FROM products p
+    LEFT JOIN categories c ON p.category_id = c.id
+    LEFT JOIN users u ON p.user_id = u.id
+    WHERE p.user_id = $1
+    ORDER BY p.created_at DESC
+""")
+
 @router.get("/profile/products")
-async def get_user_products(current_user: dict = Depends(get_current_user)):
+async def get_user_products(response: Response, current_user: dict = Depends(get_current_user)):
     """Получение списка товаров пользователя"""
     try:
         # Сначала проверим, есть ли у пользователя товары
         logger.info(f"Загрузка товаров для пользователя ID: {current_user['id']}")
 
-        products = await fetch_all("""
-            SELECT p.id, p.name, p.description, p.price, p.image_url,
-                   p.in_stock, p.created_at, p.updated_at,
-                   c.id as category_id, c.name as category_name, c.slug as category_slug,
-                   u.name as author_name
-            FROM products p
-            LEFT JOIN categories c ON p.category_id = c.id
-            LEFT JOIN users u ON p.user_id = u.id
-            WHERE p.user_id = $1
-            ORDER BY p.created_at DESC
-        """, current_user['id'])
+        products = await fetch_all(USER_PRODUCTS_QUERY, current_user['id'])
 
         logger.info(f"Найдено товаров: {len(products)}")
 
-        return {"products": [dict(product) for product in products]}
+        return json_response({"products": products}, response)
 
     except Exception as e:
         logger.error(f"Ошибка получения товаров пользователя: {e}")
@@ -220,40 +361,30 @@ async def get_user_products(current_user: dict = Depends(get_current_user)):
         return {"products": []}
 
 
+SELLER_STATS_QUERY = register_query("profile.statistics", """
+    SELECT COALESCE(s.products_count, 0) AS products_count,
+           COALESCE(s.active_products_count, 0) AS active_products_count,
+           COALESCE(s.favorites_count, 0) AS favorites_count
+    FROM (SELECT $1::integer AS user_id) u
+    LEFT JOIN seller_stats s ON s.user_id = u.user_id
+""")
+
 @router.get("/profile/statistics")
 async def get_user_statistics(current_user: dict = Depends(get_current_user)):
     """Получение статистики пользователя"""
     try:
         logger.info(f"Загрузка статистики для пользователя ID: {current_user['id']}")
 
-        # Получаем количество товаров
-        products_count_result = await fetch_one("""
-            SELECT COUNT(*) as count FROM products WHERE user_id = $1
-        """, current_user['id'])
-        products_count = products_count_result['count'] if products_count_result else 0
-
-        # Получаем количество активных товаров
-        active_products_result = await fetch_one("""
-            SELECT COUNT(*) as count FROM products WHERE user_id = $1 AND in_stock = true
-        """, current_user['id'])
-        active_products_count = active_products_result['count'] if active_products_result else 0
+        # Счётчики продавца поддерживаются триггерами - одно чтение по ключу
+        stats = await fetch_one(SELLER_STATS_QUERY, current_user['id'])
+        # Нет строки - нет и товаров с избранным (запрос сам подставляет нули через LEFT JOIN)
+        products_count = stats['products_count'] if stats else 0
+        active_products_count = stats['active_products_count'] if stats else 0
+        favorites_count = stats['favorites_count'] if stats else 0
 
         # Получаем количество заказов (пока заглушка)
         orders_count = 0
 
-        # Получаем количество товаров в избранном у других пользователей
-        try:
-            favorites_result = await fetch_one("""
-                SELECT COUNT(*) as count 
-                FROM favorites f 
-                JOIN products p ON f.product_id = p.id 
-                WHERE p.user_id = $1
-            """, current_user['id'])
-            favorites_count = favorites_result['count'] if favorites_result else 0
-        except Exception as fav_error:
-            logger.warning(f"Ошибка получения избранного: {fav_error}")
-            favorites_count = 0
-
         logger.info(
             f"Статистика: товаров={products_count}, активных={active_products_count}, избранное={favorites_count}")
 
@@ -265,38 +396,27 @@ async def get_user_statistics(current_user: dict = Depends(get_current_user)):
         }
 
     except Exception as e:
-        logger.error(f"Ошибка получения статистики: {e}")
-        logger.error(f"Тип ошибки: {type(e)}")
-        logger.error(f"User ID: {current_user.get('id', 'unknown')}")
-
-        # Возвращаем нулевую статистику вместо ошибки
-        return {
-            "products_count": 0,
-            "active_products_count": 0,
-            "orders_count": 0,
-            "favorites_count": 0
-        }
+        logger.error(f"Ошибка получения статистики пользователя {current_user['id']}: {e}")
+        raise HTTPException(status_code=500, detail="Ошибка получения статистики")
 
 # === АВТОРИЗАЦИЯ И РЕГИСТРАЦИЯ ===
 
 @router.post("/auth/register")
-async def register_user(user_data: UserRegister):
+async def register_user(user_data: UserRegister, connection=Depends(get_connection, scope="function")):
     """Регистрация нового пользователя"""
     try:
-        existing_user = await fetch_one("SELECT id FROM users WHERE email = $1", user_data.email)
+        existing_user = await fetch_one("SELECT id FROM users WHERE email = $1", user_data.email,
+                                        connection=connection)
         if existing_user:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="Пользователь с таким email уже существует"
             )
 
-        hashed_password = hash_password(user_data.password)
+        hashed_password = await hash_password(user_data.password)
 
-        user_id = await fetch_one("""
-            INSERT INTO users (name, email, password_hash, phone, address)
-            VALUES ($1, $2, $3, $4, $5)
-            RETURNING id
-        """, user_data.name, user_data.email, hashed_password, user_data.phone, user_data.address)
+        await create_user(user_data.name, user_data.email, hashed_password, user_data.phone, user_data.address,
+                          connection=connection)
 
         return {
             "message": "Пользователь успешно зарегистрирован",
@@ -304,6 +424,8 @@ async def register_user(user_data: UserRegister):
 
     except HTTPException:
         raise
+    except PasswordHasherBusy:
+        raise HTTPException(status_code=503, detail="Сервер перегружен, попробуйте позже")
     except Exception as e:
         logger.error(f"Ошибка регистрации пользователя: {e}")
         raise HTTPException(status_code=500, detail="Ошибка регистрации пользователя")
@@ -312,25 +434,22 @@ async def register_user(user_data: UserRegister):
 async def login_user(user_data: UserLogin, response: Response):
     """Авторизация пользователя"""
     try:
-        user = await fetch_one(
-            "SELECT id, name, email, password_hash FROM users WHERE email = $1",
-            user_data.email
-        )
+        user = await get_user_by_email(user_data.email)
 
-        if not user or not verify_password(user_data.password, user['password_hash']):
+        password_ok, new_hash = await verify_and_update(user_data.password, user['password_hash']) \
+            if user else (False, None)
+        if not password_ok:
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="Неверный email или пароль"
             )
 
-        # Устанавливаем cookie с ID пользователя
-        response.set_cookie(
-            key="user_id",
-            value=str(user['id']),
-            httponly=True,  # Защита от XSS
-            max_age=30*24*60*60,  # 30 дней
-            samesite="lax"
-        )
+        # Хэш старой схемы или прежней стоимости заменяется при успешном входе
+        if new_hash:
+            await update_password_hash(user['id'], new_hash)
+
+        # Устанавливаем cookie с подписанным токеном
+        access_token = set_auth_cookie(response, user)
 
         return {
             "message": "Успешная авторизация",
@@ -338,19 +457,40 @@ async def login_user(user_data: UserLogin, response: Response):
                 "id": user['id'],
                 "name": user['name'],
                 "email": user['email']
-            }
+            },
+            "access_token": access_token,
+            "token_type": "bearer"
         }
 
     except HTTPException:
         raise
+    except PasswordHasherBusy:
+        raise HTTPException(status_code=503, detail="Сервер перегружен, попробуйте позже")
     except Exception as e:
         logger.error(f"Ошибка авторизации: {e}")
         raise HTTPException(status_code=500, detail="Ошибка авторизации")
 
 @router.post("/auth/logout")
-async def logout_user(response: Response):
-    """Выход пользователя"""
-    response.delete_cookie(key="user_id")
+async def logout_user(request: Request, response: Response,
+                      credentials: Optional[HTTPAuthorizationCredentials] = Depends(security)):
+    """Выход пользователя: все выданные ему токены отзываются"""
+    token = credentials.credentials if credentials else request.cookies.get(ACCESS_TOKEN_COOKIE)
+    if token:
+        try:
+            claims = jwt.decode(token, settings.secret_key, algorithms=[ALGORITHM])
+            user_id = int(claims['sub'])
+        except (jwt.InvalidTokenError, KeyError, ValueError):
+            user_id = None
+        if user_id is not None:
+            try:
+                await revoke_user_tokens(user_id)
+                verified_user_cache.pop(user_id)
+            except Exception as e:
+                logger.error(f"Ошибка отзыва токенов пользователя {user_id}: {e}")
+                raise HTTPException(status_code=500, detail="Ошибка выхода")
+
+    response.delete_cookie(key=ACCESS_TOKEN_COOKIE)
+    response.delete_cookie(key="user_id")  # cookie старой схемы авторизации
     return {"message": "Успешный выход"}
 
 @router.get("/auth/me")
@@ -361,13 +501,15 @@ async def get_current_user_info(current_user: dict = Depends(get_current_user)):
 # === УПРАВЛЕНИЕ КАТЕГОРИЯМИ (АДМИН) ===
 
 @router.post("/admin/categories")
-async def create_category(category_data: CategoryCreate, current_user: dict = Depends(get_current_user)):
+async def create_category(category_data: CategoryCreate, current_user: dict = Depends(get_current_user),
+                          connection=Depends(get_catalog_transaction, scope="function")):
     """Создание новой категории (только для админов)"""
     try:
         # Проверяем, не существует ли категория с таким именем или slug
         existing_category = await fetch_one(
             "SELECT id FROM categories WHERE name = $1 OR slug = $2",
-            category_data.name, category_data.slug
+            category_data.name, category_data.slug,
+            connection=connection
         )
         if existing_category:
             raise HTTPException(
@@ -380,7 +522,7 @@ async def create_category(category_data: CategoryCreate, current_user: dict = De
             VALUES ($1, $2, $3, $4, $5)
             RETURNING id
         """, category_data.name, category_data.description, category_data.slug,
-            category_data.image_url, category_data.sort_order)
+            category_data.image_url, category_data.sort_order, connection=connection)
 
         return {
             "message": "Категория создана успешно",
@@ -393,14 +535,44 @@ async def create_category(category_data: CategoryCreate, current_user: dict = De
         logger.error(f"Ошибка создания категории: {e}")
         raise HTTPException(status_code=500, detail="Ошибка создания категории")
 
+@router.get("/admin/cache/stats")
+async def get_cache_statistics(current_user: dict = Depends(get_current_user)):
+    """Статистика кэшей процесса (попадания и промахи)"""
+    return {"caches": get_cache_stats()}
+
+@router.get("/admin/query-stats")
+async def get_query_statistics(current_user: dict = Depends(get_current_user)):
+    """Статистика именованных запросов к БД (вызовы, время, строки)"""
+    return {"queries": get_query_stats()}
+
+@router.get("/admin/password-stats")
+async def get_password_statistics(current_user: dict = Depends(get_current_user)):
+    """Статистика хэширования паролей (время, ожидание очереди, отказы)"""
+    return {"password_hashing": get_password_hash_stats()}
+
+@router.get("/admin/sql-traces")
+async def get_sql_traces(limit: int = Query(50, ge=1, le=500), current_user: dict = Depends(get_current_user)):
+    """Последние трассировки SQL (при SQL_TRACE=true), без списка запросов"""
+    return {"enabled": settings.sql_trace, "traces": query_trace.list_traces(limit)}
+
+@router.get("/admin/sql-traces/{trace_id}")
+async def get_sql_trace(trace_id: str, current_user: dict = Depends(get_current_user)):
+    """Запросы к БД одного HTTP-запроса по id из заголовка X-SQL-Trace"""
+    trace = query_trace.get_trace(trace_id)
+    if trace is None:
+        raise HTTPException(status_code=404, detail="Трассировка не найдена")
+    return trace
+
 # === УПРАВЛЕНИЕ ТОВАРАМИ ===
 
 @router.post("/products")
-async def create_product(product_data: ProductCreate, current_user: dict = Depends(get_current_user)):
+async def create_product(product_data: ProductCreate, current_user: dict = Depends(get_current_user),
+                         connection=Depends(get_catalog_transaction, scope="function")):
     """Создание нового товара"""
     try:
         # Проверяем существование категории
-        category = await fetch_one("SELECT id FROM categories WHERE id = $1", product_data.category_id)
+        category = await fetch_one("SELECT id FROM categories WHERE id = $1", product_data.category_id,
+                                   connection=connection)
         if not category:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
@@ -412,7 +584,8 @@ async def create_product(product_data: ProductCreate, current_user: dict = Depen
             VALUES ($1, $2, $3, $4, $5, $6)
             RETURNING id
         """, product_data.name, product_data.description, product_data.price,
-            product_data.category_id, current_user['id'], product_data.image_url)
+            product_data.category_id, current_user['id'], product_data.image_url,
+            connection=connection)
 
         return {
             "message": "Товар создан успешно",
@@ -425,14 +598,58 @@ async def create_product(product_data: ProductCreate, current_user: dict = Depen
         logger.error(f"Ошибка создания товара: {e}")
         raise HTTPException(status_code=500, detail="Ошибка создания товара")
 
+@router.post("/products/import")
+async def import_products(request: Request, format: Optional[str] = Query(None),
+                          all_or_nothing: bool = Query(False),
+                          current_user: dict = Depends(get_current_user),
+                          connection=Depends(get_catalog_transaction, scope="function")):
+    """Массовый импорт товаров из CSV (с заголовком) или NDJSON.
+
+    Формат берётся из параметра format или заголовка Content-Type. Строки с
+    ошибками пропускаются и перечисляются в ответе; при all_or_nothing=true
+    любая ошибка отменяет весь импорт
+    """
+    file_format = format or detect_format(request.headers.get("content-type"))
+    if file_format not in IMPORT_FORMATS:
+        raise HTTPException(
+            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            detail="Поддерживаются форматы csv и ndjson"
+        )
+
+    try:
+        result = await run_product_import(
+            connection, request.stream(), file_format, current_user['id'], await get_category_ids(),
+            batch_size=settings.product_import_batch_size,
+            max_rows=settings.product_import_max_rows,
+            max_errors=settings.product_import_max_errors
+        )
+
+        if all_or_nothing and result['failed']:
+            # Исключение откатывает транзакцию запроса вместе с загруженными пачками
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail={**result, "imported": 0, "message": "Импорт отменён: в файле есть ошибки"}
+            )
+
+        return {"message": f"Импортировано товаров: {result['imported']}", **result}
+
+    except HTTPException:
+        raise
+    except ImportLimitExceeded as e:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=str(e))
+    except Exception as e:
+        logger.error(f"Ошибка импорта товаров: {e}")
+        raise HTTPException(status_code=500, detail="Ошибка импорта товаров")
+
 @router.put("/products/{product_id}")
-async def update_product(product_id: int, product_data: ProductUpdate, current_user: dict = Depends(get_current_user)):
+async def update_product(product_id: int, product_data: ProductUpdate, current_user: dict = Depends(get_current_user),
+                         connection=Depends(get_catalog_transaction, scope="function")):
     """Обновление товара"""
     try:
         # Проверяем существование товара и принадлежность пользователю
         existing_product = await fetch_one("""
             SELECT id, user_id FROM products WHERE id = $1
-        """, product_id)
+        """, product_id, connection=connection)
 
         if not existing_product:
             raise HTTPException(status_code=404, detail="Товар не найден")
@@ -445,7 +662,8 @@ async def update_product(product_id: int, product_data: ProductUpdate, current_u
 
         # Если указана новая категория, проверяем её существование
         if product_data.category_id:
-            category = await fetch_one("SELECT id FROM categories WHERE id = $1", product_data.category_id)
+            category = await fetch_one("SELECT id FROM categories WHERE id = $1", product_data.category_id,
+                                       connection=connection)
             if not category:
                 raise HTTPException(
                     status_code=status.HTTP_400_BAD_REQUEST,
@@ -475,7 +693,7 @@ async def update_product(product_id: int, product_data: ProductUpdate, current_u
             WHERE id = ${param_counter}
         """
 
-        await execute_query(query, *update_values)
+        await execute_query(query, *update_values, connection=connection)
 
         return {"message": "Товар обновлен успешно"}
 
@@ -486,13 +704,14 @@ async def update_product(product_id: int, product_data: ProductUpdate, current_u
         raise HTTPException(status_code=500, detail="Ошибка обновления товара")
 
 @router.delete("/products/{product_id}")
-async def delete_product(product_id: int, current_user: dict = Depends(get_current_user)):
+async def delete_product(product_id: int, current_user: dict = Depends(get_current_user),
+                         connection=Depends(get_catalog_transaction, scope="function")):
     """Удаление товара"""
     try:
         # Проверяем существование товара и принадлежность пользователю
         existing_product = await fetch_one("""
             SELECT id, user_id FROM products WHERE id = $1
-        """, product_id)
+        """, product_id, connection=connection)
 
         if not existing_product:
             raise HTTPException(status_code=404, detail="Товар не найден")
@@ -504,7 +723,8 @@ async def delete_product(product_id: int, current_user: dict = Depends(get_curre
             )
 
         # Мягкое удаление - помечаем как недоступный
-        await execute_query("UPDATE products SET in_stock = false WHERE id = $1", product_id)
+        await execute_query("UPDATE products SET in_stock = false WHERE id = $1", product_id,
+                            connection=connection)
 
         return {"message": "Товар удален успешно"}
 
@@ -519,18 +739,12 @@ async def delete_product(product_id: int, current_user: dict = Depends(get_curre
 @router.get("/categories")
 async def get_categories():
     """Получение списка всех активных категорий"""
+    async def load():
+        categories = await fetch_all(CATEGORIES_QUERY)
+        return {"categories": categories}
+
     try:
-        categories = await fetch_all("""
-            SELECT c.id, c.name, c.description, c.slug, c.image_url, c.sort_order,
-                   COUNT(p.id) as products_count
-            FROM categories c
-            LEFT JOIN products p ON c.id = p.category_id AND p.in_stock = true
-            WHERE c.is_active = true
-            GROUP BY c.id, c.name, c.description, c.slug, c.image_url, c.sort_order
-            ORDER BY c.sort_order, c.name
-        """)
-
-        return {"categories": [dict(cat) for cat in categories]}
+        return json_response(await catalog_cache.get_or_load("categories", load))
 
     except Exception as e:
         logger.error(f"Ошибка получения категорий: {e}")
@@ -539,19 +753,17 @@ async def get_categories():
 @router.get("/categories/{category_id}")
 async def get_category(category_id: int):
     """Получение информации о категории"""
+    async def load():
+        category = await fetch_one(CATEGORY_QUERY, category_id)
+        return dict(category) if category else None
+
     try:
-        category = await fetch_one("""
-            SELECT c.*, COUNT(p.id) as products_count
-            FROM categories c
-            LEFT JOIN products p ON c.id = p.category_id AND p.in_stock = true
-            WHERE c.id = $1 AND c.is_active = true
-            GROUP BY c.id
-        """, category_id)
+        category = await catalog_cache.get_or_load(("category", category_id), load)
 
         if not category:
             raise HTTPException(status_code=404, detail="Категория не найдена")
 
-        return dict(category)
+        return category
 
     except HTTPException:
         raise
@@ -562,19 +774,17 @@ async def get_category(category_id: int):
 @router.get("/categories/slug/{slug}")
 async def get_category_by_slug(slug: str):
     """Получение категории по slug"""
+    async def load():
+        category = await fetch_one(CATEGORY_BY_SLUG_QUERY, slug)
+        return dict(category) if category else None
+
     try:
-        category = await fetch_one("""
-            SELECT c.*, COUNT(p.id) as products_count
-            FROM categories c
-            LEFT JOIN products p ON c.id = p.category_id AND p.in_stock = true
-            WHERE c.slug = $1 AND c.is_active = true
-            GROUP BY c.id
-        """, slug)
+        category = await catalog_cache.get_or_load(("category_slug", slug), load)
 
         if not category:
             raise HTTPException(status_code=404, detail="Категория не найдена")
 
-        return dict(category)
+        return category
 
     except HTTPException:
         raise
@@ -582,57 +792,183 @@ async def get_category_by_slug(slug: str):
         logger.error(f"Ошибка получения категории: {e}")
         raise HTTPException(status_code=500, detail="Ошибка получения категории")
 
+# === КАТАЛОГ ТОВАРОВ ===
+
+# Фильтры каталога в виде "SELECT 1 ...": из них строятся точный подсчёт
+# и оценка количества строк по плану. $1 - категория, $2 - поисковый запрос
+PRODUCTS_FILTER_QUERY = """
+    SELECT 1
+    FROM products p
+    WHERE p.in_stock = true
+    AND ($1::integer IS NULL OR p.category_id = $1)
+"""
+
+PRODUCTS_SEARCH_FILTER_QUERY = """
+    SELECT 1
+    FROM products p
+    CROSS JOIN websearch_to_tsquery('russian', $2) AS q
+    WHERE p.in_stock = true
+    AND ($1::integer IS NULL OR p.category_id = $1)
+    AND (p.search_vector @@ q OR $2 <% p.name)
+"""
+
+PRODUCTS_COUNT_QUERY = register_query(
+    "products.count", f"SELECT COUNT(*) FROM ({PRODUCTS_FILTER_QUERY}) filtered"
+)
+
+PRODUCTS_SEARCH_COUNT_QUERY = register_query(
+    "products.search_count", f"SELECT COUNT(*) FROM ({PRODUCTS_SEARCH_FILTER_QUERY}) filtered"
+)
+
+# Страницы каталога после курсора и поиска (первая страница - products.page
+# из server.database.repository)
+PRODUCTS_CURSOR_PAGE_QUERY = register_query("products.cursor_page", """
+    SELECT p.id, p.name, p.description, p.price, p.image_url, p.in_stock, p.created_at,
+           c.id as category_id, c.name as category_name, c.slug as category_slug,
+           u.name as author_name,
+           CASE WHEN $5::boolean THEN (
+               SELECT COUNT(*) FROM products p2
+               WHERE p2.in_stock = true AND ($1::integer IS NULL OR p2.category_id = $1)
+           ) END as total_count
+    FROM products p
+    JOIN categories c ON p.category_id = c.id
+    LEFT JOIN users u ON p.user_id = u.id
+    WHERE p.in_stock = true
+    AND ($1::integer IS NULL OR p.category_id = $1)
+    AND (p.created_at, p.id) < ($3::timestamptz, $4::integer)
+    ORDER BY p.created_at DESC, p.id DESC
+    LIMIT $2
+""")
+
+PRODUCTS_SEARCH_PAGE_QUERY = register_query("products.search_page", """
+    SELECT p.id, p.name, p.description, p.price, p.image_url, p.in_stock, p.created_at,
+           c.id as category_id, c.name as category_name, c.slug as category_slug,
+           u.name as author_name,
+           CASE WHEN $5::boolean THEN (
+               SELECT COUNT(*) FROM products p2
+               CROSS JOIN websearch_to_tsquery('russian', $2) AS q2
+               WHERE p2.in_stock = true AND ($1::integer IS NULL OR p2.category_id = $1)
+               AND (p2.search_vector @@ q2 OR $2 <% p2.name)
+           ) END as total_count
+    FROM products p
+    CROSS JOIN websearch_to_tsquery('russian', $2) AS q
+    JOIN categories c ON p.category_id = c.id
+    LEFT JOIN users u ON p.user_id = u.id
+    WHERE p.in_stock = true
+    AND ($1::integer IS NULL OR p.category_id = $1)
+    AND (p.search_vector @@ q OR $2 <% p.name)
+    ORDER BY ts_rank(p.search_vector, q) DESC, word_similarity($2, p.name) DESC,
+             p.created_at DESC, p.id DESC
+    LIMIT $3 OFFSET $4
+""")
+
+
+async def count_products(category_id: Optional[int], search: Optional[str], approximate: bool = False):
+    """Количество товаров по фильтру каталога
+
+    Возвращает пару (total, is_estimate). В приблизительном режиме результат
+    кэшируется на settings.count_cache_ttl секунд, а для выборок больше
+    settings.count_estimate_threshold строк берётся оценка планировщика.
+    """
+    if search:
+        filter_query, count_query = PRODUCTS_SEARCH_FILTER_QUERY, PRODUCTS_SEARCH_COUNT_QUERY
+        args = (category_id, search)
+    else:
+        filter_query, count_query = PRODUCTS_FILTER_QUERY, PRODUCTS_COUNT_QUERY
+        args = (category_id,)
+
+    if not approximate:
+        result = await fetch_one(count_query, *args)
+        return result['count'], False
+
+    key = (category_id, search)
+    cached = count_cache.get(key)
+    if cached:
+        return cached
+
+    total = await estimate_rows(filter_query, *args)
+    is_estimate = total >= settings.count_estimate_threshold
+    if not is_estimate:
+        result = await fetch_one(count_query, *args)
+        total = result['count']
+
+    count_cache.set(key, (total, is_estimate))
+    return total, is_estimate
+
+
 @router.get("/products")
 async def get_products(
         category_id: Optional[int] = None,
         category_slug: Optional[str] = None,
         search: Optional[str] = None,
-        limit: int = Query(default=20, le=100),
-        offset: int = Query(default=0, ge=0)
+        limit: int = Query(default=20, ge=1, le=100),
+        offset: int = Query(default=0, ge=0),
+        cursor: Optional[str] = None,
+        approximate_total: bool = False
 ):
-    """Получение списка товаров с фильтрацией"""
+    """Получение списка товаров с фильтрацией
+
+    Поддерживает два режима пагинации: по `offset` (для обратной совместимости)
+    и по курсору `cursor` из поля `next_cursor` предыдущего ответа. Курсорный
+    режим использует индекс (created_at, id) и не зависит от номера страницы.
+
+    Поиск `search` идёт по полнотекстовому индексу (русская морфология) с
+    подстраховкой триграммами на опечатки в названии. Результаты поиска
+    упорядочены по релевантности и листаются только по `offset`.
+
+    Страница и общее количество возвращаются одним запросом к БД. При
+    `approximate_total=true` для больших выборок отдаётся оценка количества
+    (`total_is_estimate`), а сам подсчёт кэшируется.
+    """
     try:
+        search = search.strip() if search else None
+        cursor_created_at, cursor_id = decode_cursor(cursor) if cursor and not search else (None, None)
+
         # Если передан slug категории, получаем её ID
         category_filter_id = category_id
         if category_slug and not category_id:
-            category = await fetch_one("SELECT id FROM categories WHERE slug = $1", category_slug)
-            if category:
-                category_filter_id = category['id']
-
-        query = """
-            SELECT p.id, p.name, p.description, p.price, p.image_url, p.in_stock,
-                   c.id as category_id, c.name as category_name, c.slug as category_slug,
-                   u.name as author_name
-            FROM products p
-            JOIN categories c ON p.category_id = c.id
-            LEFT JOIN users u ON p.user_id = u.id
-            WHERE p.in_stock = true
-            AND ($1::integer IS NULL OR p.category_id = $1)
-            AND ($2::text IS NULL OR (p.name ILIKE $2 OR p.description ILIKE $2))
-            ORDER BY p.created_at DESC
-            LIMIT $3 OFFSET $4
-        """
-
-        search_param = f"%{search}%" if search else None
-        products = await fetch_all(query, category_filter_id, search_param, limit, offset)
-
-        # Получаем общее количество товаров для пагинации
-        count_query = """
-            SELECT COUNT(*)
-            FROM products p
-            WHERE p.in_stock = true
-            AND ($1::integer IS NULL OR p.category_id = $1)
-            AND ($2::text IS NULL OR (p.name ILIKE $2 OR p.description ILIKE $2))
-        """
-        total_count = await fetch_one(count_query, category_filter_id, search_param)
-
-        return {
-            "products": [dict(product) for product in products],
-            "total": total_count['count'],
+            category_filter_id = await get_category_id_by_slug(category_slug)
+
+        # Точное количество считаем в запросе страницы, приблизительное - отдельно
+        with_total = not approximate_total
+
+        # Запрашиваем на одну запись больше, чтобы узнать, есть ли следующая страница
+        if search:
+            rows = await fetch_all(PRODUCTS_SEARCH_PAGE_QUERY, category_filter_id, search,
+                                   limit + 1, offset, with_total)
+        elif cursor:
+            rows = await fetch_all(PRODUCTS_CURSOR_PAGE_QUERY, category_filter_id, limit + 1,
+                                   cursor_created_at, cursor_id, with_total)
+        else:
+            rows = await fetch_all(PRODUCTS_PAGE_QUERY, category_filter_id, limit + 1, offset, with_total)
+
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        next_cursor = None
+        if has_more and rows and not search:
+            next_cursor = encode_cursor(rows[-1]['created_at'], rows[-1]['id'])
+
+        is_estimate = False
+        if with_total and rows:
+            total = rows[0]['total_count']
+        elif with_total and offset == 0 and not cursor:
+            total = 0
+        else:
+            # Пустая страница за пределами выборки или приблизительный режим
+            total, is_estimate = await count_products(category_filter_id, search, approximate_total)
+
+        # Служебная колонка total_count отбрасывается - остальное кодируется без обхода jsonable_encoder
+        return json_response({
+            "products": [{k: v for k, v in row.items() if k != 'total_count'} for row in rows],
+            "total": total,
+            "total_is_estimate": is_estimate,
             "limit": limit,
-            "offset": offset
-        }
+            "offset": offset,
+            "next_cursor": next_cursor
+        })
 
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Ошибка получения товаров: {e}")
         raise HTTPException(status_code=500, detail="Ошибка получения товаров")
@@ -641,19 +977,12 @@ async def get_products(
 async def get_product(product_id: int):
     """Получение информации о товаре"""
     try:
-        product = await fetch_one("""
-            SELECT p.*, c.id as category_id, c.name as category_name, c.slug as category_slug,
-                   u.name as author_name
-            FROM products p
-            JOIN categories c ON p.category_id = c.id
-            LEFT JOIN users u ON p.user_id = u.id
-            WHERE p.id = $1
-        """, product_id)
+        product = await fetch_one(PRODUCT_QUERY, product_id)
 
         if not product:
             raise HTTPException(status_code=404, detail="Товар не найден")
 
-        return dict(product)
+        return json_response(product)
 
     except HTTPException:
         raise
@@ -663,23 +992,25 @@ async def get_product(product_id: int):
 
 # === ИЗБРАННОЕ ===
 
+FAVORITES_QUERY = register_query("favorites.list", """
+    SELECT p.id, p.name, p.description, p.price, p.image_url,
+           c.id as category_id, c.name as category_name, c.slug as category_slug,
+           u.name as author_name
+    FROM favorites f
+    JOIN products p ON f.product_id = p.id
+    JOIN categories c ON p.category_id = c.id
+    LEFT JOIN users u ON p.user_id = u.id
+    WHERE f.user_id = $1
+    ORDER BY f.created_at DESC
+""")
+
 @router.get("/favorites")
-async def get_favorites(current_user: dict = Depends(get_current_user)):
+async def get_favorites(response: Response, current_user: dict = Depends(get_current_user)):
     """Получение списка избранных товаров пользователя"""
     try:
-        favorites = await fetch_all("""
-            SELECT p.id, p.name, p.description, p.price, p.image_url,
-                   c.id as category_id, c.name as category_name, c.slug as category_slug,
-                   u.name as author_name
-            FROM favorites f
-            JOIN products p ON f.product_id = p.id
-            JOIN categories c ON p.category_id = c.id
-            LEFT JOIN users u ON p.user_id = u.id
-            WHERE f.user_id = $1
-            ORDER BY f.created_at DESC
-        """, current_user['id'])
-
-        return {"favorites": [dict(fav) for fav in favorites]}
+        favorites = await fetch_all(FAVORITES_QUERY, current_user['id'])
+
+        return json_response({"favorites": favorites}, response)
 
     except Exception as e:
         logger.error(f"Ошибка получения избранного: {e}")
@@ -687,26 +1018,28 @@ async def get_favorites(current_user: dict = Depends(get_current_user)):
 
 # === КОРЗИНА ===
 
+CART_QUERY = register_query("cart.list", """
+    SELECT c.id, c.quantity, p.id as product_id, p.name, p.price, p.image_url,
+           u.name as author_name
+    FROM cart_items c
+    JOIN products p ON c.product_id = p.id
+    LEFT JOIN users u ON p.user_id = u.id
+    WHERE c.user_id = $1
+    ORDER BY c.created_at DESC
+""")
+
 @router.get("/cart")
-async def get_cart(current_user: dict = Depends(get_current_user)):
+async def get_cart(response: Response, current_user: dict = Depends(get_current_user)):
     """Получение содержимого корзины пользователя"""
     try:
-        cart_items = await fetch_all("""
-            SELECT c.id, c.quantity, p.id as product_id, p.name, p.price, p.image_url,
-                   u.name as author_name
-            FROM cart_items c
-            JOIN products p ON c.product_id = p.id
-            LEFT JOIN users u ON p.user_id = u.id
-            WHERE c.user_id = $1
-            ORDER BY c.created_at DESC
-        """, current_user['id'])
+        cart_items = await fetch_all(CART_QUERY, current_user['id'])
 
         total = sum(item['price'] * item['quantity'] for item in cart_items)
 
-        return {
-            "cart_items": [dict(item) for item in cart_items],
+        return json_response({
+            "cart_items": cart_items,
             "total": float(total)
-        }
+        }, response)
 
     except Exception as e:
         logger.error(f"Ошибка получения корзины: {e}")
@@ -714,48 +1047,95 @@ async def get_cart(current_user: dict = Depends(get_current_user)):
 
 # === ОТЗЫВЫ ===
 
+REVIEWS_QUERY = register_query("reviews.page", """
+    SELECT r.id, r.rating, r.comment, r.created_at, u.name as user_name
+    FROM reviews r
+    JOIN users u ON r.user_id = u.id
+    WHERE r.product_id = $1
+    ORDER BY r.created_at DESC, r.id DESC
+    LIMIT $2
+""")
+
+REVIEWS_CURSOR_QUERY = register_query("reviews.cursor_page", """
+    SELECT r.id, r.rating, r.comment, r.created_at, u.name as user_name
+    FROM reviews r
+    JOIN users u ON r.user_id = u.id
+    WHERE r.product_id = $1
+    AND (r.created_at, r.id) < ($3::timestamptz, $4::integer)
+    ORDER BY r.created_at DESC, r.id DESC
+    LIMIT $2
+""")
+
+PRODUCT_RATING_QUERY = register_query("reviews.rating", """
+    SELECT reviews_count, rating_sum, rating_1, rating_2, rating_3, rating_4, rating_5
+    FROM product_ratings
+    WHERE product_id = $1
+""")
+
 @router.get("/reviews/{product_id}")
-async def get_product_reviews(product_id: int):
-    """Получение отзывов о товаре"""
+async def get_product_reviews(
+        product_id: int,
+        limit: int = Query(default=20, ge=1, le=100),
+        cursor: Optional[str] = None,
+        connection=Depends(get_connection, scope="function")
+):
+    """Получение отзывов о товаре
+
+    Средний рейтинг и распределение оценок берутся из таблицы product_ratings,
+    которую поддерживает триггер. Сами отзывы отдаются страницами по курсору
+    `cursor` из поля `next_cursor` предыдущего ответа.
+    """
     try:
-        reviews = await fetch_all("""
-            SELECT r.id, r.rating, r.comment, r.created_at, u.name as user_name
-            FROM reviews r
-            JOIN users u ON r.user_id = u.id
-            WHERE r.product_id = $1
-            ORDER BY r.created_at DESC
-        """, product_id)
-
-        # Вычисляем средний рейтинг
-        if reviews:
-            avg_rating = sum(review['rating'] for review in reviews) / len(reviews)
+        if cursor:
+            cursor_created_at, cursor_id = decode_cursor(cursor)
+            reviews = await fetch_all(REVIEWS_CURSOR_QUERY, product_id, limit + 1,
+                                      cursor_created_at, cursor_id, connection=connection)
         else:
-            avg_rating = 0
+            reviews = await fetch_all(REVIEWS_QUERY, product_id, limit + 1, connection=connection)
 
-        return {
-            "reviews": [dict(review) for review in reviews],
+        has_more = len(reviews) > limit
+        reviews = reviews[:limit]
+        next_cursor = None
+        if has_more:
+            next_cursor = encode_cursor(reviews[-1]['created_at'], reviews[-1]['id'])
+
+        rating = await fetch_one(PRODUCT_RATING_QUERY, product_id, connection=connection)
+        total_reviews = rating['reviews_count'] if rating else 0
+        avg_rating = rating['rating_sum'] / total_reviews if total_reviews else 0
+
+        return json_response({
+            "reviews": reviews,
             "average_rating": round(avg_rating, 1),
-            "total_reviews": len(reviews)
-        }
+            "total_reviews": total_reviews,
+            "rating_distribution": {
+                str(stars): rating[f'rating_{stars}'] if rating else 0 for stars in range(1, 6)
+            },
+            "limit": limit,
+            "next_cursor": next_cursor
+        })
 
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Ошибка получения отзывов: {e}")
         raise HTTPException(status_code=500, detail="Ошибка получения отзывов")
 
 
 @router.post("/reviews/{product_id}")
-async def create_review(product_id: int, review_data: ReviewCreate, current_user: dict = Depends(get_current_user)):
+async def create_review(product_id: int, review_data: ReviewCreate, current_user: dict = Depends(get_current_user),
+                        connection=Depends(get_transaction, scope="function")):
     """Создание отзыва для товара"""
     try:
         # Проверяем существование товара
-        product = await fetch_one("SELECT id FROM products WHERE id = $1", product_id)
+        product = await fetch_one("SELECT id FROM products WHERE id = $1", product_id,
+                                  connection=connection)
         if not product:
             raise HTTPException(status_code=404, detail="Товар не найден")
 
         # Проверяем, не оставлял ли пользователь уже отзыв на этот товар
         existing_review = await fetch_one("""
             SELECT id FROM reviews WHERE product_id = $1 AND user_id = $2
-        """, product_id, current_user['id'])
+        """, product_id, current_user['id'], connection=connection)
 
         if existing_review:
             raise HTTPException(
@@ -768,7 +1148,8 @@ async def create_review(product_id: int, review_data: ReviewCreate, current_user
             INSERT INTO reviews (product_id, user_id, rating, comment)
             VALUES ($1, $2, $3, $4)
             RETURNING id
-        """, product_id, current_user['id'], review_data.rating, review_data.comment)
+        """, product_id, current_user['id'], review_data.rating, review_data.comment,
+            connection=connection)
 
         return {
             "message": "Отзыв успешно добавлен",
@@ -782,16 +1163,18 @@ async def create_review(product_id: int, review_data: ReviewCreate, current_user
         raise HTTPException(status_code=500, detail="Ошибка создания отзыва")
 
 @router.post("/profile/password")
-async def change_password(password_data: PasswordChange, current_user: dict = Depends(get_current_user)):
+async def change_password(password_data: PasswordChange, response: Response,
+                          current_user: dict = Depends(get_current_user),
+                          connection=Depends(get_connection, scope="function")):
     """Изменение пароля пользователя"""
     try:
         # Получаем текущий хеш пароля
         user = await fetch_one("""
             SELECT password_hash FROM users WHERE id = $1
-        """, current_user['id'])
+        """, current_user['id'], connection=connection)
 
         # Проверяем текущий пароль
-        if not verify_password(password_data.current_password, user['password_hash']):
+        if not await verify_password(password_data.current_password, user['password_hash']):
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="Неверный текущий пароль"
@@ -805,18 +1188,23 @@ async def change_password(password_data: PasswordChange, current_user: dict = De
             )
 
         # Хешируем новый пароль
-        new_password_hash = hash_password(password_data.new_password)
+        new_password_hash = await hash_password(password_data.new_password)
 
         # Обновляем пароль
-        await execute_query("""
-            UPDATE users SET password_hash = $1, updated_at = NOW()
-            WHERE id = $2
-        """, new_password_hash, current_user['id'])
+        await update_password_hash(current_user['id'], new_password_hash, connection=connection)
+
+        # Токены, выданные со старым паролем, больше не принимаются;
+        # текущая сессия получает новый токен
+        token_version = await revoke_user_tokens(current_user['id'], connection=connection)
+        verified_user_cache.pop(current_user['id'])
+        access_token = set_auth_cookie(response, {**current_user, "token_version": token_version})
 
-        return {"message": "Пароль успешно изменен"}
+        return {"message": "Пароль успешно изменен", "access_token": access_token, "token_type": "bearer"}
 
     except HTTPException:
         raise
+    except PasswordHasherBusy:
+        raise HTTPException(status_code=503, detail="Сервер перегружен, попробуйте позже")
     except Exception as e:
         logger.error(f"Ошибка смены пароля: {e}")
         raise HTTPException(status_code=500, detail="Ошибка смены пароля")
\ No newline at end of file
@@ -0,0 +1,85 @@
+"""Кэш в памяти процесса с ограниченным размером и временем жизни записей"""
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, List
+
+# Маркер отсутствия значения (None тоже можно кэшировать)
+_MISSING = object()
+
+# Все созданные кэши - для выдачи статистики
+_caches: List["TTLCache"] = []
+
+
+class TTLCache:
+    """LRU-кэш с TTL и счётчиками попаданий/промахов"""
+
+    def __init__(self, name: str, maxsize: int = 128, ttl: float = 60.0,
+                 clock: Callable[[], float] = time.monotonic):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        # Источник времени (подменяется в тестах)
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        # Номер поколения растёт при каждом сбросе: значение, загруженное
+        # до сброса, не должно попасть в кэш после него
+        self._generation = 0
+        _caches.append(self)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Получение значения; просроченные записи удаляются"""
+        item = self._data.get(key, _MISSING)
+        if item is not _MISSING:
+            expires_at, value = item
+            if expires_at > self.clock():
+                self._data.move_to_end(key)
+                self.hits += 1
+                return value
+            del self._data[key]
+        self.misses += 1
+        return default
+
+    def set(self, key: Hashable, value: Any):
+        """Сохранение значения с вытеснением самых старых записей"""
+        self._data[key] = (self.clock() + self.ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    async def get_or_load(self, key: Hashable, loader: Callable[[], Awaitable[Any]]) -> Any:
+        """Получение значения из кэша или загрузка через loader при промахе"""
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            generation = self._generation
+            value = await loader()
+            if generation == self._generation:
+                self.set(key, value)
+        return value
+
+    def pop(self, key: Hashable):
+        """Удаление одной записи"""
+        self._generation += 1
+        self._data.pop(key, None)
+
+    def clear(self):
+        """Полная очистка кэша"""
+        self._generation += 1
+        self._data.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Статистика кэша"""
+        return {
+            "name": self.name,
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+def get_cache_stats() -> List[Dict[str, Any]]:
+    """Статистика всех кэшей процесса"""
+    return [cache.stats() for cache in _caches]
@@ -0,0 +1,76 @@
+"""Сброс кэшей каталога по уведомлениям других воркеров
+
+Кэши сервера (TTLCache) живут в памяти процесса. Воркер, изменивший
+каталог, сбрасывает свои кэши сам после COMMIT, а остальные узнают об
+изменении из канала catalog_changed (его заполняют триггеры products и
+categories). Пока подписки нет (обрыв соединения), устаревание кэша
+ограничено его TTL
+"""
+import asyncio
+import logging
+from typing import Callable, Optional
+
+import asyncpg
+
+from server.config import settings
+from server.database.db_connection import CATALOG_CHANNEL
+
+logger = logging.getLogger(__name__)
+
+# Задача подписки этого процесса
+listener_task: Optional[asyncio.Task] = None
+
+
+async def listen_catalog_changes(on_change: Callable[[], None]):
+    """Отдельное соединение, слушающее канал изменений каталога;
+    переподключается при обрыве"""
+    delay = 1
+    while True:
+        conn = None
+        try:
+            conn = await asyncpg.connect(settings.database_url)
+            lost = asyncio.Event()
+            conn.add_termination_listener(lambda _: lost.set())
+            await conn.add_listener(CATALOG_CHANNEL, lambda *args: on_change())
+            logger.info(f"🔔 Сервер подписан на канал {CATALOG_CHANNEL}")
+            delay = 1
+
+            # Пока подписки не было, изменения могли пройти незамеченными
+            on_change()
+
+            while not lost.is_set():
+                # Проверяем соединение, чтобы заметить обрыв без закрытия сокета
+                try:
+                    await asyncio.wait_for(lost.wait(), timeout=30)
+                except asyncio.TimeoutError:
+                    await conn.fetchval("SELECT 1", timeout=10)
+            logger.warning(f"Соединение подписки на {CATALOG_CHANNEL} закрыто")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Ошибка подписки на {CATALOG_CHANNEL}: {e}")
+        finally:
+            if conn is not None and not conn.is_closed():
+                await conn.close(timeout=5)
+
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, 60)
+
+
+def start_catalog_listener(on_change: Callable[[], None]):
+    """Запуск подписки в фоне"""
+    global listener_task
+    if listener_task is None:
+        listener_task = asyncio.create_task(listen_catalog_changes(on_change))
+
+
+async def stop_catalog_listener():
+    """Остановка подписки"""
+    global listener_task
+    if listener_task is not None:
+        listener_task.cancel()
+        try:
+            await listener_task
+        except asyncio.CancelledError:
+            pass
+        listener_task = None
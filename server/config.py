@@ -1,8 +1,13 @@
 """Конфигурация приложения"""
+import hashlib
+import logging
 import os
+import secrets
 from dotenv import load_dotenv
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 class Settings:
     """Настройки приложения"""
 
@@ -12,13 +17,85 @@ class Settings:
         self.db_host: str = os.getenv('DB_HOST', 'localhost')
         self.db_port: str = os.getenv('DB_PORT', '5432')
         self.db_name: str = os.getenv('DB_NAME', 'rukami_db')
+        # Политика пула соединений (на процесс сервера или бота)
+        self.db_pool_min_size: int = int(os.getenv('DB_POOL_MIN_SIZE', '1'))
+        self.db_pool_max_size: int = int(os.getenv('DB_POOL_MAX_SIZE', '10'))
+        self.db_pool_max_idle: float = float(os.getenv('DB_POOL_MAX_IDLE', '300'))
+        self.db_command_timeout: float = float(os.getenv('DB_COMMAND_TIMEOUT', '60'))
 
         self.host: str = os.getenv('HOST', '127.0.0.1')
         self.port: int = int(os.getenv('PORT', '8000'))
         self.debug: bool = os.getenv('DEBUG', 'false').lower() == 'true'
+        # Ключ подписи токенов обязателен: случайный ключ свой у каждого воркера
+        # и меняется при перезапуске, и токены перестают действовать
+        self.secret_key: str = os.getenv('SECRET_KEY', '')
+        self.access_token_expire_minutes: int = int(os.getenv('ACCESS_TOKEN_EXPIRE_MINUTES', str(30 * 24 * 60)))
+        self.token_refresh_minutes: int = int(os.getenv('TOKEN_REFRESH_MINUTES', '15'))
+        self.verified_user_cache_ttl: int = int(os.getenv('VERIFIED_USER_CACHE_TTL', '60'))
+        # Хэширование паролей (scrypt): стоимость, потоки и ограничение параллелизма
+        self.password_scrypt_n: int = int(os.getenv('PASSWORD_SCRYPT_N', str(2 ** 14)))
+        self.password_scrypt_r: int = int(os.getenv('PASSWORD_SCRYPT_R', '8'))
+        self.password_scrypt_p: int = int(os.getenv('PASSWORD_SCRYPT_P', '1'))
+        self.password_hash_workers: int = int(os.getenv('PASSWORD_HASH_WORKERS', str(min(4, os.cpu_count() or 1))))
+        self.password_hash_concurrency: int = int(
+            os.getenv('PASSWORD_HASH_CONCURRENCY', str(self.password_hash_workers * 2))
+        )
+        self.password_hash_queue_timeout: float = float(os.getenv('PASSWORD_HASH_QUEUE_TIMEOUT', '5'))
+        # Массовый импорт товаров: размер пачки COPY и ограничения на один файл
+        self.product_import_batch_size: int = int(os.getenv('PRODUCT_IMPORT_BATCH_SIZE', '1000'))
+        self.product_import_max_rows: int = int(os.getenv('PRODUCT_IMPORT_MAX_ROWS', '50000'))
+        self.product_import_max_errors: int = int(os.getenv('PRODUCT_IMPORT_MAX_ERRORS', '100'))
+        # Доступ к /metrics: если задан, требуется заголовок Authorization: Bearer <токен>
+        self.metrics_token: str = os.getenv('METRICS_TOKEN', '')
+        # Трассировка SQL: порог медленного запроса (0 - не логировать), число
+        # повторов одного запроса за HTTP-запрос для предупреждения о N+1 и
+        # хранение последних трассировок для /api/admin/sql-traces
+        self.slow_query_ms: float = float(os.getenv('SLOW_QUERY_MS', '200'))
+        self.n_plus_one_threshold: int = int(os.getenv('N_PLUS_ONE_THRESHOLD', '10'))
+        self.sql_trace: bool = os.getenv('SQL_TRACE', 'false').lower() == 'true'
+        self.sql_trace_keep: int = int(os.getenv('SQL_TRACE_KEEP', '200'))
         # Настройки файлов
         self.upload_folder: str = os.getenv('UPLOAD_FOLDER', 'uploads')
         self.max_file_size: int = int(os.getenv('MAX_FILE_SIZE', '10485760'))
+        # Приблизительный подсчёт товаров в каталоге
+        self.count_estimate_threshold: int = int(os.getenv('COUNT_ESTIMATE_THRESHOLD', '10000'))
+        self.count_cache_ttl: int = int(os.getenv('COUNT_CACHE_TTL', '60'))
+        # Кэш категорий
+        self.category_cache_ttl: int = int(os.getenv('CATEGORY_CACHE_TTL', '300'))
+        self.category_cache_size: int = int(os.getenv('CATEGORY_CACHE_SIZE', '256'))
+        # Telegram бот в режиме вебхука: при заданных BOT_TOKEN и TELEGRAM_WEBHOOK_URL
+        # (публичный адрес сервера) бот работает внутри сервера
+        self.bot_token: str = os.getenv('BOT_TOKEN', '')
+        self.telegram_webhook_url: str = os.getenv('TELEGRAM_WEBHOOK_URL', '')
+        # Секрет должен совпадать во всех процессах сервера, поэтому по умолчанию
+        # он выводится из токена бота
+        self.telegram_webhook_secret: str = os.getenv('TELEGRAM_WEBHOOK_SECRET') or (
+            hashlib.sha256(self.bot_token.encode()).hexdigest()[:32] if self.bot_token else ''
+        )
+        # Рассылка уведомлений ботом
+        self.broadcast_rate: float = float(os.getenv('BROADCAST_RATE', '28'))
+        self.broadcast_workers: int = int(os.getenv('BROADCAST_WORKERS', '8'))
+        self.broadcast_chat_interval: float = float(os.getenv('BROADCAST_CHAT_INTERVAL', '1.0'))
+        # Больше стольких новых товаров одного продавца (например, импорт) -
+        # одно сообщение-сводка вместо сообщения о каждом товаре
+        self.broadcast_group_threshold: int = int(os.getenv('BROADCAST_GROUP_THRESHOLD', '5'))
+        # Сессии и кэш каталога бота
+        self.bot_session_backend: str = os.getenv('BOT_SESSION_BACKEND', 'postgres')
+        self.bot_session_sqlite_path: str = os.getenv('BOT_SESSION_SQLITE_PATH', 'bot_sessions.db')
+        self.bot_session_cache_ttl: float = float(os.getenv('BOT_SESSION_CACHE_TTL', '30'))
+        self.bot_catalog_cache_ttl: float = float(os.getenv('BOT_CATALOG_CACHE_TTL', '300'))
+        # Разделы очереди обновлений вебхука (делятся между воркерами сервера)
+        self.bot_update_partitions: int = int(os.getenv('BOT_UPDATE_PARTITIONS', '32'))
+
+    def ensure_secret_key(self):
+        """Проверка SECRET_KEY при запуске сервера.
+        Без ключа сервер запускается только при DEBUG=true - со случайным ключом"""
+        if self.secret_key:
+            return
+        if not self.debug:
+            raise RuntimeError("Не задан SECRET_KEY (для локальной разработки можно включить DEBUG=true)")
+        self.secret_key = secrets.token_urlsafe(32)
+        logger.warning("⚠️ SECRET_KEY не задан: используется случайный ключ, токены не переживут перезапуск")
 
     @property
     def database_url(self) -> str:
@@ -1,32 +1,133 @@
 """Обновленная конфигурация базы данных с отдельной сущностью категорий"""
+import json
 import logging
-from typing import Optional
+import time
+from typing import Any, Dict, List, Optional
 import asyncpg
 from asyncpg import Pool
 
 from server.config import settings
+from server.database.query_trace import record_query, statement_template
 
 logger = logging.getLogger(__name__)
 
 # Глобальный пул соединений
 db_pool: Optional[Pool] = None
 
-
-async def init_database():
-    """Инициализация базы данных"""
+# Канал LISTEN/NOTIFY с id новых товаров
+NEW_PRODUCTS_CHANNEL = "new_products"
+# Канал LISTEN/NOTIFY об изменении товаров и категорий (имя таблицы)
+CATALOG_CHANNEL = "catalog_changed"
+# Параметр транзакции, отключающий уведомление о каждом новом товаре
+# (массовый импорт отправляет одно уведомление в конце)
+SKIP_PRODUCT_NOTIFY_SETTING = "rukami.skip_product_notify"
+
+# Реестр именованных запросов: имя -> SQL. Они заранее готовятся
+# (prepare) на каждом соединении пула, а fetch_all/fetch_one/execute_query
+# принимают имя запроса вместо текста SQL
+NAMED_QUERIES: Dict[str, str] = {}
+
+# Статистика выполнения именованных запросов: имя -> счётчики
+query_stats: Dict[str, Dict[str, Any]] = {}
+
+
+def register_query(name: str, sql: str) -> str:
+    """Регистрация именованного запроса; возвращает имя для вызова"""
+    NAMED_QUERIES[name] = sql
+    query_stats.setdefault(name, {"calls": 0, "total_ms": 0.0, "max_ms": 0.0, "rows": 0})
+    return name
+
+
+class RukamiConnection(asyncpg.Connection):
+    """Соединение пула с подготовленными именованными запросами.
+
+    Сырые вызовы fetch/fetchrow/fetchval/execute/executemany (в том числе из
+    бота и хранилищ сессий) попадают в трассировку SQL текущего запроса
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.named_statements: Dict[str, asyncpg.prepared_stmt.PreparedStatement] = {}
+        self._trace_paused = False
+
+    async def _traced(self, kind: str, query: str, args, call):
+        if self._trace_paused:
+            return await call
+        started = time.perf_counter()
+        rows = None
+        try:
+            result = await call
+            if kind == "fetch":
+                rows = len(result)
+            elif kind == "fetchrow":
+                rows = 0 if result is None else 1
+            elif kind == "execute" and isinstance(result, str):
+                rows = _status_rows(result)
+            return result
+        finally:
+            record_query(statement_template(query), kind, time.perf_counter() - started, rows, args)
+
+    async def fetch(self, query, *args, **kwargs):
+        return await self._traced("fetch", query, args, super().fetch(query, *args, **kwargs))
+
+    async def fetchrow(self, query, *args, **kwargs):
+        return await self._traced("fetchrow", query, args, super().fetchrow(query, *args, **kwargs))
+
+    async def fetchval(self, query, *args, **kwargs):
+        return await self._traced("fetchval", query, args, super().fetchval(query, *args, **kwargs))
+
+    async def execute(self, query, *args, **kwargs):
+        return await self._traced("execute", query, args, super().execute(query, *args, **kwargs))
+
+    async def executemany(self, command, args, **kwargs):
+        # Для пачки записываем форму первого набора параметров
+        first = next(iter(args), ()) if isinstance(args, (list, tuple)) else ()
+        return await self._traced("executemany", command, first, super().executemany(command, args, **kwargs))
+
+    async def reset(self, *, timeout=None):
+        # Сброс сессии при возврате в пул - служебный, в трассировку не попадает
+        self._trace_paused = True
+        try:
+            await super().reset(timeout=timeout)
+        finally:
+            self._trace_paused = False
+
+
+async def prepare_named_queries(connection: RukamiConnection):
+    """Хук init пула: подготовка всех именованных запросов на новом соединении"""
+    for name, sql in NAMED_QUERIES.items():
+        try:
+            connection.named_statements[name] = await connection.prepare(sql)
+        except asyncpg.PostgresError as e:
+            # Схема ещё не создана - запрос будет подготовлен при первом вызове
+            logger.debug(f"Запрос {name} не подготовлен заранее: {e}")
+
+
+async def init_database(create_schema: bool = True):
+    """Инициализация базы данных.
+    Схему создаёт сервер; отдельный процесс бота подключается с create_schema=False"""
     global db_pool
 
     try:
+        # Единая политика пула для сервера и бота: каждый процесс держит
+        # не больше DB_POOL_MAX_SIZE соединений
         db_pool = await asyncpg.create_pool(
             settings.database_url,
-            min_size=1,
-            max_size=10,
-            command_timeout=60
+            min_size=settings.db_pool_min_size,
+            max_size=settings.db_pool_max_size,
+            max_inactive_connection_lifetime=settings.db_pool_max_idle,
+            command_timeout=settings.db_command_timeout,
+            connection_class=RukamiConnection,
+            init=prepare_named_queries
         )
 
-        # Создаем таблицы
-        async with db_pool.acquire() as connection:
-            await create_tables(connection)
+        if create_schema:
+            # Создаем таблицы
+            async with db_pool.acquire() as connection:
+                await create_tables(connection)
+
+            # Соединения, открытые до создания схемы, пересоздаются с подготовленными запросами
+            await db_pool.expire_connections()
 
         logger.info("✅ База данных успешно инициализирована")
 
@@ -66,6 +167,17 @@ async def create_tables(connection: asyncpg.Connection):
             updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
         );
     """)
+    # Поля Telegram бота: привязка аккаунта, уведомления и блокировка бота пользователем
+    await connection.execute("""
+        ALTER TABLE users
+            ADD COLUMN IF NOT EXISTS telegram_id BIGINT UNIQUE,
+            ADD COLUMN IF NOT EXISTS notifications_enabled BOOLEAN DEFAULT true,
+            ADD COLUMN IF NOT EXISTS bot_blocked_at TIMESTAMP WITH TIME ZONE;
+    """)
+    # Версия токенов: выход и смена пароля увеличивают её, и выпущенные раньше токены не принимаются
+    await connection.execute("""
+        ALTER TABLE users ADD COLUMN IF NOT EXISTS token_version INTEGER NOT NULL DEFAULT 0;
+    """)
 
     # 3. Таблица товаров (добавлено поле user_id)
     await connection.execute("""
@@ -120,11 +232,210 @@ async def create_tables(connection: asyncpg.Connection):
         );
     """)
 
+    # 7. Агрегаты рейтинга товара: количество, сумма оценок и распределение 1-5.
+    # Поддерживаются триггером на reviews в той же транзакции, что и сам отзыв
+    ratings_table_exists = await connection.fetchval("SELECT to_regclass('product_ratings') IS NOT NULL")
+    await connection.execute("""
+        CREATE TABLE IF NOT EXISTS product_ratings (
+            product_id INTEGER PRIMARY KEY REFERENCES products(id) ON DELETE CASCADE,
+            reviews_count INTEGER NOT NULL DEFAULT 0,
+            rating_sum INTEGER NOT NULL DEFAULT 0,
+            rating_1 INTEGER NOT NULL DEFAULT 0,
+            rating_2 INTEGER NOT NULL DEFAULT 0,
+            rating_3 INTEGER NOT NULL DEFAULT 0,
+            rating_4 INTEGER NOT NULL DEFAULT 0,
+            rating_5 INTEGER NOT NULL DEFAULT 0
+        );
+    """)
+    await connection.execute("""
+        CREATE OR REPLACE FUNCTION update_product_rating() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                UPDATE product_ratings SET
+                    reviews_count = reviews_count - 1,
+                    rating_sum = rating_sum - OLD.rating,
+                    rating_1 = rating_1 - (OLD.rating = 1)::int,
+                    rating_2 = rating_2 - (OLD.rating = 2)::int,
+                    rating_3 = rating_3 - (OLD.rating = 3)::int,
+                    rating_4 = rating_4 - (OLD.rating = 4)::int,
+                    rating_5 = rating_5 - (OLD.rating = 5)::int
+                WHERE product_id = OLD.product_id;
+            END IF;
+            IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                INSERT INTO product_ratings AS r
+                    (product_id, reviews_count, rating_sum, rating_1, rating_2, rating_3, rating_4, rating_5)
+                VALUES (NEW.product_id, 1, NEW.rating,
+                        (NEW.rating = 1)::int, (NEW.rating = 2)::int, (NEW.rating = 3)::int,
+                        (NEW.rating = 4)::int, (NEW.rating = 5)::int)
+                ON CONFLICT (product_id) DO UPDATE SET
+                    reviews_count = r.reviews_count + 1,
+                    rating_sum = r.rating_sum + EXCLUDED.rating_sum,
+                    rating_1 = r.rating_1 + EXCLUDED.rating_1,
+                    rating_2 = r.rating_2 + EXCLUDED.rating_2,
+                    rating_3 = r.rating_3 + EXCLUDED.rating_3,
+                    rating_4 = r.rating_4 + EXCLUDED.rating_4,
+                    rating_5 = r.rating_5 + EXCLUDED.rating_5;
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+    """)
+    await connection.execute("DROP TRIGGER IF EXISTS reviews_rating_aggregate ON reviews;")
+    await connection.execute("""
+        CREATE TRIGGER reviews_rating_aggregate
+        AFTER INSERT OR DELETE OR UPDATE OF rating, product_id ON reviews
+        FOR EACH ROW EXECUTE FUNCTION update_product_rating();
+    """)
+    if not ratings_table_exists:
+        await rebuild_rating_aggregates(connection)
+
+    # 8. Счётчики продавца для профиля: товары, товары в наличии и добавления
+    # его товаров в избранное. Поддерживаются триггерами на products и favorites
+    seller_stats_table_exists = await connection.fetchval("SELECT to_regclass('seller_stats') IS NOT NULL")
+    await connection.execute("""
+        CREATE TABLE IF NOT EXISTS seller_stats (
+            user_id INTEGER PRIMARY KEY REFERENCES users(id) ON DELETE CASCADE,
+            products_count INTEGER NOT NULL DEFAULT 0,
+            active_products_count INTEGER NOT NULL DEFAULT 0,
+            favorites_count INTEGER NOT NULL DEFAULT 0
+        );
+    """)
+    # Триггер на products срабатывает до удаления товара: в этот момент его
+    # записи в избранном ещё не удалены каскадом и их можно вычесть у продавца
+    await connection.execute("""
+        CREATE OR REPLACE FUNCTION update_seller_stats_products() RETURNS trigger AS $$
+        DECLARE
+            product_favorites INTEGER := 0;
+        BEGIN
+            IF TG_OP = 'DELETE' OR (TG_OP = 'UPDATE' AND OLD.user_id IS DISTINCT FROM NEW.user_id) THEN
+                SELECT COUNT(*) INTO product_favorites FROM favorites WHERE product_id = OLD.id;
+            END IF;
+            IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                UPDATE seller_stats SET
+                    products_count = products_count - 1,
+                    active_products_count = active_products_count - COALESCE(OLD.in_stock, false)::int,
+                    favorites_count = favorites_count - product_favorites
+                WHERE user_id = OLD.user_id;
+            END IF;
+            IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                INSERT INTO seller_stats AS s (user_id, products_count, active_products_count, favorites_count)
+                VALUES (NEW.user_id, 1, COALESCE(NEW.in_stock, false)::int, product_favorites)
+                ON CONFLICT (user_id) DO UPDATE SET
+                    products_count = s.products_count + 1,
+                    active_products_count = s.active_products_count + EXCLUDED.active_products_count,
+                    favorites_count = s.favorites_count + EXCLUDED.favorites_count;
+            END IF;
+            RETURN OLD;
+        END;
+        $$ LANGUAGE plpgsql;
+    """)
+    await connection.execute("""
+        CREATE OR REPLACE FUNCTION update_seller_stats_favorites() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                UPDATE seller_stats s SET favorites_count = s.favorites_count - 1
+                FROM products p
+                WHERE p.id = OLD.product_id AND s.user_id = p.user_id;
+            END IF;
+            IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                UPDATE seller_stats s SET favorites_count = s.favorites_count + 1
+                FROM products p
+                WHERE p.id = NEW.product_id AND s.user_id = p.user_id;
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+    """)
+    await connection.execute("DROP TRIGGER IF EXISTS products_seller_stats ON products;")
+    await connection.execute("DROP TRIGGER IF EXISTS products_seller_stats_delete ON products;")
+    await connection.execute("DROP TRIGGER IF EXISTS favorites_seller_stats ON favorites;")
+    await connection.execute("""
+        CREATE TRIGGER products_seller_stats
+        AFTER INSERT OR UPDATE OF user_id, in_stock ON products
+        FOR EACH ROW EXECUTE FUNCTION update_seller_stats_products();
+    """)
+    await connection.execute("""
+        CREATE TRIGGER products_seller_stats_delete
+        BEFORE DELETE ON products
+        FOR EACH ROW EXECUTE FUNCTION update_seller_stats_products();
+    """)
+    await connection.execute("""
+        CREATE TRIGGER favorites_seller_stats
+        AFTER INSERT OR DELETE OR UPDATE OF product_id ON favorites
+        FOR EACH ROW EXECUTE FUNCTION update_seller_stats_favorites();
+    """)
+    if not seller_stats_table_exists:
+        await rebuild_seller_stats(connection)
+
+    # 9. Уведомление о новом товаре в наличии (канал слушает Telegram бот)
+    await connection.execute(f"""
+        CREATE OR REPLACE FUNCTION notify_new_product() RETURNS trigger AS $$
+        BEGIN
+            IF current_setting('{SKIP_PRODUCT_NOTIFY_SETTING}', true) = 'on' THEN
+                RETURN NULL;
+            END IF;
+            PERFORM pg_notify('{NEW_PRODUCTS_CHANNEL}', NEW.id::text);
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+    """)
+    await connection.execute("DROP TRIGGER IF EXISTS products_notify_new ON products;")
+    await connection.execute("""
+        CREATE TRIGGER products_notify_new
+        AFTER INSERT ON products
+        FOR EACH ROW WHEN (NEW.in_stock) EXECUTE FUNCTION notify_new_product();
+    """)
+
+    # 10. Уведомление об изменении каталога - по одному на оператор,
+    # одинаковые уведомления внутри транзакции PostgreSQL объединяет
+    await connection.execute(f"""
+        CREATE OR REPLACE FUNCTION notify_catalog_changed() RETURNS trigger AS $$
+        BEGIN
+            PERFORM pg_notify('{CATALOG_CHANNEL}', TG_TABLE_NAME);
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+    """)
+    for table in ("products", "categories"):
+        await connection.execute(f"DROP TRIGGER IF EXISTS {table}_notify_catalog ON {table};")
+        await connection.execute(f"""
+            CREATE TRIGGER {table}_notify_catalog
+            AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON {table}
+            FOR EACH STATEMENT EXECUTE FUNCTION notify_catalog_changed();
+        """)
+
+    # Полнотекстовый поиск по товарам: поддерживаемый СУБД столбец tsvector
+    # (русская конфигурация, название весомее описания) и триграммы для опечаток
+    await connection.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm;")
+    await connection.execute("""
+        ALTER TABLE products ADD COLUMN IF NOT EXISTS search_vector tsvector
+        GENERATED ALWAYS AS (
+            setweight(to_tsvector('russian', coalesce(name, '')), 'A') ||
+            setweight(to_tsvector('russian', coalesce(description, '')), 'B')
+        ) STORED;
+    """)
+
     # Создание индексов
     await connection.execute("CREATE INDEX IF NOT EXISTS idx_products_category ON products(category_id);")
+    # Составные индексы для курсорной пагинации каталога по (created_at, id)
+    await connection.execute("""
+        CREATE INDEX IF NOT EXISTS idx_products_created_id
+        ON products(created_at DESC, id DESC) WHERE in_stock = true;
+    """)
+    await connection.execute("""
+        CREATE INDEX IF NOT EXISTS idx_products_category_created_id
+        ON products(category_id, created_at DESC, id DESC) WHERE in_stock = true;
+    """)
+    await connection.execute("CREATE INDEX IF NOT EXISTS idx_products_search ON products USING GIN(search_vector);")
+    await connection.execute("CREATE INDEX IF NOT EXISTS idx_products_name_trgm ON products USING GIN(name gin_trgm_ops);")
     await connection.execute("CREATE INDEX IF NOT EXISTS idx_favorites_user ON favorites(user_id);")
+    await connection.execute("CREATE INDEX IF NOT EXISTS idx_favorites_product ON favorites(product_id);")
     await connection.execute("CREATE INDEX IF NOT EXISTS idx_cart_user ON cart_items(user_id);")
     await connection.execute("CREATE INDEX IF NOT EXISTS idx_reviews_product ON reviews(product_id);")
+    await connection.execute("""
+        CREATE INDEX IF NOT EXISTS idx_reviews_product_created_id
+        ON reviews(product_id, created_at DESC, id DESC);
+    """)
     await connection.execute("CREATE INDEX IF NOT EXISTS idx_categories_slug ON categories(slug);")
 
     # Добавляем тестовые данные, если таблицы пустые
@@ -139,6 +450,44 @@ async def create_tables(connection: asyncpg.Connection):
     logger.info("✅ Таблицы созданы успешно")
 
 
+async def rebuild_rating_aggregates(connection: asyncpg.Connection):
+    """Полный пересчёт агрегатов рейтинга по таблице отзывов"""
+    async with connection.transaction():
+        await connection.execute("LOCK TABLE reviews IN SHARE MODE")
+        await connection.execute("DELETE FROM product_ratings")
+        await connection.execute("""
+            INSERT INTO product_ratings
+                (product_id, reviews_count, rating_sum, rating_1, rating_2, rating_3, rating_4, rating_5)
+            SELECT product_id, COUNT(*), SUM(rating),
+                   COUNT(*) FILTER (WHERE rating = 1), COUNT(*) FILTER (WHERE rating = 2),
+                   COUNT(*) FILTER (WHERE rating = 3), COUNT(*) FILTER (WHERE rating = 4),
+                   COUNT(*) FILTER (WHERE rating = 5)
+            FROM reviews
+            GROUP BY product_id
+        """)
+    logger.info("✅ Агрегаты рейтинга товаров пересчитаны")
+
+
+async def rebuild_seller_stats(connection: asyncpg.Connection):
+    """Полный пересчёт счётчиков продавцов по товарам и избранному"""
+    async with connection.transaction():
+        await connection.execute("LOCK TABLE products, favorites IN SHARE MODE")
+        await connection.execute("DELETE FROM seller_stats")
+        await connection.execute("""
+            INSERT INTO seller_stats (user_id, products_count, active_products_count, favorites_count)
+            SELECT p.user_id, COUNT(*), COUNT(*) FILTER (WHERE p.in_stock),
+                   COALESCE(SUM(f.favorites_count), 0)
+            FROM products p
+            LEFT JOIN (
+                SELECT product_id, COUNT(*) AS favorites_count
+                FROM favorites
+                GROUP BY product_id
+            ) f ON f.product_id = p.id
+            GROUP BY p.user_id
+        """)
+    logger.info("✅ Счётчики продавцов пересчитаны")
+
+
 async def add_sample_categories(connection: asyncpg.Connection):
     """Добавление тестовых категорий"""
     sample_categories = [
@@ -196,6 +545,7 @@ async def close_database_pool():
     """Закрытие пула соединений"""
     global db_pool
     if db_pool:
+        log_query_stats()
         await db_pool.close()
         db_pool = None
         logger.info("✅ Соединения с базой данных закрыты")
@@ -209,23 +559,155 @@ async def get_db_connection():
     return db_pool.acquire()
 
 
+def _status_rows(status: str) -> int:
+    """Количество затронутых строк из статуса команды ("UPDATE 3" -> 3)"""
+    try:
+        return int(status.rsplit(" ", 1)[-1])
+    except (ValueError, AttributeError):
+        return 0
+
+
+async def _get_statement(connection, name: str, refresh: bool = False):
+    """Подготовленный запрос на соединении (готовится при первом обращении)"""
+    statement = None if refresh else connection.named_statements.get(name)
+    if statement is None:
+        statement = await connection.prepare(NAMED_QUERIES[name])
+        connection.named_statements[name] = statement
+    return statement
+
+
+async def _run_named(connection, kind: str, name: str, args):
+    """Выполнение именованного запроса с учётом статистики"""
+    # У PreparedStatement нет execute - команды выполняются через fetch
+    method = "fetch" if kind == "execute" else kind
+
+    started = time.perf_counter()
+    rows = None
+    try:
+        statement = await _get_statement(connection, name)
+        try:
+            result = await getattr(statement, method)(*args)
+        except asyncpg.InvalidCachedStatementError:
+            # Схема таблиц изменилась после подготовки - готовим запрос заново.
+            # Внутри транзакции ошибка уже прервала её, и повтор невозможен:
+            # сбрасываем запрос, а транзакцию повторяет вызывающий код
+            if connection.is_in_transaction():
+                connection.named_statements.pop(name, None)
+                raise
+            statement = await _get_statement(connection, name, refresh=True)
+            result = await getattr(statement, method)(*args)
+
+        if kind == "fetch":
+            rows = len(result)
+        elif kind == "fetchrow":
+            rows = 0 if result is None else 1
+        else:
+            result = statement.get_statusmsg()
+            rows = _status_rows(result)
+    finally:
+        elapsed = time.perf_counter() - started
+        record_query(name, kind, elapsed, rows, args)
+
+    elapsed_ms = elapsed * 1000
+    stats = query_stats[name]
+    stats["calls"] += 1
+    stats["total_ms"] += elapsed_ms
+    stats["max_ms"] = max(stats["max_ms"], elapsed_ms)
+    stats["rows"] += rows
+    return result
+
+
+async def _run(connection, kind: str, query: str, args):
+    """Выполнение запроса: именованного - через подготовленный запрос.
+    Сырой SQL трассирует само соединение (RukamiConnection)"""
+    if query in NAMED_QUERIES:
+        return await _run_named(connection, kind, query, args)
+    return await getattr(connection, kind)(query, *args)
+
+
 # Утилиты для работы с БД
-async def fetch_all(query: str, *args):
-    """Выполнение SELECT запроса с получением всех результатов"""
-    global db_pool
+# Если передан connection (например, из зависимости get_connection),
+# запрос выполняется на нём, иначе соединение берётся из пула на один запрос
+async def fetch_all(query: str, *args, connection=None):
+    """Выполнение SELECT запроса с получением всех результатов
+
+    query - текст SQL или имя запроса из register_query
+    """
+    if connection is not None:
+        return await _run(connection, "fetch", query, args)
     async with db_pool.acquire() as connection:
-        return await connection.fetch(query, *args)
+        return await _run(connection, "fetch", query, args)
 
 
-async def fetch_one(query: str, *args):
+async def fetch_one(query: str, *args, connection=None):
     """Выполнение SELECT запроса с получением одного результата"""
-    global db_pool
+    if connection is not None:
+        return await _run(connection, "fetchrow", query, args)
     async with db_pool.acquire() as connection:
-        return await connection.fetchrow(query, *args)
+        return await _run(connection, "fetchrow", query, args)
 
 
-async def execute_query(query: str, *args):
+async def execute_query(query: str, *args, connection=None):
     """Выполнение INSERT/UPDATE/DELETE запроса"""
+    if connection is not None:
+        return await _run(connection, "execute", query, args)
+    async with db_pool.acquire() as connection:
+        return await _run(connection, "execute", query, args)
+
+
+async def get_connection():
+    """Зависимость FastAPI: одно соединение пула на весь запрос.
+    Подключается как Depends(get_connection, scope="function") - соединение
+    возвращается в пул до отправки ответа, а не после"""
+    async with db_pool.acquire() as connection:
+        yield connection
+
+
+async def get_transaction():
+    """Зависимость FastAPI: соединение с транзакцией на весь запрос
+
+    Транзакция фиксируется после успешного выполнения обработчика и
+    откатывается при любом исключении, в том числе HTTPException.
+    Подключается как Depends(get_transaction, scope="function"): иначе
+    FastAPI завершает зависимость после отправки ответа - клиент получает
+    200 до COMMIT и не узнаёт об ошибке фиксации.
+    """
+    async with db_pool.acquire() as connection:
+        async with connection.transaction():
+            yield connection
+
+
+def get_query_stats() -> List[Dict[str, Any]]:
+    """Статистика именованных запросов, самые нагружающие БД - первыми"""
+    result = []
+    for name, stats in query_stats.items():
+        calls = stats["calls"]
+        result.append({
+            "name": name,
+            "calls": calls,
+            "total_ms": round(stats["total_ms"], 3),
+            "avg_ms": round(stats["total_ms"] / calls, 3) if calls else 0.0,
+            "max_ms": round(stats["max_ms"], 3),
+            "rows": stats["rows"],
+        })
+    return sorted(result, key=lambda item: item["total_ms"], reverse=True)
+
+
+def log_query_stats():
+    """Вывод статистики именованных запросов в лог"""
+    for item in get_query_stats():
+        if item["calls"]:
+            logger.info(
+                f"📈 {item['name']}: вызовов={item['calls']}, всего={item['total_ms']} мс, "
+                f"среднее={item['avg_ms']} мс, макс={item['max_ms']} мс, строк={item['rows']}"
+            )
+
+
+async def estimate_rows(query: str, *args) -> int:
+    """Оценка количества строк запроса по плану выполнения (без его выполнения)"""
     global db_pool
     async with db_pool.acquire() as connection:
-        return await connection.execute(query, *args)
\ No newline at end of file
+        plan = await connection.fetchval(f"EXPLAIN (FORMAT JSON) {query}", *args)
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
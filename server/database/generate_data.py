@@ -0,0 +1,338 @@
+"""Генератор синтетических данных для проверки производительности
+
+Заполняет базу пользователями, товарами, избранным, корзинами и отзывами
+в объёмах, близких к рабочим. Популярность товаров, размер категорий и
+каталогов продавцов распределены по закону Ципфа, активность покупателей -
+логнормально: немногие товары и пользователи дают большую часть избранного,
+корзин и отзывов. Данные загружаются через COPY и при одинаковом --seed
+совпадают полностью. Итоговое число записей в избранном, корзинах и отзывах
+близко к заданному, но не точно равно ему.
+
+Пример:
+    python -m server.database.generate_data --users 200000 --products 1000000 \\
+        --favorites 10000000 --cart-items 500000 --reviews 2000000 --seed 42 --truncate
+"""
+import argparse
+import asyncio
+import bisect
+import itertools
+import logging
+import math
+import random
+import time
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+from typing import Callable, Iterator, List, Sequence
+
+import asyncpg
+
+from server.config import settings
+from server.database.db_connection import (
+    CATALOG_CHANNEL, create_tables, rebuild_rating_aggregates, rebuild_seller_stats
+)
+from server.passwords import hash_password
+
+logger = logging.getLogger(__name__)
+
+# Конец интервала дат создания записей: фиксирован, чтобы данные
+# не зависели от дня запуска
+END_DATE = datetime(2025, 1, 1, tzinfo=timezone.utc)
+
+FIRST_NAMES = ["Мария", "Анна", "Елена", "Ольга", "Наталья", "Ирина", "Светлана", "Татьяна",
+               "Алексей", "Дмитрий", "Сергей", "Андрей", "Иван", "Михаил", "Павел", "Николай"]
+LAST_NAMES = ["Петрова", "Смирнова", "Козлова", "Иванова", "Соколова", "Попова", "Лебедева",
+              "Новикова", "Морозова", "Волкова", "Васильева", "Фёдорова", "Орлова", "Зайцева"]
+CITIES = ["Москва", "Санкт-Петербург", "Казань", "Екатеринбург", "Новосибирск", "Нижний Новгород",
+          "Самара", "Ростов-на-Дону", "Краснодар", "Пермь", "Воронеж", "Томск"]
+
+ADJECTIVES = ["Керамическая", "Вязаная", "Деревянная", "Расписная", "Льняная", "Плетёная",
+              "Глиняная", "Кожаная", "Войлочная", "Серебряная", "Ароматная", "Авторская"]
+NOUNS = ["ваза", "шкатулка", "сумка", "свеча", "игрушка", "подушка", "кружка", "тарелка",
+         "брошь", "салфетка", "корзина", "картина", "подвеска", "панно", "кукла", "мыльница"]
+THEMES = ["Закат", "Облака", "Лесная сказка", "Север", "Весна", "Морской бриз", "Уют",
+          "Полночь", "Вишнёвый сад", "Туман", "Лаванда", "Осень"]
+DESCRIPTION_PARTS = [
+    "Изделие ручной работы в единственном экземпляре.",
+    "Выполнено из натуральных материалов.",
+    "Подойдёт для подарка и украшения интерьера.",
+    "Каждая деталь проработана вручную.",
+    "Возможна доработка под ваш размер.",
+    "Покрыто защитным составом, не боится влаги.",
+    "Упаковано в подарочную коробку.",
+    "Цвет может немного отличаться от фотографии.",
+]
+REVIEW_COMMENTS = [
+    "Очень понравилось, спасибо мастеру!", "Качество отличное, рекомендую.",
+    "Пришло быстро, упаковано аккуратно.", "Выглядит даже лучше, чем на фото.",
+    "Неплохо, но цвет немного другой.", "Размер оказался меньше, чем ожидала.",
+    "Прекрасный подарок, все в восторге.", "Долго шла доставка.",
+]
+
+# Веса оценок 1..5: отзывы на маркетплейсах смещены к высоким оценкам
+RATING_WEIGHTS = [4, 4, 9, 28, 55]
+
+# Разброс активности покупателей (сигма логнормального распределения)
+ACTIVITY_SIGMA = 1.2
+
+
+def zipf_weights(n: int, s: float) -> Iterator[float]:
+    """Веса рангов 1..n по закону Ципфа с показателем s"""
+    return (1.0 / (rank ** s) for rank in range(1, n + 1))
+
+
+def lognormal_weights(rng: random.Random, n: int, sigma: float) -> Iterator[float]:
+    return (rng.lognormvariate(0.0, sigma) for _ in range(n))
+
+
+class SkewedChoice:
+    """Выбор элементов с заданными весами (weights(n) -> веса в порядке рангов).
+    Ранги назначаются элементам в случайном порядке, поэтому популярность
+    не связана с id"""
+
+    def __init__(self, rng: random.Random, items: Sequence[int], weights: Callable[[int], Iterator[float]]):
+        self.rng = rng
+        self.items = list(items)
+        rng.shuffle(self.items)
+        self.cum_weights = list(itertools.accumulate(weights(len(self.items))))
+        self.total = self.cum_weights[-1]
+
+    def weight_share(self, index: int) -> float:
+        """Доля веса элемента с рангом index (от 0)"""
+        previous = self.cum_weights[index - 1] if index else 0.0
+        return (self.cum_weights[index] - previous) / self.total
+
+    def __call__(self) -> int:
+        return self.items[bisect.bisect(self.cum_weights, self.rng.random() * self.total)]
+
+
+def spread_counts(rng: random.Random, chooser: SkewedChoice, total: int) -> Iterator[tuple]:
+    """Распределение total событий по элементам пропорционально их весу:
+    (элемент, количество) с вероятностным округлением"""
+    for index, item in enumerate(chooser.items):
+        expected = total * chooser.weight_share(index)
+        count = int(expected)
+        if rng.random() < expected - count:
+            count += 1
+        if count:
+            yield item, count
+
+
+def random_timestamp(rng: random.Random, days: int) -> datetime:
+    """Случайный момент за последние days дней до END_DATE"""
+    return END_DATE - timedelta(seconds=rng.random() * days * 86400)
+
+
+def generate_users(rng: random.Random, count: int, first_id: int, password_hash: str, days: int) -> Iterator[tuple]:
+    for i in range(count):
+        number = first_id + i
+        created_at = random_timestamp(rng, days)
+        yield (
+            f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}",
+            f"user{number}@example.test",
+            f"+79{rng.randrange(10 ** 9):09d}",
+            password_hash,
+            f"г. {rng.choice(CITIES)}, ул. Ремесленная, д. {rng.randint(1, 200)}",
+            created_at,
+            created_at,
+        )
+
+
+def generate_products(rng: random.Random, count: int, choose_category: Callable[[], int],
+                      choose_seller: Callable[[], int], days: int) -> Iterator[tuple]:
+    # Даты создания растут вместе с id, как при обычном добавлении товаров
+    start = END_DATE - timedelta(days=days)
+    step = timedelta(days=days) / max(count, 1)
+    for i in range(count):
+        created_at = start + step * i + timedelta(seconds=rng.random() * step.total_seconds())
+        # Логнормальное распределение цен: медиана около 2000 руб., редкие дорогие изделия
+        price = Decimal(f"{min(math.exp(rng.gauss(7.6, 0.8)), 999999):.2f}")
+        yield (
+            f"{rng.choice(ADJECTIVES)} {rng.choice(NOUNS)} '{rng.choice(THEMES)}'",
+            " ".join(rng.sample(DESCRIPTION_PARTS, rng.randint(2, 4))),
+            price,
+            choose_category(),
+            choose_seller(),
+            f"product-{i % 500}.jpg",
+            rng.random() < 0.9,
+            created_at,
+            created_at,
+        )
+
+
+def generate_user_products(rng: random.Random, users: SkewedChoice, products: SkewedChoice,
+                           total: int, make_row: Callable[[int, int], tuple]) -> Iterator[tuple]:
+    """Пары (пользователь, товар) без повторов внутри пользователя: активные
+    пользователи получают больше записей, популярные товары встречаются чаще"""
+    max_per_user = len(products.items)
+    for user_id, count in spread_counts(rng, users, total):
+        chosen = set()
+        attempts = 0
+        target = min(count, max_per_user)
+        while len(chosen) < target and attempts < target * 3:
+            chosen.add(products())
+            attempts += 1
+        for product_id in chosen:
+            yield make_row(user_id, product_id)
+
+
+async def copy_rows(connection: asyncpg.Connection, table: str, columns: List[str], rows: Iterator[tuple]) -> int:
+    """Загрузка строк через COPY с замером скорости"""
+    started = time.perf_counter()
+    result = await connection.copy_records_to_table(table, records=rows, columns=columns)
+    count = int(result.split()[-1])
+    elapsed = time.perf_counter() - started
+    logger.info(f"📥 {table}: {count} строк за {elapsed:.1f} с ({count / max(elapsed, 1e-9):.0f} строк/с)")
+    return count
+
+
+async def fetch_ids(connection: asyncpg.Connection, table: str, after_id: int = 0) -> List[int]:
+    rows = await connection.fetch(f"SELECT id FROM {table} WHERE id > $1 ORDER BY id", after_id)
+    return [row['id'] for row in rows]
+
+
+async def disable_triggers(connection: asyncpg.Connection) -> List[str]:
+    """Отключение триггеров на время загрузки: агрегаты пересчитываются
+    целиком после неё, а уведомления о каждом товаре не нужны.
+    Возвращает таблицы, на которых триггеры нужно включить обратно"""
+    try:
+        await connection.execute("SET session_replication_role = replica")
+        return []
+    except asyncpg.InsufficientPrivilegeError:
+        # Без прав суперпользователя отключаем только пользовательские триггеры
+        # (проверки внешних ключей продолжают работать)
+        tables = ["products", "favorites", "reviews"]
+        for table in tables:
+            await connection.execute(f"ALTER TABLE {table} DISABLE TRIGGER USER")
+        return tables
+
+
+async def enable_triggers(connection: asyncpg.Connection, tables: List[str]):
+    await connection.execute("SET session_replication_role = DEFAULT")
+    for table in tables:
+        await connection.execute(f"ALTER TABLE {table} ENABLE TRIGGER USER")
+
+
+async def generate(args: argparse.Namespace):
+    rng = random.Random(args.seed)
+    connection = await asyncpg.connect(settings.database_url)
+    try:
+        await create_tables(connection)
+
+        if args.truncate:
+            await connection.execute("""
+                TRUNCATE reviews, cart_items, favorites, products, users, product_ratings, seller_stats
+                RESTART IDENTITY CASCADE
+            """)
+            logger.info("🧹 Таблицы очищены")
+
+        # Недостающие категории дополняются сгенерированными
+        existing_categories = await connection.fetchval("SELECT COUNT(*) FROM categories")
+        if args.categories > existing_categories:
+            await copy_rows(connection, "categories", ["name", "description", "slug", "sort_order"], (
+                (f"Категория {i}", f"Сгенерированная категория {i}", f"generated-{i}", 1000 + i)
+                for i in range(existing_categories + 1, args.categories + 1)
+            ))
+        category_ids = await fetch_ids(connection, "categories")
+
+        first_user_id = await connection.fetchval("SELECT COALESCE(MAX(id), 0) FROM users")
+        first_product_id = await connection.fetchval("SELECT COALESCE(MAX(id), 0) FROM products")
+        password_hash = await hash_password(args.password)
+
+        tables = await disable_triggers(connection)
+        try:
+            await copy_rows(
+                connection, "users",
+                ["name", "email", "phone", "password_hash", "address", "created_at", "updated_at"],
+                generate_users(rng, args.users, first_user_id + 1, password_hash, args.days)
+            )
+            user_ids = await fetch_ids(connection, "users", first_user_id)
+            if not user_ids:
+                raise ValueError("Нет пользователей для генерации товаров")
+
+            # Продавцы - доля пользователей; размер каталога продавца по Ципфу
+            sellers = rng.sample(user_ids, max(1, int(len(user_ids) * args.sellers_share)))
+            choose_seller = SkewedChoice(rng, sellers, lambda n: zipf_weights(n, args.skew))
+            choose_category = SkewedChoice(rng, category_ids, lambda n: zipf_weights(n, 0.8))
+            await copy_rows(
+                connection, "products",
+                ["name", "description", "price", "category_id", "user_id", "image_url", "in_stock",
+                 "created_at", "updated_at"],
+                generate_products(rng, args.products, choose_category, choose_seller, args.days)
+            )
+            product_ids = await fetch_ids(connection, "products", first_product_id)
+
+            if product_ids:
+                buyers = SkewedChoice(rng, user_ids, lambda n: lognormal_weights(rng, n, ACTIVITY_SIGMA))
+                popular = SkewedChoice(rng, product_ids, lambda n: zipf_weights(n, args.skew))
+
+                def favorite_row(user_id: int, product_id: int) -> tuple:
+                    return user_id, product_id, random_timestamp(rng, args.days)
+
+                def cart_row(user_id: int, product_id: int) -> tuple:
+                    # Корзины свежие: последние 30 дней
+                    created_at = random_timestamp(rng, 30)
+                    return user_id, product_id, rng.choice((1, 1, 1, 2, 3)), created_at, created_at
+
+                def review_row(user_id: int, product_id: int) -> tuple:
+                    created_at = random_timestamp(rng, args.days)
+                    rating = rng.choices(range(1, 6), weights=RATING_WEIGHTS)[0]
+                    comment = rng.choice(REVIEW_COMMENTS) if rng.random() < 0.7 else None
+                    return user_id, product_id, rating, comment, created_at, created_at
+
+                await copy_rows(
+                    connection, "favorites", ["user_id", "product_id", "created_at"],
+                    generate_user_products(rng, buyers, popular, args.favorites, favorite_row)
+                )
+                await copy_rows(
+                    connection, "cart_items", ["user_id", "product_id", "quantity", "created_at", "updated_at"],
+                    generate_user_products(rng, buyers, popular, args.cart_items, cart_row)
+                )
+                await copy_rows(
+                    connection, "reviews", ["user_id", "product_id", "rating", "comment", "created_at", "updated_at"],
+                    generate_user_products(rng, buyers, popular, args.reviews, review_row)
+                )
+        finally:
+            await enable_triggers(connection, tables)
+
+        # Агрегаты, которые обычно поддерживают триггеры, пересчитываются целиком
+        await rebuild_rating_aggregates(connection)
+        await rebuild_seller_stats(connection)
+
+        logger.info("📊 Сбор статистики планировщика (ANALYZE)")
+        await connection.execute("ANALYZE users, categories, products, favorites, cart_items, reviews")
+
+        # Запущенные сервер и бот сбрасывают кэши каталога
+        await connection.execute("SELECT pg_notify($1, 'products')", CATALOG_CHANNEL)
+    finally:
+        await connection.close()
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Генерация синтетических данных Rukami")
+    parser.add_argument("--seed", type=int, default=42, help="зерно генератора (одинаковое зерно - одинаковые данные)")
+    parser.add_argument("--categories", type=int, default=10, help="число категорий (не меньше существующих)")
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("--products", type=int, default=100000)
+    parser.add_argument("--favorites", type=int, default=1000000)
+    parser.add_argument("--cart-items", type=int, default=50000)
+    parser.add_argument("--reviews", type=int, default=200000)
+    parser.add_argument("--sellers-share", type=float, default=0.05, help="доля пользователей-продавцов")
+    parser.add_argument("--skew", type=float, default=0.8,
+                        help="показатель закона Ципфа для популярности товаров и размера каталогов продавцов")
+    parser.add_argument("--days", type=int, default=730, help="за сколько дней распределены даты создания")
+    parser.add_argument("--password", default="password", help="пароль всех сгенерированных пользователей")
+    parser.add_argument("--truncate", action="store_true",
+                        help="очистить пользователей, товары, избранное, корзины и отзывы перед генерацией")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    args = parse_args(argv)
+    started = time.perf_counter()
+    asyncio.run(generate(args))
+    logger.info(f"✅ Генерация завершена за {time.perf_counter() - started:.1f} с")
+
+
+if __name__ == "__main__":
+    main()
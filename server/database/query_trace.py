@@ -0,0 +1,154 @@
+"""Трассировка SQL-запросов в рамках одного HTTP-запроса или обновления бота
+
+Каждый запрос к БД (именованный и сырой conn.fetch/execute) записывается в
+текущую трассировку: шаблон, длительность, число строк и форма параметров
+(типы и длины, без значений). Медленные запросы пишутся в лог сразу, а
+повторы одного шаблона в одной трассировке - признак N+1 - по её завершении.
+При SQL_TRACE=true последние трассировки хранятся в памяти процесса и
+доступны по id из заголовка X-SQL-Trace.
+"""
+import logging
+import re
+import secrets
+import time
+from collections import Counter, OrderedDict
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional, Sequence
+
+from server.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Ограничения, чтобы трассировка длинного запроса не разрасталась
+MAX_STATEMENTS = 500
+MAX_TEMPLATE_LENGTH = 200
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def statement_template(query: str) -> str:
+    """Шаблон запроса: имя именованного запроса или SQL в одну строку"""
+    template = _WHITESPACE.sub(" ", query).strip()
+    if len(template) > MAX_TEMPLATE_LENGTH:
+        template = template[:MAX_TEMPLATE_LENGTH] + "..."
+    return template
+
+
+def params_shape(args: Sequence[Any]) -> List[str]:
+    """Форма параметров без значений: int, str[12], list[40]"""
+    shape = []
+    for value in args:
+        name = type(value).__name__
+        if isinstance(value, (str, bytes, list, tuple, set, dict)):
+            name = f"{name}[{len(value)}]"
+        shape.append(name)
+    return shape
+
+
+class QueryTrace:
+    """Запросы к БД одного HTTP-запроса или обновления бота"""
+
+    def __init__(self, label: str):
+        self.id = secrets.token_hex(8)
+        self.label = label
+        self.started_at = time.time()
+        self.total_time = 0.0
+        self.count = 0
+        self.templates: Counter = Counter()
+        self.statements: List[Dict[str, Any]] = []
+
+    def record(self, template: str, kind: str, elapsed: float, rows: Optional[int], args: Sequence[Any]):
+        self.total_time += elapsed
+        self.count += 1
+        self.templates[template] += 1
+        if len(self.statements) < MAX_STATEMENTS:
+            self.statements.append({
+                "query": template,
+                "kind": kind,
+                "ms": round(elapsed * 1000, 3),
+                "rows": rows,
+                "params": params_shape(args),
+            })
+
+    def repeated(self, threshold: int) -> Dict[str, int]:
+        """Шаблоны, выполненные не меньше threshold раз"""
+        if threshold <= 0:
+            return {}
+        return {template: count for template, count in self.templates.items() if count >= threshold}
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "label": self.label,
+            "started_at": self.started_at,
+            "queries": self.count,
+            "total_ms": round(self.total_time * 1000, 3),
+            "repeated": self.repeated(settings.n_plus_one_threshold),
+            "statements": self.statements,
+            "truncated": self.count > len(self.statements),
+        }
+
+
+current_trace: ContextVar[Optional[QueryTrace]] = ContextVar("current_trace", default=None)
+
+# Последние завершённые трассировки (при SQL_TRACE=true): id -> трассировка
+recent_traces: "OrderedDict[str, QueryTrace]" = OrderedDict()
+
+
+def record_query(template: str, kind: str, elapsed: float, rows: Optional[int], args: Sequence[Any]):
+    """Учёт выполненного запроса в текущей трассировке и журнале медленных"""
+    trace = current_trace.get()
+    if trace is not None:
+        trace.record(template, kind, elapsed, rows, args)
+    elapsed_ms = elapsed * 1000
+    if settings.slow_query_ms and elapsed_ms >= settings.slow_query_ms:
+        where = f" [{trace.label}, trace={trace.id}]" if trace is not None else ""
+        logger.warning(
+            f"🐢 Медленный запрос {elapsed_ms:.1f} мс{where}: {template} "
+            f"params={params_shape(args)} rows={rows}"
+        )
+
+
+def start_trace(label: str):
+    """Начало трассировки; возвращает трассировку и токен для finish_trace"""
+    trace = QueryTrace(label)
+    return trace, current_trace.set(trace)
+
+
+def finish_trace(trace: QueryTrace, token):
+    """Завершение трассировки: предупреждение о N+1 и сохранение для отладки"""
+    current_trace.reset(token)
+    for template, count in trace.repeated(settings.n_plus_one_threshold).items():
+        logger.warning(f"🔁 Возможен N+1 [{trace.label}, trace={trace.id}]: {count} раз {template}")
+    if settings.sql_trace:
+        recent_traces[trace.id] = trace
+        while len(recent_traces) > settings.sql_trace_keep:
+            recent_traces.popitem(last=False)
+
+
+@asynccontextmanager
+async def traced(label: str):
+    """Трассировка блока кода вне HTTP-запроса (обновления и задачи бота)"""
+    trace, token = start_trace(label)
+    try:
+        yield trace
+    finally:
+        finish_trace(trace, token)
+
+
+def get_trace(trace_id: str) -> Optional[Dict[str, Any]]:
+    trace = recent_traces.get(trace_id)
+    return trace.as_dict() if trace is not None else None
+
+
+def list_traces(limit: int = 50) -> List[Dict[str, Any]]:
+    """Краткие сведения о последних трассировках, новые - первыми"""
+    result = []
+    for trace in reversed(recent_traces.values()):
+        if len(result) >= limit:
+            break
+        summary = trace.as_dict()
+        del summary["statements"]
+        result.append(summary)
+    return result
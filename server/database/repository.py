@@ -0,0 +1,237 @@
+"""Общие запросы к БД для сервера и Telegram бота
+
+Все запросы регистрируются как именованные и готовятся на каждом соединении
+пула, поэтому API и бот используют одни и те же подготовленные выражения
+"""
+from typing import List, Optional, Sequence
+
+from server.database.db_connection import fetch_all, fetch_one, execute_query, register_query
+
+# === КАТЕГОРИИ ===
+
+CATEGORIES_QUERY = register_query("categories.list", """
+    SELECT c.id, c.name, c.description, c.slug, c.image_url, c.sort_order,
+           COUNT(p.id) as products_count
+    FROM categories c
+    LEFT JOIN products p ON c.id = p.category_id AND p.in_stock = true
+    WHERE c.is_active = true
+    GROUP BY c.id, c.name, c.description, c.slug, c.image_url, c.sort_order
+    ORDER BY c.sort_order, c.name
+""")
+
+CATEGORY_QUERY = register_query("categories.get", """
+    SELECT c.*, COUNT(p.id) as products_count
+    FROM categories c
+    LEFT JOIN products p ON c.id = p.category_id AND p.in_stock = true
+    WHERE c.id = $1 AND c.is_active = true
+    GROUP BY c.id
+""")
+
+CATEGORY_BY_SLUG_QUERY = register_query("categories.get_by_slug", """
+    SELECT c.*, COUNT(p.id) as products_count
+    FROM categories c
+    LEFT JOIN products p ON c.id = p.category_id AND p.in_stock = true
+    WHERE c.slug = $1 AND c.is_active = true
+    GROUP BY c.id
+""")
+
+
+async def list_categories(connection=None) -> List:
+    """Активные категории с количеством товаров в наличии"""
+    return await fetch_all(CATEGORIES_QUERY, connection=connection)
+
+
+async def get_category(category_id: int, connection=None):
+    """Активная категория по id"""
+    return await fetch_one(CATEGORY_QUERY, category_id, connection=connection)
+
+
+async def get_category_by_slug(slug: str, connection=None):
+    """Активная категория по slug"""
+    return await fetch_one(CATEGORY_BY_SLUG_QUERY, slug, connection=connection)
+
+
+# === ТОВАРЫ ===
+
+PRODUCT_QUERY = register_query("products.get", """
+    SELECT p.id, p.name, p.description, p.price, p.user_id, p.image_url, p.in_stock,
+           p.created_at, p.updated_at,
+           c.id as category_id, c.name as category_name, c.slug as category_slug,
+           u.name as author_name, u.phone as author_phone
+    FROM products p
+    JOIN categories c ON p.category_id = c.id
+    LEFT JOIN users u ON p.user_id = u.id
+    WHERE p.id = $1
+""")
+
+# Страницы каталога. Общее количество считается в том же запросе скалярным
+# подзапросом (выполняется один раз и только если последний параметр true)
+PRODUCTS_PAGE_QUERY = register_query("products.page", """
+    SELECT p.id, p.name, p.description, p.price, p.image_url, p.in_stock, p.created_at,
+           c.id as category_id, c.name as category_name, c.slug as category_slug,
+           u.name as author_name,
+           CASE WHEN $4::boolean THEN (
+               SELECT COUNT(*) FROM products p2
+               WHERE p2.in_stock = true AND ($1::integer IS NULL OR p2.category_id = $1)
+           ) END as total_count
+    FROM products p
+    JOIN categories c ON p.category_id = c.id
+    LEFT JOIN users u ON p.user_id = u.id
+    WHERE p.in_stock = true
+    AND ($1::integer IS NULL OR p.category_id = $1)
+    ORDER BY p.created_at DESC, p.id DESC
+    LIMIT $2 OFFSET $3
+""")
+
+# Товары в наличии после водяного знака рассылки и товары с явно переданными id
+# (кроме товаров продавцов из $3 - о них рассылается сводка)
+NEW_PRODUCTS_QUERY = register_query("products.new_after", """
+    SELECT p.id, p.name, p.description, p.price, p.image_url, p.created_at,
+           c.id as category_id, c.name as category_name,
+           u.name as author_name
+    FROM products p
+    JOIN categories c ON p.category_id = c.id
+    LEFT JOIN users u ON p.user_id = u.id
+    WHERE (p.id > $1 OR p.id = ANY($2::integer[])) AND p.in_stock = true
+    AND (p.user_id IS NULL OR p.user_id <> ALL($3::integer[]))
+    ORDER BY p.id
+""")
+
+# Число тех же новых товаров по продавцам
+NEW_PRODUCT_SELLERS_QUERY = register_query("products.new_after_by_seller", """
+    SELECT p.user_id, u.name as author_name,
+           COUNT(*) as products_count, MAX(p.id) as last_id
+    FROM products p
+    LEFT JOIN users u ON p.user_id = u.id
+    WHERE (p.id > $1 OR p.id = ANY($2::integer[])) AND p.in_stock = true
+    GROUP BY p.user_id, u.name
+""")
+
+LAST_PRODUCT_ID_QUERY = register_query("products.last_id", """
+    SELECT COALESCE(MAX(id), 0) FROM products
+""")
+
+
+async def get_product(product_id: int, connection=None):
+    """Товар с категорией и продавцом"""
+    return await fetch_one(PRODUCT_QUERY, product_id, connection=connection)
+
+
+async def list_category_products(category_id: Optional[int], limit: int, offset: int = 0, connection=None) -> List:
+    """Первые товары в наличии (по категории или все), новые сначала"""
+    return await fetch_all(PRODUCTS_PAGE_QUERY, category_id, limit, offset, False, connection=connection)
+
+
+async def list_new_products(after_id: int, extra_ids: List[int], excluded_sellers: Sequence[int] = (),
+                            connection=None) -> List:
+    """Товары в наличии с id больше after_id и из списка extra_ids,
+    кроме товаров продавцов excluded_sellers"""
+    return await fetch_all(NEW_PRODUCTS_QUERY, after_id, extra_ids, list(excluded_sellers), connection=connection)
+
+
+async def list_new_product_sellers(after_id: int, extra_ids: List[int], connection=None) -> List:
+    """Продавцы новых товаров: число товаров и наибольший id"""
+    return await fetch_all(NEW_PRODUCT_SELLERS_QUERY, after_id, extra_ids, connection=connection)
+
+
+async def get_last_product_id(connection=None) -> int:
+    """Наибольший id товара (0, если товаров нет)"""
+    row = await fetch_one(LAST_PRODUCT_ID_QUERY, connection=connection)
+    return row[0]
+
+
+# === ПОЛЬЗОВАТЕЛИ ===
+
+USER_BY_EMAIL_QUERY = register_query("users.get_by_email", """
+    SELECT id, name, email, phone, address, created_at, password_hash, telegram_id, token_version
+    FROM users WHERE email = $1
+""")
+
+USER_BY_TELEGRAM_QUERY = register_query("users.get_by_telegram_id", """
+    SELECT id, name, email, phone, address, created_at, notifications_enabled, bot_blocked_at
+    FROM users WHERE telegram_id = $1
+""")
+
+CREATE_USER_QUERY = register_query("users.create", """
+    INSERT INTO users (name, email, password_hash, phone, address, telegram_id)
+    VALUES ($1, $2, $3, $4, $5, $6)
+    RETURNING id
+""")
+
+LINK_TELEGRAM_QUERY = register_query("users.link_telegram", """
+    UPDATE users SET telegram_id = $2, bot_blocked_at = NULL, updated_at = NOW()
+    WHERE id = $1
+""")
+
+SET_PASSWORD_HASH_QUERY = register_query("users.set_password_hash", """
+    UPDATE users SET password_hash = $2, updated_at = NOW() WHERE id = $1
+""")
+
+REVOKE_TOKENS_QUERY = register_query("users.revoke_tokens", """
+    UPDATE users SET token_version = token_version + 1 WHERE id = $1 RETURNING token_version
+""")
+
+SET_NOTIFICATIONS_QUERY = register_query("users.set_notifications", """
+    UPDATE users SET notifications_enabled = $2 WHERE telegram_id = $1
+""")
+
+SET_BOT_BLOCKED_QUERY = register_query("users.set_bot_blocked", """
+    UPDATE users SET bot_blocked_at = CASE WHEN $2 THEN NOW() END WHERE telegram_id = $1
+""")
+
+NOTIFICATION_RECIPIENTS_QUERY = register_query("users.notification_recipients", """
+    SELECT telegram_id, name FROM users
+    WHERE telegram_id IS NOT NULL
+    AND (notifications_enabled IS NULL OR notifications_enabled = true)
+    AND bot_blocked_at IS NULL
+""")
+
+
+async def get_user_by_email(email: str, connection=None):
+    """Пользователь по email (вместе с хэшем пароля)"""
+    return await fetch_one(USER_BY_EMAIL_QUERY, email, connection=connection)
+
+
+async def get_user_by_telegram_id(telegram_id: int, connection=None):
+    """Пользователь, привязанный к Telegram"""
+    return await fetch_one(USER_BY_TELEGRAM_QUERY, telegram_id, connection=connection)
+
+
+async def create_user(name: str, email: str, password_hash: str, phone: Optional[str] = None,
+                      address: Optional[str] = None, telegram_id: Optional[int] = None,
+                      connection=None) -> int:
+    """Создание пользователя; возвращает id"""
+    row = await fetch_one(CREATE_USER_QUERY, name, email, password_hash, phone, address, telegram_id,
+                          connection=connection)
+    return row['id']
+
+
+async def link_telegram_account(user_id: int, telegram_id: int, connection=None):
+    """Привязка Telegram к пользователю"""
+    await execute_query(LINK_TELEGRAM_QUERY, user_id, telegram_id, connection=connection)
+
+
+async def update_password_hash(user_id: int, password_hash: str, connection=None):
+    """Сохранение нового хэша пароля"""
+    await execute_query(SET_PASSWORD_HASH_QUERY, user_id, password_hash, connection=connection)
+
+
+async def revoke_user_tokens(user_id: int, connection=None) -> Optional[int]:
+    """Отзыв всех выданных пользователю токенов; возвращает новую версию токенов"""
+    row = await fetch_one(REVOKE_TOKENS_QUERY, user_id, connection=connection)
+    return row['token_version'] if row else None
+
+
+async def set_notifications_enabled(telegram_id: int, enabled: bool, connection=None):
+    """Включение/выключение уведомлений о новых товарах"""
+    await execute_query(SET_NOTIFICATIONS_QUERY, telegram_id, enabled, connection=connection)
+
+
+async def set_bot_blocked(telegram_id: int, blocked: bool, connection=None):
+    """Отметка пользователя, заблокировавшего бота (или снятие отметки)"""
+    await execute_query(SET_BOT_BLOCKED_QUERY, telegram_id, blocked, connection=connection)
+
+
+async def list_notification_recipients(connection=None) -> List:
+    """Пользователи Telegram с включёнными уведомлениями, не заблокировавшие бота"""
+    return await fetch_all(NOTIFICATION_RECIPIENTS_QUERY, connection=connection)
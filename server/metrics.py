@@ -0,0 +1,187 @@
+"""Метрики сервера в формате Prometheus
+
+Гистограммы задержки и времени в БД по маршрутам, счётчики ответов по
+кодам, число запросов в обработке, состояние пула соединений asyncpg,
+статистика именованных запросов, кэшей и хэширования паролей.
+Счётчики хранятся в памяти процесса: при нескольких воркерах каждый
+отдаёт свои значения.
+"""
+import hmac
+import time
+from bisect import bisect_left
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from server.cache import get_cache_stats
+from server.database import db_connection
+from server.passwords import get_password_hash_stats
+
+# Границы корзин гистограмм, секунды
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Метка маршрута для запросов, не попавших ни в один маршрут (иначе
+# случайные URL сканеров порождают бесконечное число рядов)
+UNMATCHED_ROUTE = "unmatched"
+
+
+class Histogram:
+    """Гистограмма с фиксированными корзинами"""
+
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def lines(self, name: str, labels: str) -> Iterable[str]:
+        separator = "," if labels else ""
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            yield f'{name}_bucket{{{labels}{separator}le="{bound}"}} {cumulative}'
+        yield f'{name}_bucket{{{labels}{separator}le="+Inf"}} {self.count}'
+        yield f"{name}_sum{{{labels}}} {self.sum:.6f}"
+        yield f"{name}_count{{{labels}}} {self.count}"
+
+
+# (метод, шаблон маршрута) -> гистограммы; (метод, маршрут, код) -> число ответов
+request_latency: Dict[Tuple[str, str], Histogram] = {}
+request_db_time: Dict[Tuple[str, str], Histogram] = {}
+responses_total: Dict[Tuple[str, str, str], int] = {}
+requests_in_flight = 0
+started_at = time.time()
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(**labels) -> str:
+    return ",".join(f'{key}="{_escape(str(value))}"' for key, value in labels.items())
+
+
+def route_template(scope: dict) -> str:
+    """Шаблон пути маршрута (/api/products/{product_id}), а не сам URL"""
+    route = scope.get("route")
+    path = getattr(route, "path", None) or getattr(route, "path_format", None)
+    return path or UNMATCHED_ROUTE
+
+
+def request_started():
+    global requests_in_flight
+    requests_in_flight += 1
+
+
+def request_finished(method: str, route: str, status_code: int, elapsed: float, db_time: float):
+    global requests_in_flight
+    requests_in_flight -= 1
+    key = (method, route)
+    request_latency.setdefault(key, Histogram()).observe(elapsed)
+    request_db_time.setdefault(key, Histogram()).observe(db_time)
+    status_key = (method, route, str(status_code))
+    responses_total[status_key] = responses_total.get(status_key, 0) + 1
+
+
+def server_timing(elapsed: float, db_time: float, db_queries: int) -> str:
+    """Значение заголовка Server-Timing (длительности в миллисекундах)"""
+    return (f'app;dur={elapsed * 1000:.1f}, '
+            f'db;dur={db_time * 1000:.1f};desc="{db_queries} queries"')
+
+
+def _pool_lines(pool) -> List[str]:
+    if pool is None:
+        return []
+    size = pool.get_size()
+    idle = pool.get_idle_size()
+    # Публичного счётчика ожидающих соединения у asyncpg нет - берём очередь пула
+    waiting = len(getattr(getattr(pool, "_queue", None), "_getters", ()) or ())
+    return [
+        "# HELP rukami_db_pool_connections Соединения пула asyncpg по состоянию",
+        "# TYPE rukami_db_pool_connections gauge",
+        f'rukami_db_pool_connections{{state="open"}} {size}',
+        f'rukami_db_pool_connections{{state="idle"}} {idle}',
+        f'rukami_db_pool_connections{{state="in_use"}} {size - idle}',
+        "# HELP rukami_db_pool_max_connections Максимальный размер пула",
+        "# TYPE rukami_db_pool_max_connections gauge",
+        f"rukami_db_pool_max_connections {pool.get_max_size()}",
+        "# HELP rukami_db_pool_waiting Запросы, ожидающие свободного соединения",
+        "# TYPE rukami_db_pool_waiting gauge",
+        f"rukami_db_pool_waiting {waiting}",
+    ]
+
+
+def render(pool=None) -> str:
+    """Все метрики в текстовом формате Prometheus"""
+    pool = pool if pool is not None else db_connection.db_pool
+    lines = [
+        "# HELP rukami_uptime_seconds Время работы процесса",
+        "# TYPE rukami_uptime_seconds gauge",
+        f"rukami_uptime_seconds {time.time() - started_at:.0f}",
+        "# HELP rukami_http_requests_in_flight Запросы в обработке",
+        "# TYPE rukami_http_requests_in_flight gauge",
+        f"rukami_http_requests_in_flight {requests_in_flight}",
+        "# HELP rukami_http_responses_total Ответы по маршрутам и кодам",
+        "# TYPE rukami_http_responses_total counter",
+    ]
+    for (method, route, status_code), count in sorted(responses_total.items()):
+        lines.append(f"rukami_http_responses_total{{{_labels(method=method, route=route, status=status_code)}}} {count}")
+
+    for name, description, histograms in (
+        ("rukami_http_request_duration_seconds", "Время обработки запроса", request_latency),
+        ("rukami_http_request_db_seconds", "Время запросов к БД за один HTTP-запрос", request_db_time),
+    ):
+        lines += [f"# HELP {name} {description}", f"# TYPE {name} histogram"]
+        for (method, route), histogram in sorted(histograms.items()):
+            lines.extend(histogram.lines(name, _labels(method=method, route=route)))
+
+    lines.extend(_pool_lines(pool))
+
+    lines += [
+        "# HELP rukami_db_query_calls_total Вызовы именованных запросов",
+        "# TYPE rukami_db_query_calls_total counter",
+    ]
+    query_stats = db_connection.get_query_stats()
+    for stats in query_stats:
+        lines.append(f"rukami_db_query_calls_total{{{_labels(query=stats['name'])}}} {stats['calls']}")
+    lines += [
+        "# HELP rukami_db_query_seconds_total Суммарное время именованных запросов",
+        "# TYPE rukami_db_query_seconds_total counter",
+    ]
+    for stats in query_stats:
+        lines.append(f"rukami_db_query_seconds_total{{{_labels(query=stats['name'])}}} {stats['total_ms'] / 1000:.6f}")
+
+    lines += [
+        "# HELP rukami_cache_requests_total Обращения к кэшам процесса",
+        "# TYPE rukami_cache_requests_total counter",
+    ]
+    for stats in get_cache_stats():
+        for result in ("hits", "misses"):
+            lines.append(f"rukami_cache_requests_total{{{_labels(cache=stats['name'], result=result)}}} {stats[result]}")
+
+    password_stats = get_password_hash_stats()
+    lines += [
+        "# HELP rukami_password_hash_operations_total Вычисления хэша пароля",
+        "# TYPE rukami_password_hash_operations_total counter",
+        f'rukami_password_hash_operations_total{{operation="hash"}} {password_stats["hash_calls"]}',
+        f'rukami_password_hash_operations_total{{operation="verify"}} {password_stats["verify_calls"]}',
+        "# HELP rukami_password_hash_rejected_total Отказы из-за переполненной очереди хэширования",
+        "# TYPE rukami_password_hash_rejected_total counter",
+        f"rukami_password_hash_rejected_total {password_stats['rejected']}",
+        "# HELP rukami_password_hash_in_flight Вычисления хэша в процессе",
+        "# TYPE rukami_password_hash_in_flight gauge",
+        f"rukami_password_hash_in_flight {password_stats['in_flight']}",
+    ]
+    return "\n".join(lines) + "\n"
+
+
+def check_token(authorization: Optional[str], token: str) -> bool:
+    """Проверка токена доступа к /metrics (если он задан)"""
+    if not token:
+        return True
+    return hmac.compare_digest(authorization or "", f"Bearer {token}")
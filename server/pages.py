@@ -0,0 +1,146 @@
+"""Хранилище HTML-страниц клиента в памяти со сжатыми вариантами"""
+import gzip
+import hashlib
+import logging
+import os
+from typing import Dict, Optional
+
+from fastapi import HTTPException, Request
+from fastapi.responses import Response
+
+try:
+    import brotli
+except ImportError:  # brotli необязателен - тогда отдаём только gzip
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+# Порядок предпочтения кодировок при согласовании с клиентом
+ENCODINGS = ("br", "gzip")
+
+
+class Page:
+    """HTML-страница: исходное содержимое, сжатые варианты и ETag"""
+
+    def __init__(self, path: str, content: bytes, mtime: float):
+        self.path = path
+        self.mtime = mtime
+        digest = hashlib.sha256(content).hexdigest()[:32]
+
+        # Для каждого варианта свой строгий ETag - байты ответа различаются
+        self.variants: Dict[str, bytes] = {"identity": content}
+        self.etags: Dict[str, str] = {"identity": f'"{digest}"'}
+
+        self.variants["gzip"] = gzip.compress(content, compresslevel=9, mtime=0)
+        self.etags["gzip"] = f'"{digest}-gz"'
+
+        if brotli is not None:
+            self.variants["br"] = brotli.compress(content, quality=11)
+            self.etags["br"] = f'"{digest}-br"'
+
+
+def parse_accept_encoding(header: str) -> Dict[str, float]:
+    """Разбор заголовка Accept-Encoding в словарь кодировка -> q"""
+    accepted = {}
+    for part in header.split(","):
+        token, _, params = part.strip().partition(";")
+        if not token:
+            continue
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[token.strip().lower()] = quality
+    return accepted
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """Проверка If-None-Match (учитывает список значений, W/ и *)"""
+    if if_none_match.strip() == "*":
+        return True
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == etag:
+            return True
+    return False
+
+
+class PageStore:
+    """Страницы загружаются один раз при запуске; в режиме отладки -
+    перечитываются при изменении файла"""
+
+    def __init__(self, directory: str, reload: bool = False,
+                 cache_control: str = "no-cache"):
+        self.directory = directory
+        self.reload = reload
+        self.cache_control = cache_control
+        self.pages: Dict[str, Page] = {}
+
+    def load(self, filename: str) -> Optional[Page]:
+        """Чтение файла с диска и подготовка сжатых вариантов"""
+        path = os.path.join(self.directory, filename)
+        try:
+            with open(path, "rb") as f:
+                content = f.read()
+            page = Page(path, content, os.path.getmtime(path))
+        except OSError as e:
+            logger.warning(f"Страница {filename} не загружена: {e}")
+            self.pages.pop(filename, None)
+            return None
+
+        self.pages[filename] = page
+        return page
+
+    def load_all(self, filenames):
+        """Загрузка набора страниц"""
+        for filename in filenames:
+            self.load(filename)
+        logger.info(f"📄 Загружено страниц: {len(self.pages)}")
+
+    def get(self, filename: str) -> Optional[Page]:
+        """Страница из памяти (в режиме отладки - с проверкой изменения файла)"""
+        page = self.pages.get(filename)
+        if self.reload:
+            path = os.path.join(self.directory, filename)
+            try:
+                if page is None or os.path.getmtime(path) != page.mtime:
+                    page = self.load(filename)
+            except OSError:
+                page = None
+        return page
+
+    def response(self, request: Request, filename: str) -> Response:
+        """Ответ со страницей: выбор сжатия, ETag и 304 Not Modified"""
+        page = self.get(filename)
+        if page is None:
+            raise HTTPException(status_code=404, detail="Страница не найдена")
+
+        accepted = parse_accept_encoding(request.headers.get("accept-encoding", ""))
+        encoding = "identity"
+        for candidate in ENCODINGS:
+            if candidate in page.variants and accepted.get(candidate, 0) > 0:
+                encoding = candidate
+                break
+
+        headers = {
+            "ETag": page.etags[encoding],
+            "Cache-Control": self.cache_control,
+            "Vary": "Accept-Encoding",
+        }
+
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match and etag_matches(if_none_match, page.etags[encoding]):
+            return Response(status_code=304, headers=headers)
+
+        if encoding != "identity":
+            headers["Content-Encoding"] = encoding
+        return Response(
+            content=page.variants[encoding],
+            media_type="text/html; charset=utf-8",
+            headers=headers
+        )
@@ -0,0 +1,178 @@
+"""Хэширование паролей (scrypt) вне цикла событий
+
+Хэш считается в ограниченном пуле потоков (hashlib.scrypt отпускает GIL),
+число одновременных вычислений ограничено семафором. Старые хэши SHA-256
+без соли распознаются и заменяются на scrypt при успешном входе
+"""
+import asyncio
+import base64
+import hashlib
+import hmac
+import logging
+import secrets
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Optional, Tuple
+
+from server.config import settings
+
+logger = logging.getLogger(__name__)
+
+SCHEME = "scrypt"
+
+
+class PasswordHasherBusy(Exception):
+    """Очередь на вычисление хэша переполнена"""
+
+
+_executor: Optional[ThreadPoolExecutor] = None
+_semaphore: Optional[asyncio.Semaphore] = None
+
+# Счётчики для мониторинга: вызовы, время вычисления и ожидания, отказы
+_stats: Dict[str, Any] = {
+    "hash_calls": 0,
+    "verify_calls": 0,
+    "legacy_verified": 0,
+    "rejected": 0,
+    "in_flight": 0,
+    "total_ms": 0.0,
+    "max_ms": 0.0,
+    "wait_total_ms": 0.0,
+    "wait_max_ms": 0.0,
+}
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.password_hash_workers,
+            thread_name_prefix="password-hash"
+        )
+    return _executor
+
+
+def _get_semaphore() -> asyncio.Semaphore:
+    global _semaphore
+    if _semaphore is None:
+        _semaphore = asyncio.Semaphore(settings.password_hash_concurrency)
+    return _semaphore
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.b64encode(data).decode("ascii").rstrip("=")
+
+
+def _b64decode(data: str) -> bytes:
+    return base64.b64decode(data + "=" * (-len(data) % 4))
+
+
+def _scrypt(password: str, salt: bytes, n: int, r: int, p: int) -> bytes:
+    return hashlib.scrypt(password.encode(), salt=salt, n=n, r=r, p=p,
+                          maxmem=256 * n * r * p, dklen=32)
+
+
+def _is_legacy(stored: str) -> bool:
+    """Хэш старой схемы: SHA-256 без соли в hex"""
+    return len(stored) == 64 and "$" not in stored
+
+
+def _parse(stored: str) -> Optional[Tuple[int, int, int, bytes, bytes]]:
+    """Разбор строки scrypt$n$r$p$соль$хэш"""
+    parts = stored.split("$")
+    if len(parts) != 6 or parts[0] != SCHEME:
+        return None
+    try:
+        return int(parts[1]), int(parts[2]), int(parts[3]), _b64decode(parts[4]), _b64decode(parts[5])
+    except (ValueError, TypeError):
+        return None
+
+
+async def _run(func, *args):
+    """Вычисление в пуле потоков с ограничением параллелизма"""
+    semaphore = _get_semaphore()
+    wait_started = time.perf_counter()
+    try:
+        await asyncio.wait_for(semaphore.acquire(), timeout=settings.password_hash_queue_timeout)
+    except asyncio.TimeoutError:
+        _stats["rejected"] += 1
+        raise PasswordHasherBusy("Слишком много одновременных проверок пароля")
+
+    waited_ms = (time.perf_counter() - wait_started) * 1000
+    _stats["wait_total_ms"] += waited_ms
+    _stats["wait_max_ms"] = max(_stats["wait_max_ms"], waited_ms)
+    _stats["in_flight"] += 1
+    started = time.perf_counter()
+    try:
+        return await asyncio.get_running_loop().run_in_executor(_get_executor(), func, *args)
+    finally:
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        _stats["in_flight"] -= 1
+        _stats["total_ms"] += elapsed_ms
+        _stats["max_ms"] = max(_stats["max_ms"], elapsed_ms)
+        semaphore.release()
+
+
+async def hash_password(password: str) -> str:
+    """Хэш пароля с текущими параметрами стоимости"""
+    n, r, p = settings.password_scrypt_n, settings.password_scrypt_r, settings.password_scrypt_p
+    salt = secrets.token_bytes(16)
+    _stats["hash_calls"] += 1
+    digest = await _run(_scrypt, password, salt, n, r, p)
+    return f"{SCHEME}${n}${r}${p}${_b64encode(salt)}${_b64encode(digest)}"
+
+
+def needs_rehash(stored: str) -> bool:
+    """Хэш старой схемы или с параметрами, отличными от текущих"""
+    if _is_legacy(stored):
+        return True
+    parsed = _parse(stored)
+    if parsed is None:
+        return False
+    n, r, p = parsed[:3]
+    return (n, r, p) != (settings.password_scrypt_n, settings.password_scrypt_r, settings.password_scrypt_p)
+
+
+async def verify_password(password: str, stored: str) -> bool:
+    """Проверка пароля по сохранённому хэшу"""
+    if not stored:
+        return False
+
+    if _is_legacy(stored):
+        _stats["legacy_verified"] += 1
+        legacy = hashlib.sha256(password.encode()).hexdigest()
+        return hmac.compare_digest(legacy, stored)
+
+    parsed = _parse(stored)
+    if parsed is None:
+        logger.warning("Неизвестный формат хэша пароля")
+        return False
+    n, r, p, salt, expected = parsed
+    _stats["verify_calls"] += 1
+    digest = await _run(_scrypt, password, salt, n, r, p)
+    return hmac.compare_digest(digest, expected)
+
+
+async def verify_and_update(password: str, stored: str) -> Tuple[bool, Optional[str]]:
+    """Проверка пароля; при успехе и устаревшем хэше возвращает новый хэш для сохранения"""
+    if not await verify_password(password, stored):
+        return False, None
+    if needs_rehash(stored):
+        return True, await hash_password(password)
+    return True, None
+
+
+def get_password_hash_stats() -> Dict[str, Any]:
+    """Статистика хэширования паролей"""
+    calls = _stats["hash_calls"] + _stats["verify_calls"]
+    return {
+        **_stats,
+        "total_ms": round(_stats["total_ms"], 2),
+        "max_ms": round(_stats["max_ms"], 2),
+        "avg_ms": round(_stats["total_ms"] / calls, 2) if calls else 0.0,
+        "wait_total_ms": round(_stats["wait_total_ms"], 2),
+        "wait_max_ms": round(_stats["wait_max_ms"], 2),
+        "workers": settings.password_hash_workers,
+        "concurrency": settings.password_hash_concurrency,
+        "scrypt_n": settings.password_scrypt_n,
+    }
@@ -0,0 +1,204 @@
+"""Массовый импорт товаров продавца из CSV или NDJSON
+
+Тело запроса читается потоком и разбирается построчно, строки проверяются
+пачками и загружаются в таблицу products через COPY. Ошибочные строки
+пропускаются и возвращаются в отчёте с номером строки
+"""
+import codecs
+import csv
+import json
+import logging
+from decimal import Decimal
+from typing import Any, AsyncIterator, Dict, List, Optional, Set, Tuple
+
+from pydantic import BaseModel, Field, ValidationError
+
+from server.database.db_connection import NEW_PRODUCTS_CHANNEL, SKIP_PRODUCT_NOTIFY_SETTING
+
+logger = logging.getLogger(__name__)
+
+FORMATS = ("csv", "ndjson")
+
+# Колонки products, заполняемые при импорте (в порядке записей COPY)
+IMPORT_COLUMNS = ["name", "description", "price", "category_id", "user_id", "image_url", "in_stock"]
+
+CONTENT_TYPE_FORMATS = {
+    "text/csv": "csv",
+    "application/csv": "csv",
+    "application/x-ndjson": "ndjson",
+    "application/ndjson": "ndjson",
+    "application/jsonl": "ndjson",
+    "application/x-jsonlines": "ndjson",
+}
+
+
+class ImportLimitExceeded(Exception):
+    """В файле больше строк, чем разрешено за один импорт"""
+
+
+class ProductImportRow(BaseModel):
+    name: str = Field(..., min_length=1, max_length=500)
+    description: str
+    price: Decimal = Field(..., ge=0, max_digits=10, decimal_places=2)
+    category_id: int
+    image_url: Optional[str] = Field(None, max_length=500)
+    in_stock: bool = True
+
+
+# Поля строки импорта; остальные колонки файла игнорируются
+ROW_FIELDS = {"name", "description", "price", "category_id", "image_url", "in_stock"}
+
+
+def detect_format(content_type: Optional[str]) -> Optional[str]:
+    """Формат импорта по заголовку Content-Type"""
+    if not content_type:
+        return None
+    return CONTENT_TYPE_FORMATS.get(content_type.split(";")[0].strip().lower())
+
+
+async def iter_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    """Строки тела запроса по мере поступления (UTF-8, BOM отбрасывается)"""
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    tail = ""
+    async for chunk in chunks:
+        text = tail + decoder.decode(chunk)
+        lines = text.split("\n")
+        tail = lines.pop()
+        for line in lines:
+            yield line + "\n"
+    tail += decoder.decode(b"", final=True)
+    if tail:
+        yield tail
+
+
+async def iter_csv_rows(lines: AsyncIterator[str]) -> AsyncIterator[Tuple[int, Any]]:
+    """Строки CSV с заголовком: (номер строки, словарь значений или текст ошибки).
+    Поле в кавычках может занимать несколько физических строк"""
+    header: Optional[List[str]] = None
+    pending = ""
+    row_number = 0
+    async for line in lines:
+        pending += line
+        # Незакрытая кавычка - запись продолжается на следующей строке
+        if pending.count('"') % 2:
+            continue
+        record, pending = pending, ""
+        if not record.strip():
+            continue
+
+        values = next(csv.reader([record]))
+        if header is None:
+            header = [name.strip().lower() for name in values]
+            continue
+
+        row_number += 1
+        if len(values) != len(header):
+            yield row_number, f"Ожидалось колонок: {len(header)}, получено: {len(values)}"
+            continue
+        yield row_number, dict(zip(header, values))
+
+    if pending.strip():
+        yield row_number + 1, "Незакрытая кавычка в конце файла"
+
+
+async def iter_ndjson_rows(lines: AsyncIterator[str]) -> AsyncIterator[Tuple[int, Any]]:
+    """Строки NDJSON: (номер строки, объект или текст ошибки)"""
+    row_number = 0
+    async for line in lines:
+        if not line.strip():
+            continue
+        row_number += 1
+        try:
+            data = json.loads(line)
+        except ValueError as e:
+            yield row_number, f"Некорректный JSON: {e}"
+            continue
+        if not isinstance(data, dict):
+            yield row_number, "Строка должна быть JSON-объектом"
+            continue
+        yield row_number, data
+
+
+def _format_validation_error(error: ValidationError) -> str:
+    return "; ".join(
+        f"{'.'.join(str(part) for part in item['loc'])}: {item['msg']}" for item in error.errors()
+    )
+
+
+def validate_row(data: Dict[str, Any], user_id: int, category_ids: Set[int]) -> tuple:
+    """Запись для COPY из значений строки; ValueError с описанием при ошибке"""
+    # Пустые ячейки CSV считаются отсутствующими значениями
+    cleaned = {key: value for key, value in data.items()
+               if key in ROW_FIELDS and value not in ("", None)}
+    try:
+        row = ProductImportRow(**cleaned)
+    except ValidationError as e:
+        raise ValueError(_format_validation_error(e))
+
+    if row.category_id not in category_ids:
+        raise ValueError(f"Категория {row.category_id} не найдена")
+
+    return (row.name, row.description, row.price, row.category_id, user_id, row.image_url, row.in_stock)
+
+
+async def import_products(connection, chunks: AsyncIterator[bytes], file_format: str, user_id: int,
+                          category_ids: Set[int], batch_size: int = 1000, max_rows: int = 50000,
+                          max_errors: int = 100) -> Dict[str, Any]:
+    """Импорт товаров пользователя user_id из потока байтов.
+
+    Вызывается внутри транзакции: откат при исключении отменяет уже
+    загруженные пачки. Уведомление о новых товарах отправляется одно на
+    весь импорт, а не по строке. Возвращает число загруженных и
+    пропущенных строк и первые max_errors ошибок
+    """
+    parse = iter_csv_rows if file_format == "csv" else iter_ndjson_rows
+    batch: List[tuple] = []
+    errors: List[Dict[str, Any]] = []
+    imported = 0
+    failed = 0
+    total = 0
+
+    # Триггер products_notify_new пропускает строки до конца транзакции
+    await connection.execute("SELECT set_config($1, 'on', true)", SKIP_PRODUCT_NOTIFY_SETTING)
+
+    async def flush():
+        nonlocal imported
+        if batch:
+            await connection.copy_records_to_table("products", records=batch, columns=IMPORT_COLUMNS)
+            imported += len(batch)
+            batch.clear()
+
+    async for row_number, data in parse(iter_lines(chunks)):
+        total += 1
+        if total > max_rows:
+            raise ImportLimitExceeded(f"За один импорт можно загрузить не больше {max_rows} товаров")
+
+        try:
+            if isinstance(data, str):
+                raise ValueError(data)
+            batch.append(validate_row(data, user_id, category_ids))
+        except ValueError as e:
+            failed += 1
+            if len(errors) < max_errors:
+                errors.append({"row": row_number, "error": str(e)})
+            continue
+
+        if len(batch) >= batch_size:
+            await flush()
+
+    await flush()
+    if imported:
+        # Одно уведомление с id последнего товара: бот заберёт весь импорт по водяному знаку
+        await connection.execute(
+            "SELECT pg_notify($1, currval(pg_get_serial_sequence('products', 'id'))::text)",
+            NEW_PRODUCTS_CHANNEL
+        )
+    logger.info(f"Импорт товаров пользователя {user_id}: загружено {imported}, пропущено {failed}")
+
+    return {
+        "total_rows": total,
+        "imported": imported,
+        "failed": failed,
+        "errors": errors,
+        "errors_truncated": failed > len(errors),
+    }
@@ -0,0 +1,75 @@
+"""Быстрые JSON-ответы API
+
+FastJSONResponse кодирует содержимое за один проход через orjson (или
+стандартный json, если orjson не установлен): asyncpg.Record, Decimal и
+даты обрабатываются хуком default прямо во время кодирования, без
+промежуточных копий списков и без обхода jsonable_encoder.
+
+Обработчик, возвращающий dict, всё равно проходит через jsonable_encoder
+FastAPI - горячие эндпоинты возвращают готовый ответ через json_response.
+"""
+import json
+from datetime import date, datetime, time
+from decimal import Decimal
+from typing import Any, Optional
+from uuid import UUID
+
+import asyncpg
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from starlette.responses import Response
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Заголовки, которые ответ выставляет сам
+_OWN_HEADERS = {b"content-length", b"content-type"}
+
+
+def json_default(value: Any) -> Any:
+    """Типы, которые не кодируются напрямую"""
+    if isinstance(value, asyncpg.Record):
+        return dict(value)
+    if isinstance(value, Decimal):
+        # Как decimal_encoder FastAPI: целые - int, остальные - float
+        return int(value) if value.as_tuple().exponent >= 0 else float(value)
+    if isinstance(value, (datetime, date, time)):
+        return value.isoformat()
+    if isinstance(value, UUID):
+        return str(value)
+    # Модели pydantic, множества и прочее - стандартным кодировщиком FastAPI
+    return jsonable_encoder(value)
+
+
+def dumps(content: Any) -> bytes:
+    """Кодирование содержимого ответа в JSON (UTF-8)"""
+    if orjson is not None:
+        return orjson.dumps(content, default=json_default, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(",", ":"),
+                      default=json_default).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    """JSON-ответ с быстрым кодированием (класс ответа роутера API по умолчанию)"""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+def json_response(content: Any, response: Optional[Response] = None, status_code: int = 200) -> FastJSONResponse:
+    """Готовый ответ в обход jsonable_encoder.
+
+    FastAPI не переносит в возвращённый Response заголовки и cookie, которые
+    зависимости выставили во внедрённый response (например, обновлённый токен
+    авторизации), поэтому они копируются сюда
+    """
+    result = FastJSONResponse(content, status_code=status_code)
+    if response is not None:
+        if response.status_code:
+            result.status_code = response.status_code
+        result.raw_headers.extend(
+            (key, value) for key, value in response.headers.raw if key not in _OWN_HEADERS
+        )
+    return result
@@ -1,5 +1,6 @@
 import logging
 import os
+import time
 from contextlib import asynccontextmanager
 
 
@@ -8,10 +9,15 @@ from fastapi import FastAPI, HTTPException, Request
 from fastapi.responses import HTMLResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
-from starlette.responses import JSONResponse
+from starlette.responses import JSONResponse, PlainTextResponse
 
+from server import metrics
 from server.database.db_connection import init_database, close_database_pool
-from server.api.api_implementation import router as api_router
+from server.database import query_trace
+from server.pages import PageStore
+from server.api.api_implementation import router as api_router, invalidate_catalog_cache
+from server.catalog_events import start_catalog_listener, stop_catalog_listener
+from server.telegram_webhook import router as telegram_router, start_telegram_bot, stop_telegram_bot
 from server.config import settings
 
 
@@ -32,6 +38,12 @@ async def lifespan(app: FastAPI):
     """Управление жизненным циклом приложения"""
     logger.info("🚀 Запуск Rukami API...")
 
+    # Без общего ключа подписи токены одного воркера не принимаются другими
+    settings.ensure_secret_key()
+
+    # Загружаем HTML-страницы в память
+    page_store.load_all(page_file for page_file, _ in HTML_PAGES.values())
+
     # Инициализация базы данных при запуске
     try:
         await init_database()
@@ -40,10 +52,24 @@ async def lifespan(app: FastAPI):
         logger.error(f"❌ Ошибка инициализации базы данных: {e}")
         raise
 
+    # Изменения каталога, сделанные другими воркерами, сбрасывают кэши и здесь
+    start_catalog_listener(invalidate_catalog_cache)
+
+    # Telegram бот в режиме вебхука (если настроен)
+    try:
+        await start_telegram_bot()
+    except Exception as e:
+        logger.error(f"❌ Ошибка запуска Telegram бота: {e}")
+
     yield
 
     # Закрытие соединений при остановке
     logger.info("🛑 Остановка Rukami API...")
+    await stop_catalog_listener()
+    try:
+        await stop_telegram_bot()
+    except Exception as e:
+        logger.error(f"❌ Ошибка остановки Telegram бота: {e}")
     try:
         await close_database_pool()
         logger.info("✅ Соединения с базой данных закрыты")
@@ -80,138 +106,72 @@ app.add_middleware(
 )
 @app.middleware("http")
 async def add_process_time_header(request: Request, call_next):
-    response = await call_next(request)
-    return response
+    """Метрики запроса (задержка, время в БД, код ответа), трассировка SQL
+    и заголовки Server-Timing / X-SQL-Trace"""
+    trace, token = query_trace.start_trace(f"{request.method} {request.url.path}")
+    metrics.request_started()
+    started = time.perf_counter()
+    status_code = 500
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+        elapsed = time.perf_counter() - started
+        response.headers["Server-Timing"] = metrics.server_timing(elapsed, trace.total_time, trace.count)
+        if settings.sql_trace:
+            response.headers["X-SQL-Trace"] = trace.id
+        return response
+    finally:
+        query_trace.finish_trace(trace, token)
+        metrics.request_finished(request.method, metrics.route_template(request.scope), status_code,
+                                 time.perf_counter() - started, trace.total_time)
 
 # Подключение API роутов
 app.include_router(api_router)
+app.include_router(telegram_router)
 
 
 
 
-# Корневой эндпоинт
-@app.get("/", response_class=HTMLResponse)
-async def root():
-    """Главная страница"""
-    try:
-        # Получаем абсолютный путь к файлу favorites.html
-        current_dir = os.path.dirname(__file__)
-        html_path = os.path.join(current_dir, "..", "client", "index.html")
-
-        if os.path.exists(html_path):
-            with open(html_path, "r", encoding="utf-8") as f:
-                html_content = f.read()
-            return HTMLResponse(content=html_content)
-        else:
-            ...
+# HTML-страницы клиента: путь -> (файл в client/, описание)
+HTML_PAGES = {
+    "/": ("index.html", "Главная страница"),
+    "/favorites": ("favorites.html", "Страница избранного"),
+    "/profile": ("profile.html", "Страница профиля"),
+    "/login": ("login.html", "Страница входа"),
+    "/cart": ("cart.html", "Страница корзины"),
+    "/product/{product_id:int}": ("product.html", "Страница товара"),
+    "/blog": ("blog.html", "Страница блога"),
+}
 
-    except Exception as e:
-        logger.error(f"Ошибка загрузки главной страницы: {e}")
-        return HTMLResponse(content=f"<h1>Ошибка загрузки: {e}</h1>", status_code=500)
-
-@app.get("/favorites", response_class=HTMLResponse)
-async def favorites_page():
-    """Страница избранного"""
-    try:
-        # Получаем абсолютный путь к файлу favorites.html
-        current_dir = os.path.dirname(__file__)
-        html_path = os.path.join(current_dir, "..", "client", "favorites.html")
-
-        if os.path.exists(html_path):
-            with open(html_path, "r", encoding="utf-8") as f:
-                html_content = f.read()
-            return HTMLResponse(content=html_content)
-        else:
-            ...
-    except Exception as e:
-        logger.error(f"Ошибка загрузки страницы избранного: {e}")
-        raise HTTPException(status_code=500, detail="Ошибка загрузки страницы избранного")
+page_store = PageStore(
+    os.path.join(os.path.dirname(__file__), "..", "client"),
+    reload=settings.debug
+)
 
-@app.get("/profile", response_class=HTMLResponse)
-async def profile_page():
-    """Страница профиля"""
-    try:
-        current_dir = os.path.dirname(__file__)
-        html_path = os.path.join(current_dir, "..", "client", "profile.html")
-
-        if os.path.exists(html_path):
-            with open(html_path, "r", encoding="utf-8") as f:
-                html_content = f.read()
-            return HTMLResponse(content=html_content)
-        else:
-            ...
-    except Exception as e:
-        logger.error(f"Ошибка загрузки страницы профиля: {e}")
-        raise HTTPException(status_code=500, detail="Ошибка загрузки страницы профиля")
 
+def make_page_handler(filename: str):
+    """Обработчик, отдающий страницу из памяти"""
+    async def page_handler(request: Request):
+        return page_store.response(request, filename)
+    return page_handler
 
-@app.get("/login", response_class=HTMLResponse)
-async def login_page():
-    """Страница входа"""
-    try:
-        current_dir = os.path.dirname(__file__)
-        html_path = os.path.join(current_dir, "..", "client", "login.html")
-
-        if os.path.exists(html_path):
-            with open(html_path, "r", encoding="utf-8") as f:
-                html_content = f.read()
-            return HTMLResponse(content=html_content)
-        else:
-            ...
-    except Exception as e:
-        logger.error(f"Ошибка загрузки страницы входа: {e}")
-        raise HTTPException(status_code=500, detail="Ошибка загрузки страницы входа")
 
-@app.get("/cart", response_class=HTMLResponse)
-async def cart_page():
-    """Страница корзины"""
-    try:
-        current_dir = os.path.dirname(__file__)
-        html_path = os.path.join(current_dir, "..", "client", "cart.html")
-
-        if os.path.exists(html_path):
-            with open(html_path, "r", encoding="utf-8") as f:
-                html_content = f.read()
-            return HTMLResponse(content=html_content)
-        else:
-            ...
-    except Exception as e:
-        logger.error(f"Ошибка загрузки страницы корзины: {e}")
-        raise HTTPException(status_code=500, detail="Ошибка загрузки страницы корзины")
+for page_path, (page_file, page_summary) in HTML_PAGES.items():
+    app.add_api_route(
+        page_path,
+        make_page_handler(page_file),
+        methods=["GET"],
+        response_class=HTMLResponse,
+        summary=page_summary
+    )
 
-@app.get("/product/{product_id}", response_class=HTMLResponse)
-async def product_page(product_id: int):
-    """Страница товара"""
-    try:
-        current_dir = os.path.dirname(__file__)
-        html_path = os.path.join(current_dir, "..", "client", "product.html")
-
-        if os.path.exists(html_path):
-            with open(html_path, "r", encoding="utf-8") as f:
-                html_content = f.read()
-            return HTMLResponse(content=html_content)
-        else:
-            ...
-    except Exception as e:
-        logger.error(f"Ошибка загрузки страницы товара: {e}")
-        raise HTTPException(status_code=500, detail="Ошибка загрузки страницы товара")
+# Метрики в формате Prometheus
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics(request: Request):
+    if not metrics.check_token(request.headers.get("authorization"), settings.metrics_token):
+        raise HTTPException(status_code=401, detail="Требуется токен доступа к метрикам")
+    return PlainTextResponse(metrics.render(), media_type=metrics.CONTENT_TYPE)
 
-@app.get("/blog", response_class=HTMLResponse)
-async def blog_page():
-    """Страница блога"""
-    try:
-        current_dir = os.path.dirname(__file__)
-        html_path = os.path.join(current_dir, "..", "client", "blog.html")
-
-        if os.path.exists(html_path):
-            with open(html_path, "r", encoding="utf-8") as f:
-                html_content = f.read()
-            return HTMLResponse(content=html_content)
-        else:
-            ...
-    except Exception as e:
-        logger.error(f"Ошибка загрузки страницы блога: {e}")
-        raise HTTPException(status_code=500, detail="Ошибка загрузки страницы блога")
 
 # Эндпоинт для проверки статуса
 @app.get("/status")
@@ -0,0 +1,71 @@
+"""Приём обновлений Telegram бота через вебхук сервера"""
+import hmac
+import logging
+from typing import Optional
+
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import Response
+
+from server.config import settings
+from server.database import db_connection
+
+logger = logging.getLogger(__name__)
+
+WEBHOOK_PATH = "/telegram/webhook"
+
+router = APIRouter()
+
+# Бот, запущенный в этом процессе сервера
+telegram_bot = None
+
+
+def webhook_enabled() -> bool:
+    """Включён ли режим вебхука"""
+    return bool(settings.bot_token and settings.telegram_webhook_url)
+
+
+async def start_telegram_bot():
+    """Запуск бота на пуле соединений и цикле событий сервера"""
+    global telegram_bot
+    if not webhook_enabled():
+        return
+
+    # Импорт здесь: модуль бота нужен только в режиме вебхука
+    from bot.telegram_bot import RukamiBot
+
+    bot = RukamiBot()
+    webhook_url = settings.telegram_webhook_url.rstrip("/") + WEBHOOK_PATH
+    await bot.start_webhook(db_connection.db_pool, webhook_url, settings.telegram_webhook_secret)
+    telegram_bot = bot
+
+
+async def stop_telegram_bot():
+    """Остановка бота"""
+    global telegram_bot
+    if telegram_bot is not None:
+        await telegram_bot.stop_webhook()
+        telegram_bot = None
+
+
+@router.post(WEBHOOK_PATH, include_in_schema=False)
+async def telegram_webhook(request: Request):
+    """Обновление от Telegram"""
+    if telegram_bot is None:
+        raise HTTPException(status_code=404, detail="Бот не запущен в режиме вебхука")
+
+    secret: Optional[str] = request.headers.get("x-telegram-bot-api-secret-token")
+    if not secret or not hmac.compare_digest(secret, settings.telegram_webhook_secret):
+        raise HTTPException(status_code=403, detail="Неверный секретный токен")
+
+    try:
+        data = await request.json()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Некорректное обновление")
+
+    if not isinstance(data, dict) or 'update_id' not in data:
+        raise HTTPException(status_code=400, detail="Некорректное обновление")
+
+    # Обновление обрабатывает лидер (см. RukamiBot.process_queued_updates),
+    # чтобы шаги одного диалога не расходились по разным процессам
+    await telegram_bot.enqueue_webhook_update(data)
+    return Response(status_code=200)
@@ -0,0 +1,272 @@
+"""Микробенчмарки горячих путей API
+
+Раздельно замеряется каждая стадия ответа со списком товаров:
+- db.*: fetch_all/fetch_one из db_connection против прямого вызова asyncpg
+  (нужна база, флаг --db);
+- helper.*: накладные расходы обёртки fetch_all без сети (фиктивное соединение);
+- convert.records_to_dicts: [dict(row) for row in rows], как в обработчиках;
+- encode.*: сериализация ответа - путь FastAPI (jsonable_encoder + JSONResponse),
+  FastJSONResponse API прямо по строкам (encode.fast_response) и альтернативы
+  (json.dumps с default, orjson при наличии).
+
+Размеры списков: 20, 100 и 10000 строк. Результаты дописываются в
+tests/benchmarks/history.jsonl вместе с коммитом и сравниваются с прошлым
+запуском того же режима.
+
+Пример:
+    python -m tests.benchmarks.bench_hotpaths           # без базы
+    python -m tests.benchmarks.bench_hotpaths --db      # с PostgreSQL из .env
+"""
+import argparse
+import asyncio
+import json
+import platform
+import statistics
+import subprocess
+import time
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+from server.database import db_connection
+from server.database.db_connection import fetch_all, fetch_one, register_query
+from server.responses import dumps as fast_dumps
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+HISTORY_FILE = Path(__file__).with_name("history.jsonl")
+SIZES = (20, 100, 10000)
+
+# Строки той же формы, что отдаёт products.page, генерируются на стороне СУБД
+BENCH_PRODUCTS_QUERY = register_query("bench.products", """
+    SELECT g AS id, 'Керамическая ваза ' || g AS name,
+           repeat('Изделие ручной работы. ', 4) AS description,
+           (1000 + g % 5000)::numeric(10,2) + 0.99 AS price,
+           'product-' || (g % 500) || '.jpg' AS image_url, (g % 10 <> 0) AS in_stock,
+           TIMESTAMPTZ '2025-01-01' - g * INTERVAL '1 minute' AS created_at,
+           g % 10 + 1 AS category_id, 'Керамика' AS category_name, 'ceramics' AS category_slug,
+           'Мария Петрова' AS author_name
+    FROM generate_series(1, $1) AS g
+""")
+
+
+def make_rows(size: int) -> List[Dict[str, Any]]:
+    """Строки товаров без базы (словари вместо asyncpg.Record)"""
+    created = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    return [{
+        "id": i, "name": f"Керамическая ваза {i}",
+        "description": "Изделие ручной работы. " * 4,
+        "price": Decimal(1000 + i % 5000) + Decimal("0.99"),
+        "image_url": f"product-{i % 500}.jpg", "in_stock": i % 10 != 0,
+        "created_at": created - timedelta(minutes=i),
+        "category_id": i % 10 + 1, "category_name": "Керамика", "category_slug": "ceramics",
+        "author_name": "Мария Петрова",
+    } for i in range(1, size + 1)]
+
+
+def json_default(value: Any) -> Any:
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Тип {type(value).__name__} не сериализуется")
+
+
+def encode_fastapi(content: Dict[str, Any]) -> bytes:
+    """Путь FastAPI без response_model: jsonable_encoder, затем JSONResponse"""
+    return JSONResponse(jsonable_encoder(content)).body
+
+
+def encode_json_default(content: Dict[str, Any]) -> bytes:
+    return json.dumps(content, ensure_ascii=False, separators=(",", ":"), default=json_default).encode("utf-8")
+
+
+def encode_orjson(content: Dict[str, Any]) -> bytes:
+    return orjson.dumps(content, default=json_default)
+
+
+def measure(func: Callable[[], Any], repeat: int, min_time: float) -> List[float]:
+    """Время одного вызова (сек) в repeat замерах; число вызовов в замере
+    подбирается так, чтобы замер длился не меньше min_time"""
+    number = 1
+    while True:
+        started = time.perf_counter()
+        for _ in range(number):
+            func()
+        elapsed = time.perf_counter() - started
+        if elapsed >= min_time:
+            break
+        number *= 2
+    samples = [elapsed / number]
+    for _ in range(repeat - 1):
+        started = time.perf_counter()
+        for _ in range(number):
+            func()
+        samples.append((time.perf_counter() - started) / number)
+    return samples
+
+
+async def measure_async(func: Callable[[], Awaitable[Any]], repeat: int, min_time: float) -> List[float]:
+    number = 1
+    while True:
+        started = time.perf_counter()
+        for _ in range(number):
+            await func()
+        elapsed = time.perf_counter() - started
+        if elapsed >= min_time:
+            break
+        number *= 2
+    samples = [elapsed / number]
+    for _ in range(repeat - 1):
+        started = time.perf_counter()
+        for _ in range(number):
+            await func()
+        samples.append((time.perf_counter() - started) / number)
+    return samples
+
+
+def describe(samples: List[float], size: int) -> Dict[str, float]:
+    median = statistics.median(samples)
+    return {
+        "median_us": round(median * 1e6, 2),
+        "min_us": round(min(samples) * 1e6, 2),
+        "per_row_us": round(median * 1e6 / size, 3),
+    }
+
+
+class FakeStatement:
+    """Подготовленный запрос без сети: сразу возвращает готовые строки"""
+
+    def __init__(self, rows):
+        self.rows = rows
+
+    async def fetch(self, *args):
+        return self.rows
+
+    async def fetchrow(self, *args):
+        return self.rows[0]
+
+
+class FakeConnection:
+    def __init__(self, rows):
+        self.named_statements = {BENCH_PRODUCTS_QUERY: FakeStatement(rows)}
+
+
+async def run_benchmarks(use_db: bool, sizes, repeat: int, min_time: float) -> Dict[str, Dict[str, Any]]:
+    results: Dict[str, Dict[str, Any]] = {}
+
+    def add(name: str, size: int, samples: List[float]):
+        results.setdefault(name, {})[str(size)] = describe(samples, size)
+
+    if use_db:
+        await db_connection.init_database(create_schema=False)
+
+    try:
+        for size in sizes:
+            if use_db:
+                async with db_connection.db_pool.acquire() as connection:
+                    rows = await fetch_all(BENCH_PRODUCTS_QUERY, size, connection=connection)
+                    add("db.fetch_all", size, await measure_async(
+                        lambda: fetch_all(BENCH_PRODUCTS_QUERY, size, connection=connection), repeat, min_time))
+                    add("db.fetch_all_pool", size, await measure_async(
+                        lambda: fetch_all(BENCH_PRODUCTS_QUERY, size), repeat, min_time))
+                    add("db.asyncpg_fetch", size, await measure_async(
+                        lambda: connection.named_statements[BENCH_PRODUCTS_QUERY].fetch(size), repeat, min_time))
+                    if size == sizes[0]:
+                        add("db.fetch_one", 1, await measure_async(
+                            lambda: fetch_one(BENCH_PRODUCTS_QUERY, 1, connection=connection), repeat, min_time))
+            else:
+                rows = make_rows(size)
+
+            fake = FakeConnection(rows)
+            add("helper.fetch_all", size, await measure_async(
+                lambda: fetch_all(BENCH_PRODUCTS_QUERY, size, connection=fake), repeat, min_time))
+
+            add("convert.records_to_dicts", size, measure(lambda: [dict(row) for row in rows], repeat, min_time))
+
+            content = {"products": [dict(row) for row in rows], "total": size, "next_cursor": None}
+            add("encode.fastapi", size, measure(lambda: encode_fastapi(content), repeat, min_time))
+            add("encode.json_default", size, measure(lambda: encode_json_default(content), repeat, min_time))
+            add("encode.fast_response", size, measure(
+                lambda: fast_dumps({"products": rows, "total": size, "next_cursor": None}), repeat, min_time))
+            if orjson is not None:
+                add("encode.orjson", size, measure(lambda: encode_orjson(content), repeat, min_time))
+    finally:
+        if use_db:
+            await db_connection.close_database_pool()
+
+    return results
+
+
+def current_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True, cwd=Path(__file__).parent).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def load_previous(mode: str) -> Optional[Dict[str, Any]]:
+    """Последняя запись истории того же режима (db / offline)"""
+    if not HISTORY_FILE.exists():
+        return None
+    previous = None
+    for line in HISTORY_FILE.read_text(encoding="utf-8").splitlines():
+        if line.strip():
+            entry = json.loads(line)
+            if entry.get("mode") == mode:
+                previous = entry
+    return previous
+
+
+def print_report(results: Dict[str, Dict[str, Any]], previous: Optional[Dict[str, Any]]):
+    old = previous["results"] if previous else {}
+    if previous:
+        print(f"Сравнение с {previous['timestamp']} ({previous.get('commit') or '?'})")
+    print(f"{'бенчмарк':<28}{'строк':>8}{'медиана, мкс':>15}{'мкс/строку':>13}{'изменение':>12}")
+    for name, by_size in results.items():
+        for size, values in by_size.items():
+            before = old.get(name, {}).get(size)
+            change = f"{(values['median_us'] / before['median_us'] - 1) * 100:+.1f}%" if before else ""
+            print(f"{name:<28}{size:>8}{values['median_us']:>15}{values['per_row_us']:>13}{change:>12}")
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Микробенчмарки горячих путей API")
+    parser.add_argument("--db", action="store_true", help="замерять запросы к PostgreSQL (настройки из .env)")
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(SIZES), help="размеры списков")
+    parser.add_argument("--repeat", type=int, default=5, help="число замеров")
+    parser.add_argument("--min-time", type=float, default=0.2, help="минимальная длительность замера, с")
+    parser.add_argument("--no-save", action="store_true", help="не записывать результат в историю")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    mode = "db" if args.db else "offline"
+    results = asyncio.run(run_benchmarks(args.db, args.sizes, args.repeat, args.min_time))
+    print_report(results, load_previous(mode))
+
+    if not args.no_save:
+        entry = {
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "commit": current_commit(),
+            "mode": mode,
+            "python": platform.python_version(),
+            "machine": platform.node(),
+            "results": results,
+        }
+        with HISTORY_FILE.open("a", encoding="utf-8") as history:
+            history.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        print(f"\nРезультат добавлен в {HISTORY_FILE}")
+
+
+if __name__ == "__main__":
+    main()
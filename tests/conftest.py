@@ -0,0 +1,8 @@
+"""Общие фикстуры тестов"""
+import pytest
+
+
+@pytest.fixture
+def anyio_backend():
+    """Асинхронные тесты (@pytest.mark.anyio) выполняются на asyncio"""
+    return "asyncio"
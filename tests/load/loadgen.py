@@ -0,0 +1,315 @@
+"""Нагрузочный тест API Rukami
+
+Виртуальные пользователи (задачи asyncio) по кругу выполняют сценарии из
+JSON-файла: последовательности запросов, повторяющие переходы по страницам
+сайта. Значения из ответов (id товара, slug категории, курсор) подставляются
+в следующие запросы. По итогам печатается пропускная способность, доля
+ошибок и перцентили задержки по каждому шагу; результат можно сохранить как
+эталон и сравнивать с ним следующие прогоны.
+
+Пример:
+    python -m tests.load.loadgen tests/load/scenarios/browse.json \\
+        --base-url http://127.0.0.1:8000 --users 50 --duration 60 \\
+        --baseline tests/load/baselines/browse.json
+"""
+import argparse
+import asyncio
+import json
+import math
+import random
+import re
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, List
+from urllib.parse import quote
+
+import httpx
+
+PLACEHOLDER = re.compile(r"\{(\w+)\}")
+
+
+class StepFailed(Exception):
+    """Шаг не выполнен: следующие шаги сценария зависят от его результата"""
+
+
+def percentile(sorted_values: List[float], p: float) -> float:
+    """Перцентиль методом ближайшего ранга"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(p / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def extract(data: Any, path: str, rng: random.Random) -> Any:
+    """Значение из JSON ответа по пути вида products[*].id или categories[*].slug.
+    [*] - случайный элемент списка, [0] - элемент по индексу"""
+    for part in re.findall(r"[^.\[\]]+|\[[^\]]*\]", path):
+        if data is None:
+            return None
+        if part == "[*]":
+            data = rng.choice(data) if data else None
+        elif part.startswith("["):
+            index = int(part[1:-1])
+            data = data[index] if -len(data) <= index < len(data) else None
+        else:
+            data = data.get(part) if isinstance(data, dict) else None
+    return data
+
+
+class Stats:
+    """Задержки и ошибки по именам шагов"""
+
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = {}
+        self.errors: Dict[str, int] = {}
+        self.statuses: Dict[str, Dict[str, int]] = {}
+        self.started_at = math.inf
+        self.finished_at = math.inf
+
+    def record(self, name: str, elapsed_ms: float, status: str, ok: bool):
+        # Учитываются только запросы, завершившиеся в окне замера (после прогрева)
+        if not self.started_at <= time.monotonic() <= self.finished_at:
+            return
+        self.latencies.setdefault(name, []).append(elapsed_ms)
+        self.errors[name] = self.errors.get(name, 0) + (0 if ok else 1)
+        statuses = self.statuses.setdefault(name, {})
+        statuses[status] = statuses.get(status, 0) + 1
+
+    def summary(self) -> Dict[str, Any]:
+        duration = max(self.finished_at - self.started_at, 1e-9)
+        endpoints = {}
+        all_latencies: List[float] = []
+        for name, values in sorted(self.latencies.items()):
+            values = sorted(values)
+            all_latencies.extend(values)
+            endpoints[name] = self._describe(values, self.errors[name], duration)
+            endpoints[name]["statuses"] = self.statuses[name]
+        return {
+            "duration_s": round(duration, 2),
+            "total": self._describe(sorted(all_latencies), sum(self.errors.values()), duration),
+            "endpoints": endpoints,
+        }
+
+    @staticmethod
+    def _describe(values: List[float], errors: int, duration: float) -> Dict[str, Any]:
+        count = len(values)
+        return {
+            "requests": count,
+            "rps": round(count / duration, 1),
+            "error_rate": round(errors / count, 4) if count else 0.0,
+            "mean_ms": round(sum(values) / count, 2) if count else 0.0,
+            "p50_ms": round(percentile(values, 50), 2),
+            "p95_ms": round(percentile(values, 95), 2),
+            "p99_ms": round(percentile(values, 99), 2),
+            "max_ms": round(values[-1], 2) if values else 0.0,
+        }
+
+
+class VirtualUser:
+    """Пользователь сайта: логин (если нужен) и бесконечный цикл сценариев"""
+
+    def __init__(self, number: int, client: httpx.AsyncClient, scenario: Dict[str, Any],
+                 stats: Stats, rng: random.Random):
+        self.number = number
+        self.client = client
+        self.scenario = scenario
+        self.stats = stats
+        self.rng = rng
+        self.headers: Dict[str, str] = {}
+        self.flows = scenario["flows"]
+        self.weights = [flow.get("weight", 1) for flow in self.flows]
+
+    async def request(self, name: str, method: str, url: str, expect: List[int], **kwargs) -> httpx.Response:
+        started = time.perf_counter()
+        try:
+            response = await self.client.request(method, url, headers=self.headers, **kwargs)
+        except httpx.HTTPError as e:
+            self.stats.record(name, (time.perf_counter() - started) * 1000, type(e).__name__, False)
+            raise StepFailed(f"{name}: {e}")
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        ok = response.status_code in expect
+        self.stats.record(name, elapsed_ms, str(response.status_code), ok)
+        if not ok:
+            raise StepFailed(f"{name}: HTTP {response.status_code}")
+        return response
+
+    async def login(self):
+        """Вход под одним из пользователей генератора данных (user<N>@example.test)"""
+        auth = self.scenario["auth"]
+        account = self.rng.randint(auth.get("first_user", 1), auth.get("last_user", 1000))
+        response = await self.request("auth_login", "POST", "/api/auth/login", [200], json={
+            "email": auth.get("email", "user{n}@example.test").format(n=account),
+            "password": auth.get("password", "password"),
+        })
+        self.headers["Authorization"] = f"Bearer {response.json()['access_token']}"
+
+    async def run_flow(self, flow: Dict[str, Any]):
+        variables: Dict[str, Any] = dict(self.scenario.get("variables", {}))
+        # Значения, выбираемые случайно при каждом запуске сценария (например, поисковые запросы)
+        for name, options in self.scenario.get("choices", {}).items():
+            variables[name] = self.rng.choice(options)
+        for step in flow["steps"]:
+            names = PLACEHOLDER.findall(step["path"])
+            if any(variables.get(name) in (None, "") for name in names):
+                # Нужное значение не нашлось (например, пустая категория) - шаг пропускается
+                if step.get("optional"):
+                    continue
+                return
+            path = PLACEHOLDER.sub(lambda m: quote(str(variables[m.group(1)]), safe=""), step["path"])
+
+            response = await self.request(
+                step.get("name", step["path"]), step.get("method", "GET"), path,
+                step.get("expect", [200]), json=step.get("json")
+            )
+            if step.get("extract"):
+                data = response.json()
+                for variable, json_path in step["extract"].items():
+                    variables[variable] = extract(data, json_path, self.rng)
+
+            await self.think()
+
+    async def think(self):
+        low, high = self.scenario.get("think_time", [0, 0])
+        if high > 0:
+            await asyncio.sleep(self.rng.uniform(low, high))
+
+    async def run(self, stop_at: float):
+        if self.scenario.get("auth"):
+            while time.monotonic() < stop_at:
+                try:
+                    await self.login()
+                    break
+                except StepFailed:
+                    await asyncio.sleep(1)
+
+        while time.monotonic() < stop_at:
+            flow = self.rng.choices(self.flows, weights=self.weights)[0]
+            try:
+                await self.run_flow(flow)
+            except StepFailed:
+                await self.think()
+            except (ValueError, KeyError, TypeError):
+                # Ответ не того формата - ошибка уже учтена по статусу, сценарий начинается заново
+                await self.think()
+
+
+async def run_load(scenario: Dict[str, Any], base_url: str, users: int, duration: float,
+                   ramp_up: float, warmup: float, seed: int, timeout: float) -> Dict[str, Any]:
+    stats = Stats()
+    limits = httpx.Limits(max_connections=users, max_keepalive_connections=users)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=timeout) as client:
+        started = time.monotonic()
+        stop_at = started + warmup + duration
+        stats.started_at = started + warmup
+        stats.finished_at = stop_at
+        tasks = []
+        for number in range(users):
+            user = VirtualUser(number, client, scenario, stats, random.Random(f"{seed}-{number}"))
+            tasks.append(asyncio.create_task(user.run(stop_at)))
+            # Пользователи подключаются равномерно за время разгона
+            if ramp_up > 0:
+                await asyncio.sleep(ramp_up / users)
+
+        await asyncio.gather(*tasks)
+
+    result = stats.summary()
+    result.update({"scenario": scenario.get("name"), "users": users, "base_url": base_url})
+    return result
+
+
+def compare_with_baseline(result: Dict[str, Any], baseline: Dict[str, Any], tolerance: float,
+                          error_tolerance: float, min_delta_ms: float = 0.0) -> List[str]:
+    """Регрессии относительно эталона: рост p95/p99 больше чем на tolerance
+    (и не меньше min_delta_ms), рост доли ошибок больше чем на error_tolerance,
+    падение RPS"""
+    regressions = []
+    for name, base in baseline.get("endpoints", {}).items():
+        current = result["endpoints"].get(name)
+        if current is None:
+            regressions.append(f"{name}: нет запросов в текущем прогоне")
+            continue
+        for metric in ("p95_ms", "p99_ms"):
+            if current[metric] > base[metric] * (1 + tolerance) and current[metric] - base[metric] >= min_delta_ms:
+                regressions.append(f"{name}: {metric} {current[metric]} > {base[metric]} (+{tolerance:.0%})")
+        if current["error_rate"] > base["error_rate"] + error_tolerance:
+            regressions.append(f"{name}: доля ошибок {current['error_rate']} > {base['error_rate']}")
+
+    base_rps = baseline.get("total", {}).get("rps")
+    if base_rps and result["total"]["rps"] < base_rps * (1 - tolerance):
+        regressions.append(f"RPS {result['total']['rps']} < {base_rps} (-{tolerance:.0%})")
+    return regressions
+
+
+def print_report(result: Dict[str, Any]):
+    columns = ("requests", "rps", "error_rate", "p50_ms", "p95_ms", "p99_ms", "max_ms")
+    header = f"{'шаг':<28}" + "".join(f"{column:>12}" for column in columns)
+    print(f"\nСценарий {result['scenario']}: {result['users']} пользователей, {result['duration_s']} с")
+    print(header)
+    print("-" * len(header))
+    rows = list(result["endpoints"].items()) + [("ВСЕГО", result["total"])]
+    for name, values in rows:
+        print(f"{name:<28}" + "".join(f"{values[column]:>12}" for column in columns))
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Нагрузочный тест API Rukami")
+    parser.add_argument("scenario", help="JSON-файл сценария")
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+    parser.add_argument("--users", type=int, help="число виртуальных пользователей (по умолчанию из сценария)")
+    parser.add_argument("--duration", type=float, help="длительность замера, с")
+    parser.add_argument("--ramp-up", type=float, help="время подключения всех пользователей, с")
+    parser.add_argument("--warmup", type=float, default=5.0, help="прогрев без записи результатов, с")
+    parser.add_argument("--timeout", type=float, default=30.0, help="таймаут запроса, с")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="сохранить результат в JSON")
+    parser.add_argument("--baseline", help="эталон для сравнения (JSON результата прошлого прогона)")
+    parser.add_argument("--save-baseline", action="store_true", help="записать результат в файл --baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="допустимое ухудшение p95/p99 и RPS")
+    parser.add_argument("--min-delta-ms", type=float, default=5.0,
+                        help="рост p95/p99 меньше этого значения не считается регрессией (шум)")
+    parser.add_argument("--error-tolerance", type=float, default=0.01, help="допустимый рост доли ошибок")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    scenario = json.loads(Path(args.scenario).read_text(encoding="utf-8"))
+    users = args.users or scenario.get("users", 10)
+    duration = args.duration or scenario.get("duration", 30)
+    ramp_up = args.ramp_up if args.ramp_up is not None else scenario.get("ramp_up", 0)
+
+    result = asyncio.run(run_load(scenario, args.base_url, users, duration, ramp_up,
+                                  args.warmup, args.seed, args.timeout))
+    print_report(result)
+
+    if args.output:
+        Path(args.output).write_text(json.dumps(result, ensure_ascii=False, indent=2), encoding="utf-8")
+
+    if not args.baseline:
+        return 0
+
+    baseline_path = Path(args.baseline)
+    if args.save_baseline:
+        baseline_path.parent.mkdir(parents=True, exist_ok=True)
+        baseline_path.write_text(json.dumps(result, ensure_ascii=False, indent=2), encoding="utf-8")
+        print(f"\nЭталон сохранён: {baseline_path}")
+        return 0
+
+    if not baseline_path.exists():
+        print(f"\nЭталон {baseline_path} не найден; сохраните его флагом --save-baseline")
+        return 0
+
+    regressions = compare_with_baseline(result, json.loads(baseline_path.read_text(encoding="utf-8")),
+                                        args.tolerance, args.error_tolerance, args.min_delta_ms)
+    if regressions:
+        print("\n❌ Регрессии относительно эталона:")
+        for line in regressions:
+            print(f"  - {line}")
+        return 1
+    print("\n✅ Результат в пределах эталона")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
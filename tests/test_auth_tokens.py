@@ -0,0 +1,122 @@
+"""Тесты токенов авторизации: состав токена и отзыв при выходе и смене пароля"""
+from datetime import datetime, timedelta, timezone
+
+import jwt
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from server.api import api_implementation
+from server.api.api_implementation import (
+    ALGORITHM, create_access_token, get_connection, router, user_claims, verified_user_cache
+)
+from server.config import settings
+
+USER = {
+    "id": 1,
+    "name": "Анна",
+    "email": "anna@example.com",
+    "phone": "+79990000000",
+    "address": "Москва",
+    "created_at": datetime(2024, 1, 1, tzinfo=timezone.utc),
+}
+
+
+@pytest.fixture
+def users(monkeypatch):
+    """Таблица users в словаре: id -> строка с token_version"""
+    table = {1: {**USER, "token_version": 0}}
+    monkeypatch.setattr(settings, "secret_key", "test-secret-key-for-tokens-0123456789")
+    verified_user_cache.clear()
+
+    async def fetch_one(query, user_id, connection=None):
+        assert "token_version" in query
+        row = table.get(user_id)
+        return dict(row) if row else None
+
+    async def revoke_user_tokens(user_id, connection=None):
+        table[user_id]["token_version"] += 1
+        return table[user_id]["token_version"]
+
+    monkeypatch.setattr(api_implementation, "fetch_one", fetch_one)
+    monkeypatch.setattr(api_implementation, "revoke_user_tokens", revoke_user_tokens)
+    yield table
+    verified_user_cache.clear()
+
+
+@pytest.fixture
+def client(users):
+    app = FastAPI()
+    app.include_router(router)
+    return TestClient(app)
+
+
+def token_for(user, version=0):
+    return create_access_token(user_claims({**user, "token_version": version}), timedelta(minutes=30))
+
+
+def bearer(token):
+    return {"Authorization": f"Bearer {token}"}
+
+
+def test_token_carries_no_contact_data(users):
+    claims = jwt.decode(token_for(USER), settings.secret_key, algorithms=[ALGORITHM])
+    assert set(claims) == {"sub", "name", "ver", "exp", "iat"}
+
+
+def test_current_user_is_loaded_from_verified_user_cache(client):
+    response = client.get("/api/auth/me", headers=bearer(token_for(USER)))
+    assert response.status_code == 200
+    user = response.json()
+    assert user["email"] == USER["email"] and user["phone"] == USER["phone"]
+    assert "token_version" not in user
+
+
+def test_logout_revokes_outstanding_tokens(client, users):
+    token = token_for(USER)
+    other_device = token_for(USER)
+
+    assert client.post("/api/auth/logout", headers=bearer(token)).status_code == 200
+    assert users[1]["token_version"] == 1
+
+    response = client.get("/api/auth/me", headers=bearer(other_device))
+    assert response.status_code == 401
+    assert response.json()["detail"] == "Сессия завершена, войдите снова"
+
+
+def test_logout_without_token_still_clears_cookie(client, users):
+    response = client.post("/api/auth/logout")
+    assert response.status_code == 200
+    assert users[1]["token_version"] == 0
+
+
+def test_password_change_revokes_old_tokens_and_issues_new_one(client, users, monkeypatch):
+    async def no_connection():
+        yield None
+
+    async def verify_password(password, password_hash):
+        return password == "old-password"
+
+    async def hash_password(password):
+        return f"hash:{password}"
+
+    async def update_password_hash(user_id, password_hash, connection=None):
+        users[user_id]["password_hash"] = password_hash
+
+    async def fetch_one(query, user_id, connection=None):
+        return dict(users[user_id], password_hash="hash:old-password")
+
+    client.app.dependency_overrides[get_connection] = no_connection
+    monkeypatch.setattr(api_implementation, "verify_password", verify_password)
+    monkeypatch.setattr(api_implementation, "hash_password", hash_password)
+    monkeypatch.setattr(api_implementation, "update_password_hash", update_password_hash)
+    monkeypatch.setattr(api_implementation, "fetch_one", fetch_one)
+
+    old_token = token_for(USER)
+    response = client.post("/api/profile/password", headers=bearer(old_token),
+                           json={"current_password": "old-password", "new_password": "new-password"})
+    assert response.status_code == 200
+    assert users[1]["token_version"] == 1
+
+    assert client.get("/api/auth/me", headers=bearer(old_token)).status_code == 401
+    assert client.get("/api/auth/me", headers=bearer(response.json()["access_token"])).status_code == 200
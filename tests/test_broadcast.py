@@ -0,0 +1,150 @@
+"""Тесты рассылки с ограничением скорости (bot/broadcast.py)"""
+import time
+from datetime import timedelta
+
+import pytest
+from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter
+
+from bot.broadcast import Broadcaster, TokenBucket
+
+pytestmark = pytest.mark.anyio
+
+# Запас на неточность таймеров цикла событий
+EPSILON = 0.01
+
+
+class FakeBot:
+    """Отправка в чат с заранее заданными ошибками: chat_id -> список исключений
+    (None - успешная отправка) для последовательных попыток"""
+
+    def __init__(self, failures=None):
+        self.failures = {chat_id: list(errors) for chat_id, errors in (failures or {}).items()}
+        self.attempts = []
+        self.delivered = []
+
+    async def send(self, chat_id, item):
+        self.attempts.append((chat_id, item, time.monotonic()))
+        errors = self.failures.get(chat_id)
+        if errors:
+            error = errors.pop(0)
+            if error is not None:
+                raise error
+        self.delivered.append((chat_id, item))
+
+    def times(self, chat_id):
+        return [at for chat, _, at in self.attempts if chat == chat_id]
+
+
+async def test_token_bucket_limits_rate():
+    bucket = TokenBucket(rate=50, capacity=1)
+    started = time.monotonic()
+    for _ in range(6):
+        await bucket.acquire()
+    # Первый токен есть сразу, остальные пять - по одному за 1/50 с
+    assert time.monotonic() - started >= 5 / 50 - EPSILON
+
+
+async def test_token_bucket_burst_up_to_capacity():
+    bucket = TokenBucket(rate=10, capacity=5)
+    started = time.monotonic()
+    for _ in range(5):
+        await bucket.acquire()
+    assert time.monotonic() - started < 0.05
+
+
+async def test_token_bucket_pause():
+    bucket = TokenBucket(rate=1000)
+    bucket.pause(0.1)
+    started = time.monotonic()
+    await bucket.acquire()
+    assert time.monotonic() - started >= 0.1 - EPSILON
+
+
+async def test_broadcast_sends_everything_with_chat_interval():
+    bot = FakeBot()
+    broadcaster = Broadcaster(bot.send, rate=1000, workers=4, chat_interval=0.05)
+    stats = await broadcaster.run([1, 2, 3], ["a", "b"])
+
+    assert stats.sent == 6 and stats.failed == 0
+    assert sorted(bot.delivered) == [(chat, item) for chat in (1, 2, 3) for item in ("a", "b")]
+    for chat_id in (1, 2, 3):
+        first, second = bot.times(chat_id)
+        assert second - first >= 0.05 - EPSILON
+    # Сообщения одного чата идут по порядку
+    assert [item for chat, item in bot.delivered if chat == 1] == ["a", "b"]
+
+
+async def test_broadcast_empty_input():
+    bot = FakeBot()
+    stats = await Broadcaster(bot.send).run([], ["a"])
+    assert stats.sent == 0
+    stats = await Broadcaster(bot.send).run([1], [])
+    assert stats.sent == 0 and bot.attempts == []
+
+
+async def test_retry_after_pauses_everyone_and_repeats_message():
+    bot = FakeBot({1: [RetryAfter(timedelta(milliseconds=150))]})
+    broadcaster = Broadcaster(bot.send, rate=1000, workers=1, chat_interval=0)
+    stats = await broadcaster.run([1, 2], ["a"])
+
+    assert stats.rate_limited == 1
+    assert stats.sent == 2 and stats.failed == 0
+    first_try, retry = bot.times(1)
+    assert retry - first_try >= 0.15 - EPSILON
+    # Пауза общая: второй чат тоже ждёт её окончания
+    assert bot.times(2)[0] - first_try >= 0.15 - EPSILON
+
+
+async def test_forbidden_marks_chat_blocked_and_skips_rest():
+    blocked = []
+
+    async def on_blocked(chat_id):
+        blocked.append(chat_id)
+
+    bot = FakeBot({1: [Forbidden("bot was blocked by the user")]})
+    broadcaster = Broadcaster(bot.send, rate=1000, chat_interval=0, on_blocked=on_blocked)
+    stats = await broadcaster.run([1, 2], ["a", "b", "c"])
+
+    assert blocked == [1]
+    assert stats.blocked == 1 and stats.skipped == 2
+    assert len(bot.times(1)) == 1
+    assert stats.sent == 3
+
+
+async def test_on_blocked_error_does_not_stop_broadcast():
+    async def on_blocked(chat_id):
+        raise RuntimeError("db is down")
+
+    bot = FakeBot({1: [Forbidden("blocked")]})
+    stats = await Broadcaster(bot.send, rate=1000, chat_interval=0, on_blocked=on_blocked).run([1, 2], ["a"])
+    assert stats.blocked == 1 and stats.sent == 1
+
+
+async def test_bad_request_fails_without_retry():
+    bot = FakeBot({1: [BadRequest("Message is too long")]})
+    stats = await Broadcaster(bot.send, rate=1000, chat_interval=0).run([1], ["a", "b"])
+
+    assert stats.failed == 1 and stats.retried == 0
+    assert [item for _, item, _ in bot.attempts] == ["a", "b"]
+    assert bot.delivered == [(1, "b")]
+
+
+async def test_telegram_error_retries_with_backoff():
+    bot = FakeBot({1: [NetworkError("timeout"), NetworkError("timeout"), None]})
+    broadcaster = Broadcaster(bot.send, rate=1000, chat_interval=0, max_retries=3, backoff=0.03)
+    stats = await broadcaster.run([1], ["a"])
+
+    assert stats.sent == 1 and stats.retried == 2 and stats.failed == 0
+    first, second, third = bot.times(1)
+    assert second - first >= 0.03 - EPSILON
+    assert third - second >= 0.06 - EPSILON
+
+
+async def test_telegram_error_gives_up_after_max_retries():
+    bot = FakeBot({1: [NetworkError("timeout")] * 3})
+    broadcaster = Broadcaster(bot.send, rate=1000, chat_interval=0, max_retries=2, backoff=0.01)
+    stats = await broadcaster.run([1], ["a", "b"])
+
+    assert stats.retried == 2 and stats.failed == 1
+    # После отказа рассылка переходит к следующему сообщению
+    assert bot.delivered == [(1, "b")]
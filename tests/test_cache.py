@@ -0,0 +1,179 @@
+"""Тесты кэша с TTL и вытеснением LRU (server/cache.py)"""
+import pytest
+
+from server import cache as cache_module
+from server.cache import TTLCache, get_cache_stats
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+@pytest.fixture
+def make_cache(clock):
+    """Кэши теста с подменённым временем; из общего реестра статистики убираются"""
+    created = []
+
+    def factory(**kwargs):
+        created.append(TTLCache(**{"name": "test", "clock": clock, **kwargs}))
+        return created[-1]
+
+    yield factory
+    for item in created:
+        cache_module._caches.remove(item)
+
+
+def test_get_and_set(clock, make_cache):
+    cache = make_cache()
+    assert cache.get("a") is None
+    assert cache.get("a", "default") == "default"
+    cache.set("a", 1)
+    assert cache.get("a") == 1
+
+
+def test_none_is_cached(clock, make_cache):
+    cache = make_cache()
+    cache.set("a", None)
+    assert cache.get("a", "default") is None
+    assert cache.hits == 1
+
+
+def test_entry_expires_after_ttl(clock, make_cache):
+    cache = make_cache(ttl=10)
+    cache.set("a", 1)
+    clock.now += 9.9
+    assert cache.get("a") == 1
+    clock.now += 0.1
+    assert cache.get("a") is None
+    # Просроченная запись удалена, а не просто скрыта
+    assert cache.stats()["size"] == 0
+
+
+def test_set_refreshes_ttl(clock, make_cache):
+    cache = make_cache(ttl=10)
+    cache.set("a", 1)
+    clock.now += 8
+    cache.set("a", 2)
+    clock.now += 8
+    assert cache.get("a") == 2
+
+
+def test_lru_eviction(clock, make_cache):
+    cache = make_cache(maxsize=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    # Обращение к a делает её самой свежей - вытесняется b
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    assert cache.stats()["size"] == 2
+
+
+def test_pop_and_clear(clock, make_cache):
+    cache = make_cache()
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.pop("a")
+    cache.pop("missing")
+    assert cache.get("a") is None and cache.get("b") == 2
+    cache.clear()
+    assert cache.stats()["size"] == 0
+
+
+@pytest.mark.anyio
+async def test_get_or_load(clock, make_cache):
+    cache = make_cache(ttl=10)
+    calls = []
+
+    async def loader():
+        calls.append(clock.now)
+        return len(calls)
+
+    assert await cache.get_or_load("key", loader) == 1
+    assert await cache.get_or_load("key", loader) == 1
+    assert len(calls) == 1
+
+    clock.now += 10
+    assert await cache.get_or_load("key", loader) == 2
+    assert len(calls) == 2
+
+
+@pytest.mark.anyio
+async def test_get_or_load_caches_none(clock, make_cache):
+    cache = make_cache()
+    calls = []
+
+    async def loader():
+        calls.append(1)
+        return None
+
+    assert await cache.get_or_load("key", loader) is None
+    assert await cache.get_or_load("key", loader) is None
+    assert len(calls) == 1
+
+
+@pytest.mark.anyio
+async def test_get_or_load_does_not_cache_errors(clock, make_cache):
+    cache = make_cache()
+
+    async def failing():
+        raise RuntimeError("db is down")
+
+    with pytest.raises(RuntimeError):
+        await cache.get_or_load("key", failing)
+    assert cache.stats()["size"] == 0
+
+
+@pytest.mark.anyio
+async def test_get_or_load_started_before_clear_is_not_stored(clock, make_cache):
+    cache = make_cache()
+
+    async def stale_loader():
+        # Каталог изменился, пока шла загрузка
+        cache.clear()
+        return "stale"
+
+    async def fresh_loader():
+        return "fresh"
+
+    assert await cache.get_or_load("key", stale_loader) == "stale"
+    assert cache.get("key") is None
+    assert await cache.get_or_load("key", fresh_loader) == "fresh"
+    assert cache.get("key") == "fresh"
+
+
+@pytest.mark.anyio
+async def test_get_or_load_started_before_pop_is_not_stored(clock, make_cache):
+    cache = make_cache()
+
+    async def stale_loader():
+        cache.pop("key")
+        return "stale"
+
+    await cache.get_or_load("key", stale_loader)
+    assert cache.stats()["size"] == 0
+
+
+def test_hit_miss_counters_and_stats(clock, make_cache):
+    cache = make_cache(name="counters", maxsize=5, ttl=30)
+    cache.get("a")
+    cache.set("a", 1)
+    cache.get("a")
+    cache.get("a")
+    clock.now += 30
+    cache.get("a")
+
+    stats = cache.stats()
+    assert stats == {"name": "counters", "size": 0, "maxsize": 5, "ttl": 30, "hits": 2, "misses": 2}
+    assert stats in get_cache_stats()
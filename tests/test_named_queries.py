@@ -0,0 +1,56 @@
+"""Тесты выполнения именованных запросов (server/database/db_connection.py)"""
+import asyncpg
+import pytest
+
+from server.database.db_connection import _run_named, register_query
+
+pytestmark = pytest.mark.anyio
+
+QUERY = register_query("tests.named_query", "SELECT 1")
+
+
+class FakeStatement:
+    def __init__(self, stale):
+        self.stale = stale
+
+    async def fetch(self, *args):
+        if self.stale:
+            raise asyncpg.InvalidCachedStatementError("cached statement plan is invalid")
+        return [{"value": 1}]
+
+
+class FakeConnection:
+    """Соединение, у которого ранее подготовленный запрос устарел после смены схемы"""
+
+    def __init__(self, in_transaction):
+        self.in_transaction = in_transaction
+        self.named_statements = {QUERY: FakeStatement(stale=True)}
+        self.prepared = 0
+
+    def is_in_transaction(self):
+        return self.in_transaction
+
+    async def prepare(self, sql):
+        self.prepared += 1
+        return FakeStatement(stale=False)
+
+
+async def test_stale_statement_is_prepared_again_outside_transaction():
+    connection = FakeConnection(in_transaction=False)
+
+    assert await _run_named(connection, "fetch", QUERY, ()) == [{"value": 1}]
+    assert connection.prepared == 1
+
+
+async def test_stale_statement_in_transaction_is_not_retried():
+    connection = FakeConnection(in_transaction=True)
+
+    # Транзакция уже прервана - повтор на том же соединении невозможен
+    with pytest.raises(asyncpg.InvalidCachedStatementError):
+        await _run_named(connection, "fetch", QUERY, ())
+    assert connection.prepared == 0
+
+    # Следующее обращение (после повтора транзакции) готовит запрос заново
+    connection.in_transaction = False
+    assert await _run_named(connection, "fetch", QUERY, ()) == [{"value": 1}]
+    assert connection.prepared == 1
@@ -0,0 +1,95 @@
+"""Тесты рассылки новых товаров ботом (RukamiBot.deliver_new_products)"""
+import pytest
+
+from bot.telegram_bot import RukamiBot
+
+pytestmark = pytest.mark.anyio
+
+
+def product(product_id, user_id):
+    return {"id": product_id, "user_id": user_id, "name": f"Товар {product_id}"}
+
+
+class FakeCatalog:
+    """Новые товары после водяного знака, как их вернули бы запросы products.new_after*"""
+
+    def __init__(self, products):
+        self.products = products
+
+    def _new(self, after_id, late_ids):
+        return [item for item in self.products if item["id"] > after_id or item["id"] in late_ids]
+
+    async def sellers(self, after_id, late_ids):
+        counts = {}
+        for item in self._new(after_id, late_ids):
+            seller = counts.setdefault(item["user_id"], {"user_id": item["user_id"], "author_name": "Мастер",
+                                                         "products_count": 0, "last_id": 0})
+            seller["products_count"] += 1
+            seller["last_id"] = max(seller["last_id"], item["id"])
+        return list(counts.values())
+
+    async def products_after(self, after_id, late_ids, excluded_sellers=()):
+        return [item for item in self._new(after_id, late_ids) if item["user_id"] not in excluded_sellers]
+
+
+def make_bot(products, threshold=3):
+    bot = RukamiBot()
+    bot.broadcast_group_threshold = threshold
+    bot.last_notified_product_id = 0
+    catalog = FakeCatalog(products)
+    bot.get_new_product_sellers = catalog.sellers
+    bot.get_new_products_after = catalog.products_after
+    bot.broadcasts = []
+    bot.saved_watermarks = []
+
+    async def broadcast(items):
+        bot.broadcasts.append(items)
+
+    async def save_watermark(product_id, conn=None):
+        bot.saved_watermarks.append(product_id)
+
+    bot.broadcast_new_products = broadcast
+    bot.save_notification_watermark = save_watermark
+    return bot
+
+
+async def test_bulk_import_is_broadcast_as_one_summary():
+    imported = [product(product_id, user_id=7) for product_id in range(1, 10001)]
+    single = [product(10001, user_id=8)]
+    bot = make_bot(imported + single)
+
+    await bot.deliver_new_products()
+
+    [items] = bot.broadcasts
+    assert items[0] == single[0]
+    assert items[1]["user_id"] == 7 and items[1]["products_count"] == 10000
+    assert len(items) == 2
+    assert bot.saved_watermarks == [10001]
+
+
+async def test_few_products_are_broadcast_one_by_one():
+    bot = make_bot([product(1, 7), product(2, 7), product(3, 8)], threshold=3)
+
+    await bot.deliver_new_products()
+
+    assert [item["id"] for item in bot.broadcasts[0]] == [1, 2, 3]
+    assert bot.last_notified_product_id == 3
+
+
+async def test_summary_item_goes_to_summary_sender():
+    bot = RukamiBot()
+    sent = []
+
+    async def summary(telegram_id, seller):
+        sent.append(("summary", telegram_id))
+
+    async def single(telegram_id, item):
+        sent.append(("product", telegram_id))
+
+    bot.send_new_products_summary = summary
+    bot.send_new_product_notification = single
+
+    await bot.send_broadcast_item(1, {"user_id": 7, "products_count": 20, "last_id": 5})
+    await bot.send_broadcast_item(2, product(5, 7))
+
+    assert sent == [("summary", 1), ("product", 2)]
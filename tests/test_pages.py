@@ -0,0 +1,140 @@
+"""Тесты отдачи HTML-страниц (server/pages.py)"""
+import gzip
+import os
+
+import pytest
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+
+from server import pages
+from server.pages import PageStore, etag_matches, parse_accept_encoding
+
+CONTENT = ("<html><body>" + "Изделия ручной работы. " * 200 + "</body></html>").encode("utf-8")
+
+needs_brotli = pytest.mark.skipif(pages.brotli is None, reason="brotli не установлен")
+
+
+@pytest.fixture
+def store(tmp_path):
+    (tmp_path / "index.html").write_bytes(CONTENT)
+    page_store = PageStore(str(tmp_path), cache_control="no-cache")
+    page_store.load_all(["index.html"])
+    return page_store
+
+
+@pytest.fixture
+def client(store):
+    app = FastAPI()
+
+    @app.get("/")
+    async def index(request: Request):
+        return store.response(request, "index.html")
+
+    @app.get("/missing")
+    async def missing(request: Request):
+        return store.response(request, "missing.html")
+
+    return TestClient(app)
+
+
+def get(client, accept_encoding, **headers):
+    return client.get("/", headers={"Accept-Encoding": accept_encoding, **headers})
+
+
+def test_etag_is_strong_and_distinct_per_variant(store):
+    etags = store.pages["index.html"].etags
+    assert len(set(etags.values())) == len(etags)
+    for etag in etags.values():
+        assert etag.startswith('"') and etag.endswith('"') and not etag.startswith("W/")
+
+
+def test_gzip_variant_is_deterministic(tmp_path, store):
+    again = PageStore(str(tmp_path))
+    again.load("index.html")
+    assert again.pages["index.html"].variants["gzip"] == store.pages["index.html"].variants["gzip"]
+    assert gzip.decompress(store.pages["index.html"].variants["gzip"]) == CONTENT
+
+
+@needs_brotli
+def test_brotli_preferred(client, store):
+    response = get(client, "gzip, br")
+    assert response.status_code == 200
+    assert response.headers["content-encoding"] == "br"
+    assert response.headers["etag"] == store.pages["index.html"].etags["br"]
+    assert response.content == CONTENT
+
+
+def test_gzip_when_brotli_not_accepted(client, store):
+    response = get(client, "gzip, br;q=0")
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers["etag"] == store.pages["index.html"].etags["gzip"]
+    assert response.content == CONTENT
+
+
+def test_identity_without_accepted_encoding(client, store):
+    for header in ("identity", "deflate", "gzip;q=0"):
+        response = get(client, header)
+        assert "content-encoding" not in response.headers
+        assert response.headers["etag"] == store.pages["index.html"].etags["identity"]
+        assert response.content == CONTENT
+        assert response.headers["content-type"] == "text/html; charset=utf-8"
+
+
+def test_cache_headers(client):
+    response = get(client, "gzip")
+    assert response.headers["vary"] == "Accept-Encoding"
+    assert response.headers["cache-control"] == "no-cache"
+
+
+def test_not_modified_for_matching_etag(client):
+    etag = get(client, "gzip").headers["etag"]
+    response = get(client, "gzip", **{"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.content == b""
+    assert response.headers["etag"] == etag
+    assert response.headers["vary"] == "Accept-Encoding"
+    assert response.headers["cache-control"] == "no-cache"
+
+
+def test_etag_of_other_variant_does_not_match(client):
+    gzip_etag = get(client, "gzip").headers["etag"]
+    response = get(client, "identity", **{"If-None-Match": gzip_etag})
+    assert response.status_code == 200
+    assert response.content == CONTENT
+
+
+def test_weak_list_and_wildcard_if_none_match(client):
+    etag = get(client, "gzip").headers["etag"]
+    assert get(client, "gzip", **{"If-None-Match": f'"other", W/{etag}'}).status_code == 304
+    assert get(client, "gzip", **{"If-None-Match": "*"}).status_code == 304
+    assert get(client, "gzip", **{"If-None-Match": '"other"'}).status_code == 200
+
+
+def test_missing_page(client):
+    assert client.get("/missing").status_code == 404
+
+
+def test_reload_picks_up_changed_file(tmp_path):
+    page_file = tmp_path / "index.html"
+    page_file.write_bytes(b"old")
+    page_store = PageStore(str(tmp_path), reload=True)
+    old_etag = page_store.get("index.html").etags["identity"]
+
+    page_file.write_bytes(b"new")
+    mtime = page_store.pages["index.html"].mtime + 10
+    os.utime(page_file, (mtime, mtime))
+    page = page_store.get("index.html")
+    assert page.variants["identity"] == b"new"
+    assert page.etags["identity"] != old_etag
+
+
+def test_parse_accept_encoding():
+    assert parse_accept_encoding("gzip, br;q=0.5, *;q=0, bad;q=x") == {
+        "gzip": 1.0, "br": 0.5, "*": 0.0, "bad": 0.0
+    }
+    assert parse_accept_encoding("") == {}
+
+
+def test_etag_matches():
+    assert etag_matches('"a", "b"', '"b"')
+    assert not etag_matches('"a"', '"b"')
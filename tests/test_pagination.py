@@ -0,0 +1,67 @@
+"""Тесты курсорной пагинации и проверки параметров списка товаров"""
+import base64
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from fastapi import FastAPI, HTTPException
+from fastapi.testclient import TestClient
+
+from server.api.api_implementation import decode_cursor, encode_cursor, router
+
+
+def raw_cursor(text: str) -> str:
+    return base64.urlsafe_b64encode(text.encode()).decode().rstrip("=")
+
+
+@pytest.fixture
+def client():
+    app = FastAPI()
+    app.include_router(router)
+    return TestClient(app)
+
+
+@pytest.mark.parametrize("created_at", [
+    datetime(2025, 1, 2, 3, 4, 5, 678901, tzinfo=timezone.utc),
+    datetime(2025, 6, 30, 23, 59, 59, tzinfo=timezone(timedelta(hours=3))),
+])
+def test_cursor_round_trip(created_at):
+    cursor = encode_cursor(created_at, 12345)
+    assert "=" not in cursor
+    assert decode_cursor(cursor) == (created_at, 12345)
+
+
+def test_cursor_is_url_safe():
+    cursor = encode_cursor(datetime(2025, 1, 1, tzinfo=timezone.utc), 2 ** 40)
+    assert all(char.isalnum() or char in "-_" for char in cursor)
+
+
+@pytest.mark.parametrize("cursor", [
+    "не-base64",
+    "!!!!",
+    raw_cursor("2025-01-01T00:00:00+00:00"),
+    raw_cursor("2025-01-01T00:00:00+00:00|1|2"),
+    raw_cursor("2025-01-01T00:00:00+00:00|abc"),
+    raw_cursor("not-a-date|1"),
+    raw_cursor("2025-01-01T00:00:00|1"),
+    base64.urlsafe_b64encode(b"\xff\xfe|1").decode(),
+])
+def test_tampered_cursor_is_rejected(cursor):
+    with pytest.raises(HTTPException) as error:
+        decode_cursor(cursor)
+    assert error.value.status_code == 400
+
+
+@pytest.mark.parametrize("limit", [0, -5, 101])
+def test_products_limit_is_validated(client, limit):
+    response = client.get("/api/products", params={"limit": limit})
+    assert response.status_code == 422
+
+
+def test_products_negative_offset_is_rejected(client):
+    assert client.get("/api/products", params={"offset": -1}).status_code == 422
+
+
+def test_products_tampered_cursor_returns_400(client):
+    response = client.get("/api/products", params={"cursor": raw_cursor("garbage")})
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Некорректный курсор пагинации"
@@ -0,0 +1,98 @@
+"""Тесты хэширования паролей (server/passwords.py)"""
+import asyncio
+import hashlib
+import time
+
+import pytest
+
+from server import passwords
+from server.config import settings
+from server.passwords import (
+    PasswordHasherBusy, hash_password, needs_rehash, verify_and_update, verify_password
+)
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture(autouse=True)
+def cheap_scrypt(monkeypatch):
+    """Низкая стоимость scrypt и свежий семафор на цикл событий каждого теста"""
+    monkeypatch.setattr(settings, "password_scrypt_n", 2 ** 4)
+    monkeypatch.setattr(settings, "password_scrypt_r", 8)
+    monkeypatch.setattr(settings, "password_scrypt_p", 1)
+    monkeypatch.setattr(passwords, "_semaphore", None)
+
+
+async def test_hash_format_round_trip():
+    stored = await hash_password("секрет-123")
+    scheme, n, r, p, salt, digest = stored.split("$")
+    assert (scheme, n, r, p) == ("scrypt", "16", "8", "1")
+    assert len(passwords._b64decode(salt)) == 16
+    assert len(passwords._b64decode(digest)) == 32
+
+    assert await verify_password("секрет-123", stored)
+    assert not await verify_password("секрет-124", stored)
+    assert not needs_rehash(stored)
+
+
+async def test_salt_differs_between_hashes():
+    first = await hash_password("same")
+    second = await hash_password("same")
+    assert first != second
+    assert await verify_password("same", first) and await verify_password("same", second)
+
+
+async def test_legacy_sha256_detected_and_verified():
+    legacy = hashlib.sha256(b"old-password").hexdigest()
+    assert passwords._is_legacy(legacy)
+    assert needs_rehash(legacy)
+    assert await verify_password("old-password", legacy)
+    assert not await verify_password("wrong", legacy)
+
+
+async def test_unknown_or_empty_hash_is_rejected():
+    assert not await verify_password("x", "")
+    assert not await verify_password("x", "bcrypt$whatever")
+    assert not await verify_password("x", "scrypt$16$8$1$not-base64!$???")
+    assert not needs_rehash("bcrypt$whatever")
+
+
+async def test_verify_and_update_rehashes_legacy():
+    legacy = hashlib.sha256(b"old-password").hexdigest()
+    ok, new_hash = await verify_and_update("old-password", legacy)
+    assert ok
+    assert new_hash.startswith("scrypt$16$8$1$")
+    assert await verify_password("old-password", new_hash)
+
+
+async def test_verify_and_update_rehashes_on_cost_change(monkeypatch):
+    stored = await hash_password("pw")
+    monkeypatch.setattr(settings, "password_scrypt_n", 2 ** 5)
+    assert needs_rehash(stored)
+    ok, new_hash = await verify_and_update("pw", stored)
+    assert ok and new_hash.startswith("scrypt$32$")
+
+
+async def test_verify_and_update_keeps_current_hash():
+    stored = await hash_password("pw")
+    assert await verify_and_update("pw", stored) == (True, None)
+    assert await verify_and_update("wrong", stored) == (False, None)
+    legacy = hashlib.sha256(b"pw").hexdigest()
+    assert await verify_and_update("wrong", legacy) == (False, None)
+
+
+async def test_queue_timeout_raises_busy(monkeypatch):
+    monkeypatch.setattr(settings, "password_hash_concurrency", 1)
+    monkeypatch.setattr(settings, "password_hash_queue_timeout", 0.05)
+    rejected = passwords._stats["rejected"]
+
+    # Единственный слот занят долгим вычислением - следующий запрос не дожидается очереди
+    blocker = asyncio.ensure_future(passwords._run(time.sleep, 0.5))
+    await asyncio.sleep(0.01)
+    with pytest.raises(PasswordHasherBusy):
+        await hash_password("pw")
+    assert passwords._stats["rejected"] == rejected + 1
+
+    await blocker
+    # После освобождения слота хэширование снова проходит
+    assert (await hash_password("pw")).startswith("scrypt$")
@@ -0,0 +1,130 @@
+"""Тесты кэша file_id фотографий (bot/photo_cache.py)"""
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from telegram.error import BadRequest
+
+from bot.photo_cache import PhotoCache
+
+pytestmark = pytest.mark.anyio
+
+
+class FakeConnection:
+    """Таблица telegram_photo_cache в словаре: product_id -> (image_url, file_id)"""
+
+    def __init__(self, rows):
+        self.rows = rows
+
+    async def fetchval(self, query, product_id, image_url):
+        row = self.rows.get(product_id)
+        return row[1] if row and row[0] == image_url else None
+
+    async def execute(self, query, *args):
+        if query.lstrip().startswith("DELETE"):
+            self.rows.pop(args[0], None)
+        else:
+            product_id, image_url, file_id = args
+            self.rows[product_id] = (image_url, file_id)
+
+
+class FakePool:
+    def __init__(self):
+        self.rows = {}
+
+    def acquire(self):
+        pool = self
+
+        class Acquire:
+            async def __aenter__(self):
+                return FakeConnection(pool.rows)
+
+            async def __aexit__(self, *exc):
+                return False
+
+        return Acquire()
+
+
+def photo_message(file_id):
+    return SimpleNamespace(photo=[SimpleNamespace(file_id="small"), SimpleNamespace(file_id=file_id)])
+
+
+class FakeSender:
+    """send_photo: загрузка по URL возвращает новый file_id; ошибки задаются заранее"""
+
+    def __init__(self, errors=None, delay=0.0):
+        self.calls = []
+        self.errors = list(errors or [])
+        self.delay = delay
+
+    async def __call__(self, photo, **kwargs):
+        self.calls.append(photo)
+        await asyncio.sleep(self.delay)
+        if self.errors:
+            raise self.errors.pop(0)
+        return photo_message(photo if not photo.startswith("http") else f"id-{len(self.calls)}")
+
+
+@pytest.fixture
+def cache():
+    photo_cache = PhotoCache()
+    photo_cache.db_pool = FakePool()
+    return photo_cache
+
+
+async def test_upload_then_reuse_file_id(cache):
+    send = FakeSender()
+    await cache.send_photo(send, 1, "http://img/1.jpg", caption="x")
+    await cache.send_photo(send, 1, "http://img/1.jpg", caption="x")
+    assert send.calls == ["http://img/1.jpg", "id-1"]
+    assert cache.uploads == 1 and cache.hits == 1
+    assert cache.db_pool.rows[1] == ("http://img/1.jpg", "id-1")
+
+
+async def test_concurrent_sends_upload_once_and_release_lock(cache):
+    send = FakeSender(delay=0.02)
+    await asyncio.gather(*(cache.send_photo(send, 1, "http://img/1.jpg") for _ in range(5)))
+    assert cache.uploads == 1
+    assert send.calls.count("http://img/1.jpg") == 1
+    # Блокировка удаляется, когда загрузку никто не ждёт
+    assert cache._locks == {}
+
+
+async def test_lock_released_after_failed_upload(cache):
+    send = FakeSender(errors=[BadRequest("Wrong type of the web page content")])
+    with pytest.raises(BadRequest):
+        await cache.send_photo(send, 1, "http://img/1.jpg")
+    assert cache._locks == {}
+
+
+async def test_locks_do_not_accumulate(cache):
+    send = FakeSender()
+    for product_id in range(50):
+        await cache.send_photo(send, product_id, f"http://img/{product_id}.jpg")
+    assert cache._locks == {}
+
+
+async def test_rejected_file_id_is_reuploaded(cache):
+    await cache.store(1, "http://img/1.jpg", "stale")
+    send = FakeSender(errors=[BadRequest("Wrong file identifier/HTTP URL specified")])
+    await cache.send_photo(send, 1, "http://img/1.jpg")
+    assert send.calls == ["stale", "http://img/1.jpg"]
+    assert cache.db_pool.rows[1] == ("http://img/1.jpg", "id-2")
+
+
+async def test_other_bad_request_keeps_file_id(cache):
+    await cache.store(1, "http://img/1.jpg", "good")
+    send = FakeSender(errors=[BadRequest("Can't parse entities: can't find end of the entity")])
+    with pytest.raises(BadRequest):
+        await cache.send_photo(send, 1, "http://img/1.jpg", parse_mode="Markdown")
+    assert send.calls == ["good"]
+    assert cache.db_pool.rows[1] == ("http://img/1.jpg", "good")
+    assert await cache.get(1, "http://img/1.jpg") == "good"
+
+
+async def test_changed_image_url_is_a_miss(cache):
+    await cache.store(1, "http://img/old.jpg", "old-id")
+    send = FakeSender()
+    await cache.send_photo(send, 1, "http://img/new.jpg")
+    assert send.calls == ["http://img/new.jpg"]
+    assert cache.db_pool.rows[1] == ("http://img/new.jpg", "id-1")
@@ -0,0 +1,172 @@
+"""Тесты разбора файлов импорта товаров (server/product_import.py)"""
+from decimal import Decimal
+
+import pytest
+
+from server.database.db_connection import NEW_PRODUCTS_CHANNEL, SKIP_PRODUCT_NOTIFY_SETTING
+from server.product_import import (
+    IMPORT_COLUMNS, ImportLimitExceeded, detect_format, import_products, iter_csv_rows, iter_lines,
+    iter_ndjson_rows, validate_row
+)
+
+pytestmark = pytest.mark.anyio
+
+USER_ID = 7
+CATEGORY_IDS = {1, 2}
+
+
+async def stream(*chunks: bytes):
+    for chunk in chunks:
+        yield chunk
+
+
+def split_bytes(data: bytes, size: int):
+    """Тело запроса кусками фиксированного размера (в том числе посреди символа UTF-8)"""
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+async def collect(iterator):
+    return [item async for item in iterator]
+
+
+class FakeConnection:
+    """Соединение, запоминающее пачки COPY и остальные запросы по порядку"""
+
+    def __init__(self):
+        self.batches = []
+        self.log = []
+
+    async def copy_records_to_table(self, table, records, columns):
+        assert table == "products"
+        assert columns == IMPORT_COLUMNS
+        self.batches.append(list(records))
+        self.log.append("copy")
+
+    async def execute(self, query, *args):
+        self.log.append((query, args))
+
+
+async def run_import(data: bytes, file_format: str, chunk_size: int = 7, **kwargs):
+    connection = FakeConnection()
+    result = await import_products(connection, stream(*split_bytes(data, chunk_size)), file_format,
+                                   USER_ID, CATEGORY_IDS, **kwargs)
+    return result, connection
+
+
+def test_detect_format():
+    assert detect_format("text/csv; charset=utf-8") == "csv"
+    assert detect_format("Application/X-NDJSON") == "ndjson"
+    assert detect_format("application/json") is None
+    assert detect_format(None) is None
+
+
+async def test_iter_lines_reassembles_chunks_and_drops_bom():
+    data = "\ufeffпервая\nвторая\nбез перевода".encode("utf-8")
+    lines = await collect(iter_lines(stream(*split_bytes(data, 3))))
+    assert lines == ["первая\n", "вторая\n", "без перевода"]
+
+
+async def test_iter_lines_without_trailing_text():
+    lines = await collect(iter_lines(stream(b"a\n", b"b\n")))
+    assert lines == ["a\n", "b\n"]
+
+
+async def test_csv_quoted_field_spans_lines():
+    data = 'name,description\nВаза,"строка 1\nстрока ""2"""\nЧашка,просто\n'.encode("utf-8")
+    rows = await collect(iter_csv_rows(iter_lines(stream(*split_bytes(data, 5)))))
+    assert rows == [
+        (1, {"name": "Ваза", "description": 'строка 1\nстрока "2"'}),
+        (2, {"name": "Чашка", "description": "просто"}),
+    ]
+
+
+async def test_csv_reports_column_mismatch_and_unclosed_quote():
+    data = b'name,description\nonly-one\nok,fine\nbad,"never closed\n'
+    rows = await collect(iter_csv_rows(iter_lines(stream(data))))
+    assert rows[0] == (1, "Ожидалось колонок: 2, получено: 1")
+    assert rows[1] == (2, {"name": "ok", "description": "fine"})
+    assert rows[2] == (3, "Незакрытая кавычка в конце файла")
+
+
+async def test_csv_header_is_normalized_and_blank_lines_skipped():
+    data = b' Name , PRICE \n\nx,1\n'
+    rows = await collect(iter_csv_rows(iter_lines(stream(data))))
+    assert rows == [(1, {"name": "x", "price": "1"})]
+
+
+async def test_ndjson_rows_and_errors():
+    data = b'{"name": "a"}\n\n[1, 2]\n{broken\n{"name": "b"}'
+    rows = await collect(iter_ndjson_rows(iter_lines(stream(data))))
+    assert rows[0] == (1, {"name": "a"})
+    assert rows[1] == (2, "Строка должна быть JSON-объектом")
+    assert rows[2][0] == 3 and rows[2][1].startswith("Некорректный JSON")
+    assert rows[3] == (4, {"name": "b"})
+
+
+def test_validate_row_builds_copy_record():
+    record = validate_row({"name": "Ваза", "description": "Глина", "price": "1500.50", "category_id": "2",
+                           "image_url": "", "in_stock": "false", "unknown": "x"}, USER_ID, CATEGORY_IDS)
+    assert record == ("Ваза", "Глина", Decimal("1500.50"), 2, USER_ID, None, False)
+
+
+@pytest.mark.parametrize("data, message", [
+    ({"description": "d", "price": "1", "category_id": "1"}, "name"),
+    ({"name": "a", "description": "d", "price": "-1", "category_id": "1"}, "price"),
+    ({"name": "a", "description": "d", "price": "1.999", "category_id": "1"}, "price"),
+    ({"name": "a", "description": "d", "price": "1", "category_id": "x"}, "category_id"),
+    ({"name": "a", "description": "d", "price": "1", "category_id": "9"}, "Категория 9 не найдена"),
+])
+def test_validate_row_errors(data, message):
+    with pytest.raises(ValueError) as error:
+        validate_row(data, USER_ID, CATEGORY_IDS)
+    assert message in str(error.value)
+
+
+async def test_import_csv_skips_bad_rows():
+    data = ("name,description,price,category_id\n"
+            "Ваза,\"Ручная\nработа\",100,1\n"
+            ",пусто,5,1\n"
+            "Чашка,Фарфор,20.5,2\n").encode("utf-8")
+    result, connection = await run_import(data, "csv", batch_size=1)
+    assert result["total_rows"] == 3
+    assert result["imported"] == 2
+    assert result["failed"] == 1
+    assert result["errors"][0]["row"] == 2 and "name" in result["errors"][0]["error"]
+    assert result["errors_truncated"] is False
+    assert [batch[0][0] for batch in connection.batches] == ["Ваза", "Чашка"]
+    assert connection.batches[0][0][1] == "Ручная\nработа"
+
+
+async def test_import_ndjson_batches_and_error_limit():
+    lines = [b'{"name": "p%d", "description": "d", "price": 1, "category_id": 1}' % i for i in range(5)]
+    lines += [b'not json', b'{"name": "x", "description": "d", "price": 1, "category_id": 5}']
+    result, connection = await run_import(b"\n".join(lines), "ndjson", batch_size=2, max_errors=1)
+    assert result["imported"] == 5
+    assert [len(batch) for batch in connection.batches] == [2, 2, 1]
+    assert result["failed"] == 2
+    assert result["errors"] == [{"row": 6, "error": result["errors"][0]["error"]}]
+    assert result["errors_truncated"] is True
+
+
+async def test_import_row_limit():
+    data = b"name,description,price,category_id\n" + b"a,b,1,1\n" * 4
+    with pytest.raises(ImportLimitExceeded):
+        await run_import(data, "csv", max_rows=3)
+
+
+async def test_import_sends_one_notification_instead_of_one_per_row():
+    data = b"name,description,price,category_id\n" + b"a,b,1,1\n" * 5
+    result, connection = await run_import(data, "csv", batch_size=2)
+    assert result["imported"] == 5
+
+    setting, *copies, notify = connection.log
+    # Флаг для триггера products_notify_new выставлен до первой пачки COPY
+    assert "set_config" in setting[0] and setting[1] == (SKIP_PRODUCT_NOTIFY_SETTING,)
+    assert copies == ["copy"] * 3
+    assert "pg_notify" in notify[0] and notify[1] == (NEW_PRODUCTS_CHANNEL,)
+
+
+async def test_import_without_rows_sends_no_notification():
+    result, connection = await run_import(b"name,description,price,category_id\n,,,\n", "csv")
+    assert result["imported"] == 0
+    assert not [entry for entry in connection.log if "pg_notify" in entry[0]]
@@ -0,0 +1,38 @@
+"""Тесты статистики профиля (/api/profile/statistics)"""
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from server.api import api_implementation
+from server.api.api_implementation import get_current_user, router
+
+
+@pytest.fixture
+def client():
+    app = FastAPI()
+    app.include_router(router)
+    app.dependency_overrides[get_current_user] = lambda: {"id": 1}
+    return TestClient(app, raise_server_exceptions=False)
+
+
+def test_missing_seller_stats_gives_zeros(client, monkeypatch):
+    async def fetch_one(query, *args):
+        return None
+
+    monkeypatch.setattr(api_implementation, "fetch_one", fetch_one)
+
+    response = client.get("/api/profile/statistics")
+    assert response.status_code == 200
+    assert response.json() == {"products_count": 0, "active_products_count": 0,
+                               "orders_count": 0, "favorites_count": 0}
+
+
+def test_database_error_is_not_reported_as_zeros(client, monkeypatch):
+    async def fetch_one(query, *args):
+        raise ConnectionError("pool closed")
+
+    monkeypatch.setattr(api_implementation, "fetch_one", fetch_one)
+
+    response = client.get("/api/profile/statistics")
+    assert response.status_code == 500
+    assert response.json() == {"detail": "Ошибка получения статистики"}
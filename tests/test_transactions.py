@@ -0,0 +1,90 @@
+"""Тесты порядка фиксации транзакции запроса и отправки ответа"""
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from server.api import api_implementation
+from server.api.api_implementation import get_current_user, router
+from server.database import db_connection
+
+
+class FakeTransaction:
+    def __init__(self, events):
+        self.events = events
+
+    async def __aenter__(self):
+        self.events.append("begin")
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.events.append("rollback" if exc_type else "commit")
+        return False
+
+
+class FakeConnection:
+    """Соединение с одним товаром id=1 пользователя id=1"""
+
+    def __init__(self, events):
+        self.events = events
+
+    def transaction(self):
+        return FakeTransaction(self.events)
+
+    async def fetchrow(self, query, *args):
+        return {"id": 1, "user_id": 1} if args[0] == 1 else None
+
+    async def execute(self, query, *args):
+        self.events.append("update")
+        return "UPDATE 1"
+
+
+class FakePool:
+    def __init__(self, events):
+        self.events = events
+
+    def acquire(self):
+        pool = self
+
+        class Acquire:
+            async def __aenter__(self):
+                return FakeConnection(pool.events)
+
+            async def __aexit__(self, *exc):
+                pool.events.append("release")
+                return False
+
+        return Acquire()
+
+
+@pytest.fixture
+def events(monkeypatch):
+    recorded = []
+    monkeypatch.setattr(db_connection, "db_pool", FakePool(recorded))
+    monkeypatch.setattr(api_implementation, "invalidate_catalog_cache", lambda: recorded.append("invalidate"))
+    return recorded
+
+
+@pytest.fixture
+def client(events):
+    app = FastAPI()
+    app.include_router(router)
+    app.dependency_overrides[get_current_user] = lambda: {"id": 1}
+
+    @app.middleware("http")
+    async def record_response(request, call_next):
+        response = await call_next(request)
+        events.append("response")
+        return response
+
+    return TestClient(app)
+
+
+def test_commit_and_invalidation_happen_before_response(client, events):
+    response = client.delete("/api/products/1")
+    assert response.status_code == 200
+    assert events == ["begin", "update", "commit", "invalidate", "release", "response"]
+
+
+def test_rollback_skips_invalidation(client, events):
+    response = client.delete("/api/products/2")
+    assert response.status_code == 404
+    assert events == ["begin", "rollback", "release", "response"]
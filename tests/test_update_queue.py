@@ -0,0 +1,185 @@
+"""Тесты очереди обновлений вебхука (bot/update_queue.py)"""
+import asyncio
+import json
+
+import pytest
+
+from bot.update_queue import PARTITION_LOCK_CLASS, UpdateQueue, fair_share, partition_for, update_chat_id
+
+pytestmark = pytest.mark.anyio
+
+
+class FakeConnection:
+    """Таблица bot_updates в словаре: update_id -> (partition, data)"""
+
+    def __init__(self, rows):
+        self.rows = rows
+
+    async def fetch(self, query, partitions, limit):
+        selected = sorted(
+            (update_id, partition, data)
+            for update_id, (partition, data) in self.rows.items()
+            if partition in partitions
+        )
+        return [
+            {"update_id": update_id, "partition": partition, "data": data}
+            for update_id, partition, data in selected[:limit]
+        ]
+
+    async def execute(self, query, update_id):
+        assert query.startswith("DELETE")
+        self.rows.pop(update_id, None)
+
+
+class FakePool:
+    def __init__(self):
+        self.rows = {}
+
+    def acquire(self):
+        pool = self
+
+        class Acquire:
+            async def __aenter__(self):
+                return FakeConnection(pool.rows)
+
+            async def __aexit__(self, *exc):
+                return False
+
+        return Acquire()
+
+
+class FakeListenerConnection:
+    """Соединение-подписчик: число воркеров и занятые чужими воркерами разделы"""
+
+    def __init__(self, workers, taken=()):
+        self.workers = workers
+        self.taken = set(taken)
+        self.unlocked = []
+
+    async def fetchval(self, query, *args):
+        if "pg_stat_activity" in query:
+            return self.workers
+        lock_class, partition = args
+        assert lock_class == PARTITION_LOCK_CLASS
+        if "pg_advisory_unlock" in query:
+            self.unlocked.append(partition)
+            return True
+        return partition not in self.taken
+
+
+def message_update(update_id, chat_id, text="hi"):
+    return {
+        "update_id": update_id,
+        "message": {"message_id": update_id, "chat": {"id": chat_id}, "from": {"id": chat_id}, "text": text},
+    }
+
+
+def make_queue(partitions, updates, owned):
+    pool = FakePool()
+    queue = UpdateQueue(pool, partitions)
+    for data in updates:
+        chat_id = update_chat_id(data)
+        pool.rows[data["update_id"]] = (partition_for(chat_id, partitions), json.dumps(data))
+    queue.owned = set(owned)
+    return queue, pool
+
+
+def test_update_chat_id_by_chat_user_or_update():
+    assert update_chat_id(message_update(1, -100500)) == -100500
+    callback = {"update_id": 2, "callback_query": {"id": "x", "from": {"id": 7}, "message": {"chat": {"id": 42}}}}
+    assert update_chat_id(callback) == 42
+    inline = {"update_id": 3, "inline_query": {"id": "q", "from": {"id": 9}, "query": ""}}
+    assert update_chat_id(inline) == 9
+    assert update_chat_id({"update_id": 4, "poll": {"id": "p"}}) == 4
+
+
+def test_partition_for_negative_chat():
+    assert partition_for(-100500, 32) == partition_for(100500, 32)
+    assert 0 <= partition_for(-7, 4) < 4
+
+
+def test_fair_share_leaves_no_orphans():
+    assert fair_share(32, 1) == 32
+    assert fair_share(32, 3) == 11
+    assert fair_share(32, 0) == 32
+    assert fair_share(4, 8) == 1
+
+
+async def test_drain_keeps_chat_order_and_acks_after_processing():
+    updates = [message_update(i, chat_id) for i, chat_id in enumerate([1, 2, 1, 2, 1], start=10)]
+    queue, pool = make_queue(4, updates, owned=range(4))
+    seen = []
+
+    async def process(data):
+        # Обновление ещё в таблице, пока обрабатывается
+        assert data["update_id"] in pool.rows
+        seen.append((data["message"]["chat"]["id"], data["update_id"]))
+        await asyncio.sleep(0)
+
+    assert await queue.drain(process) == 5
+    assert pool.rows == {}
+    assert [update_id for chat_id, update_id in seen if chat_id == 1] == [10, 12, 14]
+    assert [update_id for chat_id, update_id in seen if chat_id == 2] == [11, 13]
+
+
+async def test_drain_skips_partitions_of_other_workers():
+    queue, pool = make_queue(4, [message_update(1, 1), message_update(2, 2)], owned={1})
+    seen = []
+
+    async def process(data):
+        seen.append(data["update_id"])
+
+    assert await queue.drain(process) == 1
+    assert seen == [1]
+    assert list(pool.rows) == [2]
+
+
+async def test_cancelled_processing_keeps_update():
+    queue, pool = make_queue(4, [message_update(1, 1), message_update(2, 1)], owned={1})
+    started = asyncio.Event()
+
+    async def process(data):
+        started.set()
+        await asyncio.sleep(10)
+
+    task = asyncio.create_task(queue.drain(process))
+    await started.wait()
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+    assert sorted(pool.rows) == [1, 2]
+
+
+async def test_handler_error_does_not_block_queue():
+    queue, pool = make_queue(4, [message_update(1, 1), message_update(2, 1)], owned={1})
+    seen = []
+
+    async def process(data):
+        seen.append(data["update_id"])
+        if data["update_id"] == 1:
+            raise ValueError("boom")
+
+    assert await queue.drain(process) == 2
+    assert seen == [1, 2]
+    assert pool.rows == {}
+
+
+async def test_rebalance_takes_free_partitions_up_to_share():
+    queue = UpdateQueue(FakePool(), 8)
+    conn = FakeListenerConnection(workers=2, taken={0, 1})
+
+    await queue.rebalance(conn)
+
+    assert queue.owned == {2, 3, 4, 5}
+    assert queue.wakeup.is_set()
+
+
+async def test_rebalance_releases_extra_partitions_when_workers_join():
+    queue = UpdateQueue(FakePool(), 8)
+    queue.owned = set(range(8))
+    conn = FakeListenerConnection(workers=4, taken=set())
+
+    await queue.rebalance(conn)
+
+    assert len(queue.owned) == 2
+    assert sorted(conn.unlocked) == [2, 3, 4, 5, 6, 7]